@@ -0,0 +1,141 @@
+import hashlib
+import os
+import secrets
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+from typing import NamedTuple, Optional
+from uuid import UUID
+
+from sqlalchemy import bindparam, update
+
+from database import SessionLocal
+from models import DeviceToken
+
+TOKEN_TTL_DAYS = int(os.getenv("TOKEN_TTL_DAYS", "30"))
+# validated tokens kept in memory, and for how long before the table is asked again
+TOKEN_CACHE_SIZE = int(os.getenv("TOKEN_CACHE_SIZE", "10000"))
+TOKEN_CACHE_SECONDS = float(os.getenv("TOKEN_CACHE_SECONDS", "60"))
+# how often buffered last_used times are written back
+LAST_USED_FLUSH_SECONDS = float(os.getenv("LAST_USED_FLUSH_SECONDS", "30"))
+
+
+class CurrentUser(NamedTuple):
+    """What a validated bearer token says about its caller."""
+    id: UUID
+    role: str
+    status: str
+    token_id: UUID
+    device_id: str
+
+
+def utcnow() -> datetime:
+    # device_tokens stores naive UTC datetimes
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+def new_token() -> str:
+    return secrets.token_urlsafe(32)
+
+
+def hash_token(token: str) -> str:
+    """Only the digest is stored, so a leaked table does not leak sessions."""
+    return hashlib.sha256(token.encode()).hexdigest()
+
+
+def token_expiry() -> datetime:
+    return utcnow() + timedelta(days=TOKEN_TTL_DAYS)
+
+
+class TokenCache:
+    """
+    LRU of validated tokens with a per-entry deadline.
+
+    An entry lives until the cache TTL runs out or the token itself expires,
+    whichever comes first. Revocations on this worker drop entries right
+    away; other workers notice after at most TOKEN_CACHE_SECONDS.
+    """
+
+    def __init__(self, max_size: int, ttl: float):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries: "OrderedDict[str, tuple[float, CurrentUser]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[CurrentUser]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            deadline, user = entry
+            if deadline <= time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return user
+
+    def put(self, key: str, user: CurrentUser, expires_at: datetime) -> None:
+        remaining = (expires_at - utcnow()).total_seconds()
+        deadline = time.monotonic() + min(self.ttl, remaining)
+        with self._lock:
+            self._entries[key] = (deadline, user)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, key: str) -> None:
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def invalidate_user(self, user_id: UUID, device_id: Optional[str] = None) -> None:
+        """Drop every cached token of a user, or only the one for `device_id`."""
+        with self._lock:
+            stale = [
+                key for key, (_, user) in self._entries.items()
+                if user.id == user_id and device_id in (None, user.device_id)
+            ]
+            for key in stale:
+                del self._entries[key]
+
+
+class LastUsedRecorder:
+    """
+    Buffers token use so last_used costs one batched UPDATE per interval
+    instead of a write on every authenticated request.
+    """
+
+    def __init__(self):
+        self._pending: dict[UUID, datetime] = {}
+        self._lock = threading.Lock()
+
+    def touch(self, token_id: UUID) -> None:
+        with self._lock:
+            self._pending[token_id] = utcnow()
+
+    def flush(self) -> int:
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        if not pending:
+            return 0
+        table = DeviceToken.__table__
+        statement = (
+            update(table)
+            .where(table.c.id == bindparam("token_id"))
+            .values(last_used=bindparam("used_at"))
+        )
+        try:
+            with SessionLocal() as db:
+                db.execute(statement, [{"token_id": k, "used_at": v} for k, v in pending.items()])
+                db.commit()
+        except Exception:
+            # keep the batch for the next flush; a touch since then is newer and wins
+            with self._lock:
+                for token_id, used_at in pending.items():
+                    self._pending.setdefault(token_id, used_at)
+            raise
+        return len(pending)
+
+
+token_cache = TokenCache(TOKEN_CACHE_SIZE, TOKEN_CACHE_SECONDS)
+last_used = LastUsedRecorder()
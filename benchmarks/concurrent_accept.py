@@ -0,0 +1,174 @@
+"""
+Accept every offer on a request at the same moment and check that exactly one wins.
+
+    python -m benchmarks.seed --database benchmarks/bench.db
+    python -m benchmarks.concurrent_accept --database benchmarks/bench.db --requests 20 --offers 16 --workers 2
+
+The app runs under uvicorn with --workers processes against a scratch copy
+of the seeded database. For each of --requests open requests it adds
+--offers pending offers. One thread per offer waits on a barrier, then all
+of them PATCH accept together. The run fails if, for any request:
+
+  * not exactly one accept got 200 (the rest must get 409 or 400)
+  * any call got a 5xx, e.g. "database is locked"
+  * the database does not end up with one order, one accepted offer, the
+    other offers rejected and the request accepted
+"""
+import argparse
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import httpx
+
+from benchmarks.run import _configure, percentile
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(HERE)
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _prepare(requests: int, offers: int) -> list[tuple]:
+    """(request id, customer id, [offer ids]) for `requests` open requests with `offers` fresh pending offers each."""
+    from sqlalchemy import func, select
+
+    from database import SessionLocal
+    from models import Offer, RequestPost, User
+
+    with SessionLocal() as db:
+        suppliers = db.scalars(select(User.id).where(User.role == "supplier").limit(offers)).all()
+        if len(suppliers) < offers:
+            sys.exit(f"the seed has only {len(suppliers)} suppliers, fewer than --offers {offers}")
+        picked = db.execute(
+            select(RequestPost.id, RequestPost.customer_id, RequestPost.offer_price)
+            .where(RequestPost.status == "open")
+            .order_by(func.random())
+            .limit(requests)
+        ).all()
+        plan = []
+        for request_id, customer_id, price in picked:
+            rows = [Offer(request_id=request_id, supplier_id=supplier_id, proposed=price) for supplier_id in suppliers]
+            db.add_all(rows)
+            db.flush()
+            plan.append((request_id, customer_id, [row.id for row in rows]))
+        db.commit()
+    return plan
+
+
+def _check(plan: list[tuple]) -> list[str]:
+    """What the database says about each request after the race."""
+    from sqlalchemy import func, select
+
+    from database import SessionLocal
+    from models import Offer, Order, RequestPost
+
+    problems = []
+    with SessionLocal() as db:
+        for request_id, _, _ in plan:
+            orders = db.scalar(select(func.count()).select_from(Order).where(Order.request_id == request_id))
+            statuses = dict(db.execute(
+                select(Offer.status, func.count()).where(Offer.request_id == request_id).group_by(Offer.status)
+            ).all())
+            request_status = db.scalar(select(RequestPost.status).where(RequestPost.id == request_id))
+            if orders != 1 or statuses.get("accepted") != 1 or statuses.get("pending") or request_status != "accepted":
+                problems.append(
+                    f"request {request_id}: {orders} orders, offers {statuses}, request {request_status}"
+                )
+    return problems
+
+
+def _race(client: httpx.Client, customer_id, offer_ids: list) -> list[tuple[int, float]]:
+    barrier = threading.Barrier(len(offer_ids))
+    results: list = [None] * len(offer_ids)
+
+    def accept(n: int, offer_id) -> None:
+        barrier.wait()
+        started = time.perf_counter()
+        response = client.patch(
+            f"/offers/offers/{offer_id}/", json={"action": "accept", "customer_id": str(customer_id)},
+        )
+        results[n] = (response.status_code, (time.perf_counter() - started) * 1000)
+
+    threads = [threading.Thread(target=accept, args=(n, offer_id)) for n, offer_id in enumerate(offer_ids)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+
+def run(args) -> int:
+    import manage
+
+    manage.migrate("head")
+    plan = _prepare(args.requests, args.offers)
+    port = _free_port()
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(port),
+         "--workers", str(args.workers), "--log-level", "warning"],
+        cwd=ROOT,
+        env=os.environ.copy(),
+    )
+    try:
+        with httpx.Client(base_url=f"http://127.0.0.1:{port}", timeout=60,
+                          limits=httpx.Limits(max_connections=args.offers * 2)) as client:
+            deadline = time.monotonic() + 60
+            while True:
+                try:
+                    client.get("/metrics/cache")
+                    break
+                except httpx.TransportError:
+                    if time.monotonic() > deadline or server.poll() is not None:
+                        print("the app did not come up")
+                        return 1
+                    time.sleep(0.2)
+
+            failures, latencies, statuses = [], [], {}
+            for request_id, customer_id, offer_ids in plan:
+                results = _race(client, customer_id, offer_ids)
+                codes = [code for code, _ in results]
+                latencies += [ms for _, ms in results]
+                for code in codes:
+                    statuses[code] = statuses.get(code, 0) + 1
+                if codes.count(200) != 1 or any(code not in (200, 400, 409) for code in codes):
+                    failures.append(f"request {request_id}: statuses {sorted(codes)}")
+    finally:
+        server.terminate()
+        server.wait()
+
+    failures += _check(plan)
+    print(
+        f"{len(plan)} requests x {args.offers} concurrent accepts on {args.workers} workers: "
+        f"statuses {dict(sorted(statuses.items()))}, "
+        f"p50 {percentile(latencies, 50):.1f} ms, p95 {percentile(latencies, 95):.1f} ms, "
+        f"p99 {percentile(latencies, 99):.1f} ms"
+    )
+    for failure in failures:
+        print(f"FAIL {failure}")
+    return 1 if failures else 0
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="race concurrent accepts of offers on the same request")
+    parser.add_argument("--database", default=os.path.join(HERE, "bench.db"), help="seeded database (left untouched)")
+    parser.add_argument("--requests", type=int, default=20, help="requests to race on")
+    parser.add_argument("--offers", type=int, default=16, help="offers, and so concurrent accepts, per request")
+    parser.add_argument("--workers", type=int, default=2, help="uvicorn worker processes")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix="boneka-accept-") as workdir:
+        _configure(args.database, workdir, cache=False)
+        sys.exit(run(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,245 @@
+"""
+Drive every route through the ASGI app in-process and check it against its budget.
+
+    python -m benchmarks.seed --database benchmarks/bench.db
+    python -m benchmarks.run --database benchmarks/bench.db --baseline benchmarks/results/last.json
+
+Each route is called --iterations times (after --warmup untimed calls) on a
+scratch copy of the seeded database. Per route the run records p50/p95/p99
+latency and how many SQL statements one request issued. It fails when:
+
+  * a route issues more statements than budgets.json allows; a list route
+    that starts loading a relationship per row blows its budget at once
+  * p95 exceeds the route's latency budget
+  * p95 regressed more than --tolerance against a --baseline results file
+  * a route answered with an unexpected status, or has no scenario
+
+Results are written as JSON so runs can be diffed or used as the next baseline.
+"""
+import argparse
+import gc
+import json
+import math
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+from datetime import datetime, timezone
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+def _configure(database: str, workdir: str, cache: bool) -> str:
+    """Point the app at a scratch copy before anything imports database.py."""
+    if not os.path.exists(database):
+        sys.exit(f"{database} not found; create it with `python -m benchmarks.seed --database {database}`")
+    scratch = os.path.join(workdir, "bench.db")
+    shutil.copyfile(database, scratch)
+    # a database last written in WAL mode may still have pages in its -wal file
+    if os.path.exists(database + "-wal"):
+        shutil.copyfile(database + "-wal", scratch + "-wal")
+    os.environ["DATABASE_URL"] = f"sqlite:///{scratch}"
+    os.environ["BLOB_STORE_DIR"] = os.path.join(workdir, "blobs")
+    # the background last_used flush would otherwise land in whichever route is being timed
+    os.environ["LAST_USED_FLUSH_SECONDS"] = "3600"
+    if not cache:
+        # every call goes to the database, so statement counts measure the query path
+        os.environ["CACHE_TTL_SECONDS"] = "0"
+    return scratch
+
+
+def percentile(samples: list[float], pct: float) -> float:
+    ordered = sorted(samples)
+    rank = max(int(round(pct / 100 * len(ordered) + 0.5)) - 1, 0)
+    return ordered[min(rank, len(ordered) - 1)]
+
+
+class StatementCounter:
+    """Counts statements sent to the database by both the sync and async engines."""
+
+    def __init__(self, *engines):
+        from sqlalchemy import event
+
+        self.count = 0
+        for engine in engines:
+            event.listen(engine, "before_cursor_execute", self._seen)
+
+    def _seen(self, *args, **kwargs):
+        self.count += 1
+
+
+def _git_commit() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=HERE, capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def _write_budgets(path: str, results: dict, headroom: float) -> None:
+    """
+    Statement budgets are the counts just measured: they only move when the
+    code does, so any increase is worth a look. Latency budgets leave
+    `headroom` for slower machines and are rounded up to 5 ms.
+    """
+    budgets = {
+        route: {
+            "statements": result["statements_max"],
+            "p95_ms": max(5 * math.ceil(result["p95_ms"] * headroom / 5), 25),
+        }
+        for route, result in sorted(results.items())
+    }
+    with open(path, "w") as fh:
+        json.dump(budgets, fh, indent=2)
+        fh.write("\n")
+    print(f"budgets written to {path}")
+
+
+def run(args) -> int:
+    from fastapi.testclient import TestClient
+
+    from benchmarks.scenarios import SCENARIOS, SKIPPED, Fixtures
+    from database import SessionLocal, async_engine, engine
+    import main
+    import manage
+
+    # the seeded file may predate the latest migrations
+    manage.migrate("head")
+
+    routes = {
+        f"{method} {route.path}"
+        for route in main.app.routes
+        if getattr(route, "include_in_schema", False)
+        for method in route.methods
+    }
+    scenarios = [s for s in SCENARIOS if not args.only or any(part in s.route for part in args.only)]
+    failures = [
+        f"{route}: no scenario" for route in sorted(routes - {s.route for s in SCENARIOS} - set(SKIPPED))
+    ]
+    failures += [f"{s.route}: route no longer exists" for s in scenarios if s.route not in routes]
+
+    budgets = {}
+    if not args.write_budgets:
+        with open(args.budgets) as fh:
+            budgets = json.load(fh)
+    baseline = {}
+    if args.baseline:
+        with open(args.baseline) as fh:
+            baseline = json.load(fh)["endpoints"]
+
+    counter = StatementCounter(engine, async_engine.sync_engine)
+    calls = args.warmup + args.iterations
+    results = {}
+    with TestClient(main.app, raise_server_exceptions=False) as client, SessionLocal() as db:
+        fixtures = Fixtures(db, calls, args.seed)
+        fixtures.prepare(client, db, uuid.uuid4().hex[:8])
+
+        for scenario in scenarios:
+            if scenario.route not in routes:
+                continue
+            method, path = scenario.route.split(" ", 1)
+            latencies, statements, statuses, errors = [], [], {}, []
+            # like timeit: collect between routes, not in the middle of one
+            gc.collect()
+            gc.disable()
+            for i in range(calls):
+                request = {"url": path, **scenario.build(fixtures, i)}
+                counter.count = 0
+                started = time.perf_counter()
+                response = client.request(method, **request)
+                elapsed = (time.perf_counter() - started) * 1000
+                if i < args.warmup:
+                    continue
+                latencies.append(elapsed)
+                statements.append(counter.count)
+                statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+                if response.status_code not in scenario.expect and not errors:
+                    errors.append(response.text[:200])
+            gc.enable()
+
+            result = {
+                "n": len(latencies),
+                "p50_ms": round(percentile(latencies, 50), 2),
+                "p95_ms": round(percentile(latencies, 95), 2),
+                "p99_ms": round(percentile(latencies, 99), 2),
+                "statements_max": max(statements),
+                "statements_min": min(statements),
+                "statuses": {str(code): count for code, count in sorted(statuses.items())},
+            }
+            results[scenario.route] = result
+
+            budget = budgets.get(scenario.route)
+            unexpected = {code: n for code, n in statuses.items() if code not in scenario.expect}
+            if unexpected:
+                failures.append(f"{scenario.route}: unexpected statuses {unexpected}, e.g. {errors[0]}")
+            if budget is None and not args.write_budgets:
+                failures.append(f"{scenario.route}: no budget in {os.path.basename(args.budgets)}")
+            elif budget is not None:
+                if result["statements_max"] > budget["statements"]:
+                    failures.append(
+                        f"{scenario.route}: {result['statements_max']} SQL statements, budget {budget['statements']}"
+                    )
+                if result["p95_ms"] > budget["p95_ms"]:
+                    failures.append(f"{scenario.route}: p95 {result['p95_ms']} ms, budget {budget['p95_ms']} ms")
+            before = baseline.get(scenario.route)
+            if before and result["p95_ms"] > max(before["p95_ms"] * args.tolerance, before["p95_ms"] + args.noise_ms):
+                failures.append(f"{scenario.route}: p95 {result['p95_ms']} ms, was {before['p95_ms']} ms")
+            print(
+                f"{scenario.route:48} p50 {result['p50_ms']:8.2f}  p95 {result['p95_ms']:8.2f}  "
+                f"p99 {result['p99_ms']:8.2f} ms  sql {result['statements_max']:3d}"
+            )
+
+    report = {
+        "meta": {
+            "started_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "commit": _git_commit(),
+            "database": os.path.abspath(args.database),
+            "iterations": args.iterations,
+            "warmup": args.warmup,
+            "cache": args.cache,
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+        },
+        "endpoints": results,
+        "failures": failures,
+    }
+    if args.write_budgets:
+        _write_budgets(args.budgets, results, args.headroom)
+    os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+    with open(args.output, "w") as fh:
+        json.dump(report, fh, indent=2)
+    print(f"\nresults written to {args.output}")
+    for failure in failures:
+        print(f"FAIL {failure}")
+    return 1 if failures else 0
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="benchmark every route against its budget")
+    parser.add_argument("--database", default=os.path.join(HERE, "bench.db"), help="seeded database (left untouched)")
+    parser.add_argument("--iterations", type=int, default=50)
+    parser.add_argument("--warmup", type=int, default=3)
+    parser.add_argument("--budgets", default=os.path.join(HERE, "budgets.json"))
+    parser.add_argument("--baseline", help="earlier results file to compare p95 against")
+    parser.add_argument("--tolerance", type=float, default=1.5, help="allowed p95 growth over the baseline")
+    parser.add_argument("--noise-ms", type=float, default=5.0, help="ignore regressions smaller than this")
+    parser.add_argument("--output", default=os.path.join(HERE, "results", f"{time.strftime('%Y%m%d-%H%M%S')}.json"))
+    parser.add_argument("--only", nargs="*", help="run routes containing any of these substrings")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--cache", action="store_true", help="leave the response cache on (off by default)")
+    parser.add_argument("--write-budgets", action="store_true", help="replace the budgets with this run's numbers")
+    parser.add_argument("--headroom", type=float, default=4.0, help="p95 multiplier used by --write-budgets")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix="boneka-bench-") as workdir:
+        _configure(args.database, workdir, args.cache)
+        sys.exit(run(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,352 @@
+"""
+One scenario per route: how to build the i-th request against a seeded database.
+
+Fixtures are sampled from the seeded rows, and everything a route needs but
+the seed does not have (images, passwords, tokens) is created up front by
+`prepare`. Routes that consume what they touch (deletes, accepting an
+offer, logging out) draw from their own pool so iterations never collide.
+"""
+import io
+import random
+import uuid
+from collections import deque
+from datetime import date, timedelta
+from typing import Callable, NamedTuple
+
+import orjson
+from PIL import Image
+from sqlalchemy import func, select
+
+from auth_tokens import hash_token, new_token, token_expiry
+from models import (
+    Category, DeviceToken, Offer, Order, Product, ProductImage, RequestImage,
+    RequestPost, SupplierCategory, User,
+)
+from password_hashing import password_hasher
+
+PASSWORD = "bench-password"
+
+
+class Scenario(NamedTuple):
+    route: str  # "METHOD /path/{param}" exactly as the app declares it
+    build: Callable[["Fixtures", int], dict]  # keyword arguments for client.request
+    expect: tuple = (200,)
+
+
+# long-lived or otherwise not request/response shaped
+SKIPPED = {
+    "GET /offers/requests/{supplier_id}/stream": "server-sent event stream",
+}
+
+
+def _png(seed: int) -> bytes:
+    buffer = io.BytesIO()
+    Image.new("RGB", (640, 480), ((seed * 37) % 256, (seed * 91) % 256, 128)).save(buffer, "PNG")
+    return buffer.getvalue()
+
+
+class Fixtures:
+    def __init__(self, db, iterations: int, seed: int):
+        self.rnd = random.Random(seed)
+        self.n = iterations
+        sample = self.n * 4
+
+        def rows(query, limit=sample):
+            return db.execute(query.order_by(func.random()).limit(limit)).all()
+
+        suppliers = rows(select(User.id, User.email, User.name).where(User.role == "supplier"), sample * 2)
+        self.suppliers = [row.id for row in suppliers[:sample]]
+        self.supplier_emails = [row.email for row in suppliers[:sample]]
+        self.supplier_names = [row.name for row in suppliers[:sample]]
+        customers = rows(select(User.id, User.email, User.username).where(User.role == "customer"))
+        self.customers = [row.id for row in customers]
+        self.emails = [row.email for row in customers]
+        self.usernames = [row.username for row in customers]
+        self.categories = list(db.scalars(select(Category.display_name)))
+        self.customers_with_orders = [row[0] for row in rows(select(Order.customer_id).where(Order.status == "delivered"))]
+
+        # rows that routes only read or update are shared; rows a route
+        # uses up (deletes, accepting an offer) are never handed to another
+        requests = [row[0] for row in rows(select(RequestPost.id).where(RequestPost.status == "open"), sample + self.n)]
+        self.open_requests, self.deletable_requests = requests[:sample], deque(requests[sample:])
+        # (request, supplier) pairs where the supplier may make an offer
+        self.offerable = [tuple(row) for row in rows(
+            select(RequestPost.id, SupplierCategory.supplier_id)
+            .join(SupplierCategory, SupplierCategory.category_id == RequestPost.category_id)
+            .where(RequestPost.status == "open", RequestPost.id.notin_(requests))
+        )]
+        # products of those suppliers are left alone so they keep carrying the category
+        offering = {supplier_id for _, supplier_id in self.offerable}
+        products = [row[0] for row in rows(select(Product.id).where(Product.supplier_id.notin_(offering)), sample + self.n)]
+        self.products, self.deletable_products = products[:sample], deque(products[sample:])
+        busy = set(requests) | {request_id for request_id, _ in self.offerable}
+        self.pending_offers = deque()
+        for offer_id, customer_id, request_id in rows(
+            select(Offer.id, RequestPost.customer_id, RequestPost.id)
+            .join(RequestPost, RequestPost.id == Offer.request_id)
+            .where(RequestPost.status == "open", Offer.status == "pending"),
+            sample * 2,
+        ):
+            if request_id not in busy and len(self.pending_offers) < self.n:
+                busy.add(request_id)
+                self.pending_offers.append((offer_id, customer_id))
+        self.placed_orders = deque(rows(select(Order.id, Order.customer_id).where(Order.status == "placed"), self.n))
+
+        self.deletable_suppliers = deque()
+        self.deletable_users = deque()
+        self.admin_deletable_users = deque()
+        self.tokens = deque()
+        self.admin_token = None
+        self.password_users = []
+        self.product_images = []
+        self.request_images = []
+        self.profile_users = []
+        self.suppliers_with_images = []
+
+    def pick(self, items: list, i: int):
+        return items[i % len(items)]
+
+    def prepare(self, client, db, run_id: str) -> None:
+        """Create what the seed lacks through the API or directly, outside the timed loop."""
+        for i in range(4):
+            image = _png(i)
+            product_id = self.products[i]
+            client.post(f"/products/{product_id}/images", files={"file": (f"p{i}.png", image, "image/png")})
+            client.post(f"/requests/{self.open_requests[i]}/images/", files={"file": (f"r{i}.png", image, "image/png")})
+            client.post(f"/users/image/{self.customers[i]}", files={"file": (f"u{i}.png", image, "image/png")})
+            client.post(f"/suppliers/image/{self.suppliers[i]}", files={"file": (f"s{i}.png", image, "image/png")})
+        self.product_images = list(db.scalars(select(ProductImage.id)))
+        self.request_images = list(db.scalars(select(RequestImage.id)))
+        self.profile_users = self.customers[:4]
+        self.suppliers_with_images = self.suppliers[:4]
+
+        for i in range(self.n):
+            user = client.post("/users/", json={
+                "email": f"delete-{run_id}-{i}@example.com", "name": "Bench", "surname": f"Delete{i}",
+            }).json()
+            self.deletable_users.append(user["id"])
+            supplier = client.post("/suppliers/", json={
+                "email": f"delete-supplier-{run_id}-{i}@example.com", "name": f"Bench Supplier {i}",
+            }).json()
+            self.deletable_suppliers.append(supplier["id"])
+            user = client.post("/users/", json={
+                "email": f"admin-delete-{run_id}-{i}@example.com", "name": "Bench", "surname": f"AdminDelete{i}",
+            }).json()
+            self.admin_deletable_users.append(user["id"])
+
+        # one hash shared by every bench account keeps setup fast
+        hashed = password_hasher.hash_sync(PASSWORD)
+        self.password_users = self.customers[: self.n * 3]
+        db.execute(
+            User.__table__.update()
+            .where(User.id.in_(self.password_users))
+            .values(password_hash=hashed, status="active")
+        )
+        for i in range(self.n * 2):
+            token = new_token()
+            db.add(DeviceToken(
+                user_id=self.pick(self.password_users, i),
+                device_id=f"bench-{i}",
+                token=hash_token(token),
+                expires_at=token_expiry(),
+            ))
+            self.tokens.append(token)
+        admin = User(
+            email=f"admin-{run_id}@example.com", name="Bench", surname="Admin",
+            username=f"bench.admin.{run_id}", role="admin", status="active",
+        )
+        db.add(admin)
+        db.flush()
+        self.admin_token = new_token()
+        db.add(DeviceToken(
+            user_id=admin.id, device_id="bench-admin", token=hash_token(self.admin_token), expires_at=token_expiry(),
+        ))
+        db.commit()
+
+
+def _bearer(token: str) -> dict:
+    return {"Authorization": f"Bearer {token}"}
+
+
+def _batch_ids(pool: list, i: int, count: int = 50) -> list[str]:
+    """`count` ids from `pool` with a few repeats and one id that matches nothing."""
+    ids = [str(pool[(i * count + n) % len(pool)]) for n in range(count - 5)]
+    return ids + ids[:4] + [str(uuid.UUID(int=i))]
+
+
+def _ndjson_products(seed: int, count: int, categories: list[str]) -> bytes:
+    return b"".join(
+        orjson.dumps({
+            "name": f"Bulk item {seed}-{n}",
+            "description": "imported in bulk",
+            "price": 1 + n % 500,
+            "category": categories[(seed + n) % len(categories)],
+        }) + b"\n"
+        for n in range(count)
+    )
+
+
+SCENARIOS = [
+    # users
+    Scenario("POST /users/", lambda f, i: {"json": {
+        "email": f"bench-{f.rnd.getrandbits(64):x}@example.com", "name": "Bench", "surname": f"User{i}",
+    }}),
+    Scenario("POST /users/image/{user_id}", lambda f, i: {
+        "url": f"/users/image/{f.pick(f.customers, i)}", "files": {"file": ("u.png", _png(i), "image/png")},
+    }),
+    Scenario("GET /users/image/{user_id}", lambda f, i: {"url": f"/users/image/{f.pick(f.profile_users, i)}"}),
+    Scenario("GET /users/{username}", lambda f, i: {"url": f"/users/{f.pick(f.usernames, i)}"}),
+    Scenario("GET /users/{user_id}/user", lambda f, i: {"url": f"/users/{f.pick(f.customers, i)}/user"}),
+    Scenario("PUT /users/{email}", lambda f, i: {
+        "url": f"/users/{f.pick(f.emails, i)}",
+        "json": {"email": f.pick(f.emails, i), "name": "Renamed", "surname": "User"},
+    }),
+    Scenario("DELETE /users/{user_id}", lambda f, i: {"url": f"/users/{f.deletable_users.popleft()}"}),
+    Scenario("POST /users/batch", lambda f, i: {"json": {"ids": _batch_ids(f.customers, i)}}),
+    Scenario("GET /users/", lambda f, i: {"params": {"limit": 50}}),
+    Scenario("GET /users/exists/{email}", lambda f, i: {"url": f"/users/exists/{f.pick(f.emails, i)}"}),
+    # suppliers
+    Scenario("POST /suppliers/", lambda f, i: {"json": {
+        "email": f"bench-supplier-{f.rnd.getrandbits(64):x}@example.com", "name": f"Bench Supplier {i}",
+        "latitude": -26.2, "longitude": 28.04,
+    }}),
+    Scenario("GET /suppliers/nearby", lambda f, i: {"params": {
+        "lat": f.rnd.uniform(-34, -23), "lon": f.rnd.uniform(17, 32), "radius_km": 25,
+        "category": f.pick(f.categories, i), "limit": 20,
+    }}),
+    Scenario("GET /suppliers/{name}", lambda f, i: {"url": f"/suppliers/{f.pick(f.supplier_names, i)}"}),
+    Scenario("GET /suppliers{user_id}/suplier", lambda f, i: {"url": f"/suppliers{f.pick(f.suppliers, i)}/suplier"}),
+    Scenario("PUT /suppliers/{user_id}", lambda f, i: {
+        "url": f"/suppliers/{f.pick(f.suppliers, i)}",
+        "json": {"email": f.pick(f.supplier_emails, i), "name": f.pick(f.supplier_names, i),
+                 "latitude": -29.1, "longitude": 26.2},
+    }),
+    Scenario("DELETE /suppliers/{user_id}", lambda f, i: {"url": f"/suppliers/{f.deletable_suppliers.popleft()}"}),
+    Scenario("POST /suppliers/batch", lambda f, i: {"json": {"ids": _batch_ids(f.suppliers, i)}}),
+    Scenario("GET /suppliers/", lambda f, i: {"params": {"limit": 50}}),
+    Scenario("GET /suppliers/exists/{email}", lambda f, i: {"url": f"/suppliers/exists/{f.pick(f.supplier_emails, i)}"}),
+    Scenario("POST /suppliers/image/{user_id}", lambda f, i: {
+        "url": f"/suppliers/image/{f.pick(f.suppliers, i)}", "files": {"file": ("s.png", _png(i), "image/png")},
+    }),
+    Scenario("GET /suppliers/image/{supplier_id}", lambda f, i: {
+        "url": f"/suppliers/image/{f.pick(f.suppliers_with_images, i)}",
+    }),
+    # products
+    Scenario("POST /products/", lambda f, i: {"json": {
+        "name": f"bench product {i}", "description": "steel hammer", "price": 12.5,
+        "supplier_id": str(f.pick(f.suppliers, i)), "category": f.pick(f.categories, i),
+    }}),
+    Scenario("POST /products/{product_id}/images", lambda f, i: {
+        "url": f"/products/{f.products[(i + 4) % len(f.products)]}/images",
+        "files": {"file": ("p.png", _png(i), "image/png")},
+    }),
+    Scenario("GET /products/{product_id}/images", lambda f, i: {"url": f"/products/{f.pick(f.products, i)}/images"}),
+    Scenario("GET /products/images/{image_id}", lambda f, i: {"url": f"/products/images/{f.pick(f.product_images, i)}"}),
+    Scenario("GET /products/{product_id}", lambda f, i: {"url": f"/products/{f.pick(f.products, i)}"}),
+    Scenario("GET /products/", lambda f, i: {"params": {"limit": 50}}),
+    Scenario("PUT /products/{product_id}", lambda f, i: {
+        "url": f"/products/{f.pick(f.products, i)}",
+        "json": {"name": f"renamed {i}", "description": "updated", "price": 20,
+                 "supplier_id": str(f.pick(f.suppliers, i)), "category": f.pick(f.categories, i + 1)},
+    }),
+    Scenario("DELETE /products/{product_id}", lambda f, i: {"url": f"/products/{f.deletable_products.popleft()}"}),
+    Scenario("GET /products/supplier/{supplier_id}", lambda f, i: {"url": f"/products/supplier/{f.pick(f.suppliers, i)}"}),
+    Scenario("GET /products/category/{category}", lambda f, i: {"url": f"/products/category/{f.pick(f.categories, i)}"}),
+    Scenario("GET /products/search/{query}", lambda f, i: {
+        "url": f"/products/search/{f.rnd.choice(['steel hammer', 'cordless', 'wooden chair', 'lamp'])}",
+    }),
+    Scenario("GET /products/supplier/{supplier_id}/count", lambda f, i: {
+        "url": f"/products/supplier/{f.pick(f.suppliers, i)}/count",
+    }),
+    Scenario("GET /products/count", lambda f, i: {}),
+    Scenario("POST /products/batch", lambda f, i: {"json": {"ids": _batch_ids(f.products, i)}}),
+    Scenario("POST /products/bulk", lambda f, i: {
+        "params": {"supplier_id": str(f.pick(f.suppliers, i))},
+        "content": _ndjson_products(i, 200, f.categories),
+        "headers": {"content-type": "application/x-ndjson"},
+    }),
+    Scenario("GET /products/supplier/{supplier_id}/export", lambda f, i: {
+        "url": f"/products/supplier/{f.pick(f.suppliers, i)}/export",
+    }),
+    # requests
+    Scenario("POST /requests/requests/", lambda f, i: {"json": {
+        "title": f"need {i}", "category": f.pick(f.categories, i), "offer_price": 99.0,
+        "quantity": 2, "customer_id": str(f.pick(f.customers, i)),
+    }}),
+    Scenario("POST /requests/{request_id}/images/", lambda f, i: {
+        "url": f"/requests/{f.pick(f.open_requests, i)}/images/",
+        "files": {"file": ("r.png", _png(i), "image/png")},
+    }),
+    Scenario("GET /requests/images/{image_id}", lambda f, i: {"url": f"/requests/images/{f.pick(f.request_images, i)}"}),
+    Scenario("POST /requests/batch", lambda f, i: {"json": {"ids": _batch_ids(f.open_requests, i)}}),
+    Scenario("GET /requests/get_all", lambda f, i: {"params": {"limit": 50}}),
+    Scenario("GET /requests/get_single/{request_id}", lambda f, i: {
+        "url": f"/requests/get_single/{f.pick(f.open_requests, i)}",
+    }),
+    Scenario("GET /requests/{request_id}/images/", lambda f, i: {"url": f"/requests/{f.pick(f.open_requests, i)}/images/"}),
+    Scenario("PUT /requests/update/{request_id}", lambda f, i: {
+        "url": f"/requests/update/{f.pick(f.open_requests, i)}",
+        "json": {"id": str(f.pick(f.open_requests, i)), "title": f"updated {i}", "category": f.pick(f.categories, i),
+                 "offer_price": 50.0, "customer_id": str(f.pick(f.customers, i))},
+    }),
+    Scenario("DELETE /requests/delete/{request_id}", lambda f, i: {
+        "url": f"/requests/delete/{f.deletable_requests.popleft()}",
+    }),
+    # offers
+    Scenario("GET /offers/requests/{supplier_id}", lambda f, i: {
+        "url": f"/offers/requests/{f.pick(f.suppliers, i)}", "params": {"limit": 50},
+    }),
+    Scenario("POST /offers/{request_id}/", lambda f, i: {
+        "url": f"/offers/{f.pick(f.offerable, i)[0]}/",
+        "json": {"supplier_id": str(f.pick(f.offerable, i)[1]), "proposed": 42.0},
+    }),
+    Scenario("GET /offers/requests/{request_id}/offers/", lambda f, i: {
+        "url": f"/offers/requests/{f.pick(f.open_requests, i)}/offers/",
+    }),
+    Scenario("PATCH /offers/offers/{offer_id}/", lambda f, i: (lambda offer: {
+        "url": f"/offers/offers/{offer[0]}/", "json": {"action": "accept", "customer_id": str(offer[1])},
+    })(f.pending_offers.popleft())),
+    Scenario("POST /offers/accept_request/", lambda f, i: {"json": {
+        "request_id": str(f.pick(f.offerable, i + 1)[0]), "supplier_id": str(f.pick(f.offerable, i + 1)[1]),
+    }}),
+    # auth
+    Scenario("POST /auth/create_password", lambda f, i: {"json": {
+        "user_id": str(f.pick(f.customers, i + f.n * 3)), "password": PASSWORD,
+    }}),
+    # suppliers never log in during the run, so resetting theirs is harmless
+    Scenario("POST /auth/forgot-password", lambda f, i: {"json": {"email": f.pick(f.supplier_emails, i)}}),
+    Scenario("POST /auth/access", lambda f, i: {"json": {
+        "user_id": str(f.pick(f.password_users, i)), "password": PASSWORD, "device_id": f"login-{i}",
+    }}),
+    Scenario("GET /auth/me", lambda f, i: {"headers": _bearer(f.tokens[0])}),
+    Scenario("POST /auth/logout", lambda f, i: {"headers": _bearer(f.tokens.pop())}, expect=(204,)),
+    Scenario("POST /auth/change-password", lambda f, i: {"json": {
+        "user_id": str(f.password_users[f.n + i]), "old_password": PASSWORD, "new_password": "changed-password",
+    }}),
+    # orders
+    Scenario("GET /orders/get_order/{user_id}", lambda f, i: {"url": f"/orders/get_order/{f.pick(f.customers, i)}"}),
+    Scenario("POST /orders/mark_order", lambda f, i: (lambda order: {"json": {
+        "order_id": str(order[0]), "user_id": str(order[1]), "action": "cancelled",
+    }})(f.placed_orders.popleft())),
+    Scenario("GET /orders/completed_orders", lambda f, i: {
+        "params": {"user_id": str(f.pick(f.customers_with_orders, i))},
+    }),
+    # metrics
+    Scenario("GET /metrics/cache", lambda f, i: {}),
+    # admin
+    Scenario("GET /admin/users", lambda f, i: {"headers": _bearer(f.admin_token), "params": {"role": "customer"}}),
+    Scenario("GET /admin/users/{user_id}", lambda f, i: {
+        "url": f"/admin/users/{f.pick(f.customers, i)}", "headers": _bearer(f.admin_token),
+    }),
+    Scenario("PATCH /admin/users/{user_id}", lambda f, i: {
+        "url": f"/admin/users/{f.pick(f.customers, i)}", "headers": _bearer(f.admin_token), "json": {"status": "active"},
+    }),
+    Scenario("DELETE /admin/users/{user_id}", lambda f, i: {
+        "url": f"/admin/users/{f.admin_deletable_users.popleft()}", "headers": _bearer(f.admin_token),
+    }, expect=(204,)),
+    Scenario("GET /admin/stats/users", lambda f, i: {"headers": _bearer(f.admin_token)}),
+    Scenario("GET /admin/stats/daily", lambda f, i: {
+        "headers": _bearer(f.admin_token),
+        "params": {"start": str(date.today() - timedelta(days=365)), "per_category": bool(i % 2)},
+    }),
+]
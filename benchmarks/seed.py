@@ -0,0 +1,229 @@
+"""
+Seed a database with a reproducible, realistically sized dataset.
+
+    python -m benchmarks.seed --database benchmarks/bench.db --scale 1
+
+At --scale 1 that is 50k users (10k suppliers), 500k products, 300k
+requests, 1M offers and 200k orders. The same --seed always produces the
+same rows, so two benchmark runs differ only by the code under test.
+"""
+import argparse
+import os
+import random
+import sys
+import time
+import uuid
+from datetime import datetime, timedelta
+
+
+def _configure(database: str) -> None:
+    os.environ["DATABASE_URL"] = f"sqlite:///{os.path.abspath(database)}"
+
+
+VOLUMES = {
+    "users": 50_000,
+    "products": 500_000,
+    "requests": 300_000,
+    "offers": 1_000_000,
+    "orders": 200_000,
+}
+SUPPLIER_SHARE = 0.2
+CHUNK = 20_000
+
+CATEGORIES = [
+    "Electronics", "Furniture", "Tools", "Power Tools", "Garden", "Kitchen", "Bathroom",
+    "Lighting", "Plumbing", "Paint", "Flooring", "Roofing", "Hardware", "Fasteners",
+    "Office Supplies", "Stationery", "Toys", "Baby", "Clothing", "Shoes", "Sports",
+    "Outdoor", "Camping", "Automotive", "Motorcycle", "Bicycles", "Books", "Music",
+    "Pet Supplies", "Groceries", "Beverages", "Health", "Beauty", "Jewellery",
+    "Watches", "Cleaning", "Laundry", "Storage", "Appliances", "Cellphones",
+    "Computers", "Networking", "Cameras", "Audio", "Gaming", "Solar", "Security",
+    "Building Materials", "Farming", "Crafts",
+]
+WORDS = [
+    "red", "blue", "steel", "wooden", "compact", "heavy", "duty", "portable", "classic",
+    "premium", "cordless", "smart", "mini", "large", "outdoor", "indoor", "eco", "pro",
+    "hammer", "drill", "chair", "table", "lamp", "cable", "charger", "kettle", "pot",
+    "shelf", "cabinet", "hose", "ladder", "paint", "brush", "panel", "battery", "tent",
+]
+EPOCH = datetime(2025, 1, 1)
+
+
+class Generator:
+    def __init__(self, seed: int):
+        self.rnd = random.Random(seed)
+
+    def uuid(self) -> uuid.UUID:
+        return uuid.UUID(int=self.rnd.getrandbits(128), version=4)
+
+    def timestamp(self) -> datetime:
+        return EPOCH + timedelta(seconds=self.rnd.randrange(365 * 86400))
+
+    def phrase(self, words: int) -> str:
+        return " ".join(self.rnd.choice(WORDS) for _ in range(words))
+
+    def price(self) -> float:
+        return round(self.rnd.lognormvariate(4, 1.2), 2)
+
+
+def _insert(conn, table, rows: list[dict]) -> None:
+    for start in range(0, len(rows), CHUNK):
+        conn.execute(table.insert(), rows[start:start + CHUNK])
+
+
+def seed(scale: float, seed_value: int) -> dict:
+    from sqlalchemy import text
+
+    import manage
+    from catalog import canonical_category, rebuild_supplier_categories, reconcile_counters
+    from stats import rebuild_daily_stats
+    from database import SessionLocal, engine
+    from geo import geohash
+    from models import Category, Offer, Order, Product, RequestPost, User
+
+    manage.migrate("head")
+    gen = Generator(seed_value)
+    counts = {name: max(int(volume * scale), 1) for name, volume in VOLUMES.items()}
+    counts["requests"] = max(counts["requests"], counts["orders"])
+
+    with engine.begin() as conn:
+        if conn.execute(text("SELECT 1 FROM users LIMIT 1")).first():
+            sys.exit("database is not empty; seed into a fresh file")
+        conn.exec_driver_sql("PRAGMA synchronous = OFF")
+
+        _insert(conn, Category.__table__, [
+            {"id": i, "name": canonical_category(name), "display_name": name}
+            for i, name in enumerate(CATEGORIES, start=1)
+        ])
+
+        suppliers, customers, users = [], [], []
+        for i in range(counts["users"]):
+            user_id = gen.uuid()
+            is_supplier = gen.rnd.random() < SUPPLIER_SHARE
+            lat = lon = None
+            if is_supplier:
+                lat, lon = gen.rnd.uniform(-34.8, -22.1), gen.rnd.uniform(16.5, 32.9)
+            users.append({
+                "id": user_id,
+                "username": f"user{i}",
+                "role": "supplier" if is_supplier else "customer",
+                "name": f"Name{i}",
+                "surname": f"Surname{i}",
+                "email": f"user{i}@example.com",
+                "phone_number": f"+2760{i:07d}",
+                "created_at": gen.timestamp(),
+                "status": "active",
+                "latitude": lat,
+                "longitude": lon,
+                "geohash": geohash(lat, lon),
+            })
+            (suppliers if is_supplier else customers).append(user_id)
+        _insert(conn, User.__table__, users)
+        del users
+
+        rows = []
+        for _ in range(counts["products"]):
+            category_id = gen.rnd.randrange(len(CATEGORIES)) + 1
+            rows.append({
+                "id": gen.uuid(),
+                "name": gen.phrase(3),
+                "description": gen.phrase(12),
+                "category": CATEGORIES[category_id - 1],
+                "category_id": category_id,
+                "price": gen.price(),
+                "supplier_id": gen.rnd.choice(suppliers),
+                "created_at": gen.timestamp(),
+            })
+            if len(rows) == CHUNK:
+                _insert(conn, Product.__table__, rows)
+                rows = []
+        _insert(conn, Product.__table__, rows)
+
+        # the first `orders` requests were accepted and turned into an order
+        requests = []
+        rows = []
+        for i in range(counts["requests"]):
+            category_id = gen.rnd.randrange(len(CATEGORIES)) + 1
+            request = {
+                "id": gen.uuid(),
+                "title": gen.phrase(3),
+                "description": gen.phrase(10),
+                "category": CATEGORIES[category_id - 1],
+                "category_id": category_id,
+                "offer_price": gen.price(),
+                "quantity": gen.rnd.randint(1, 20),
+                "status": "accepted" if i < counts["orders"] else "open",
+                "customer_id": gen.rnd.choice(customers),
+                "created_at": gen.timestamp(),
+            }
+            rows.append(request)
+            requests.append((request["id"], request["customer_id"], request["quantity"]))
+            if len(rows) == CHUNK:
+                _insert(conn, RequestPost.__table__, rows)
+                rows = []
+        _insert(conn, RequestPost.__table__, rows)
+
+        offers, orders = [], []
+        for i in range(counts["offers"]):
+            if i < counts["orders"]:
+                request_id, customer_id, quantity = requests[i]
+                status = "accepted"
+            else:
+                index = gen.rnd.randrange(len(requests))
+                request_id, customer_id, quantity = requests[index]
+                status = "rejected" if index < counts["orders"] else "pending"
+            offer = {
+                "id": gen.uuid(),
+                "request_id": request_id,
+                "supplier_id": gen.rnd.choice(suppliers),
+                "proposed": gen.price(),
+                "status": status,
+                "created_at": gen.timestamp(),
+            }
+            offers.append(offer)
+            if status == "accepted":
+                orders.append({
+                    "id": gen.uuid(),
+                    "request_id": request_id,
+                    "offer_id": offer["id"],
+                    "customer_id": customer_id,
+                    "supplier_id": offer["supplier_id"],
+                    "status": gen.rnd.choices(["placed", "delivered", "cancelled"], [3, 6, 1])[0],
+                    "total_price": offer["proposed"] * quantity,
+                    "quantity": quantity,
+                    "created_at": offer["created_at"],
+                })
+            if len(offers) == CHUNK:
+                _insert(conn, Offer.__table__, offers)
+                offers = []
+        _insert(conn, Offer.__table__, offers)
+        _insert(conn, Order.__table__, orders)
+
+    with SessionLocal() as db:
+        rebuild_supplier_categories(db)
+        reconcile_counters(db)
+        rebuild_daily_stats(db)
+        db.commit()
+    with engine.connect() as conn:
+        conn.exec_driver_sql("ANALYZE")
+        # fold the WAL back in so the .db file alone is the whole database
+        conn.exec_driver_sql("PRAGMA wal_checkpoint(TRUNCATE)")
+    engine.dispose()
+    return counts
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="seed a benchmark database")
+    parser.add_argument("--database", default="benchmarks/bench.db")
+    parser.add_argument("--scale", type=float, default=1.0)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    _configure(args.database)
+    started = time.perf_counter()
+    counts = seed(args.scale, args.seed)
+    print(f"seeded {args.database} in {time.perf_counter() - started:.0f}s: {counts}")
+
+
+if __name__ == "__main__":
+    main()
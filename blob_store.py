@@ -0,0 +1,119 @@
+import hashlib
+import os
+import tempfile
+from abc import ABC, abstractmethod
+from functools import lru_cache
+from typing import Iterable, NamedTuple, Optional
+
+BLOB_STORE_DIR = os.getenv("BLOB_STORE_DIR", "./blobs")
+
+# magic numbers for the formats the apps upload; anything else falls back to
+# the client supplied type
+_SIGNATURES = [
+    (b"\xff\xd8\xff", "image/jpeg"),
+    (b"\x89PNG\r\n\x1a\n", "image/png"),
+    (b"GIF87a", "image/gif"),
+    (b"GIF89a", "image/gif"),
+]
+_HEIF_BRANDS = {b"heic", b"heix", b"hevc", b"mif1", b"msf1"}
+
+
+class BlobTooLarge(Exception):
+    """Raised by put_stream once more than `max_bytes` have been read."""
+
+
+class StoredBlob(NamedTuple):
+    sha256: str
+    size: int
+    content_type: str
+
+
+def sniff_content_type(head: bytes, fallback: Optional[str] = None) -> str:
+    """Guess the MIME type from the first bytes of a file."""
+    for signature, content_type in _SIGNATURES:
+        if head.startswith(signature):
+            return content_type
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return "image/webp"
+    if head[4:8] == b"ftyp" and head[8:12] in _HEIF_BRANDS:
+        return "image/heic"
+    return fallback or "application/octet-stream"
+
+
+class BlobStore(ABC):
+    """
+    Content addressed storage for uploaded files.
+
+    Blobs are keyed by the hex SHA-256 of their bytes, so identical uploads
+    share one copy and a key never changes meaning once written.
+    """
+
+    def put(self, data: bytes) -> str:
+        return self.put_stream([data])[0]
+
+    @abstractmethod
+    def put_stream(self, chunks: Iterable[bytes], max_bytes: Optional[int] = None) -> tuple[str, int]:
+        """Store the concatenated chunks, returning (digest, size)."""
+
+    @abstractmethod
+    def path(self, digest: str) -> str:
+        ...
+
+    @abstractmethod
+    def exists(self, digest: str) -> bool:
+        ...
+
+    @abstractmethod
+    def variant_path(self, digest: str, variant: str) -> str:
+        """Where a file derived from blob `digest` (e.g. a thumbnail) is kept."""
+
+
+class LocalBlobStore(BlobStore):
+    """Blobs on the local filesystem under root/ab/cd/abcd…, two levels of fan-out."""
+
+    def __init__(self, root: str):
+        self.root = os.path.abspath(root)
+
+    def path(self, digest: str) -> str:
+        return os.path.join(self.root, digest[:2], digest[2:4], digest)
+
+    def exists(self, digest: str) -> bool:
+        return os.path.exists(self.path(digest))
+
+    def variant_path(self, digest: str, variant: str) -> str:
+        return f"{self.path(digest)}.{variant}"
+
+    def put_stream(self, chunks: Iterable[bytes], max_bytes: Optional[int] = None) -> tuple[str, int]:
+        # the digest is only known at the end, so spool into a scratch file on
+        # the same filesystem and rename it into place; readers never see
+        # half a file and memory use is one chunk
+        incoming = os.path.join(self.root, ".incoming")
+        os.makedirs(incoming, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=incoming)
+        hasher = hashlib.sha256()
+        size = 0
+        try:
+            with os.fdopen(fd, "wb") as tmp:
+                for chunk in chunks:
+                    size += len(chunk)
+                    if max_bytes is not None and size > max_bytes:
+                        raise BlobTooLarge(max_bytes)
+                    hasher.update(chunk)
+                    tmp.write(chunk)
+            digest = hasher.hexdigest()
+            target = self.path(digest)
+            if os.path.exists(target):
+                os.unlink(tmp_path)
+            else:
+                os.makedirs(os.path.dirname(target), exist_ok=True)
+                os.replace(tmp_path, target)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+            raise
+        return digest, size
+
+
+@lru_cache
+def get_blob_store() -> BlobStore:
+    return LocalBlobStore(BLOB_STORE_DIR)
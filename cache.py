@@ -0,0 +1,236 @@
+"""
+Read-through cache for rendered JSON responses.
+
+Entries are keyed by route and parameters and carry a set of tags, e.g. a
+product page is tagged "product:<id>" and a supplier's listing
+"supplier:<id>". Each tag has a version. The versions of an entry's tags
+are read before the database is queried and are part of the key. A write
+bumps the tags it touched *after* committing, so anything rendered from
+older rows is never looked up again and ages out through the TTL/LRU. No
+scan for affected keys is needed.
+
+A version number is never handed out twice for a tag: every bump takes the
+next value of one backend-wide counter, so a tag that was forgotten and
+bumped again cannot land back on a version some live entry was stored under.
+
+Backends:
+
+  * memory (default): a per-process LRU with a TTL. Invalidations are only
+    seen by the process that made them, so it refuses to start when
+    WEB_CONCURRENCY asks for more than one worker (unless CACHE_TTL_SECONDS
+    is 0, which turns caching off). Run several workers through
+    WEB_CONCURRENCY rather than `uvicorn --workers`, which this can't see.
+  * redis (CACHE_URL=redis://host:6379/0): any server speaking the Redis
+    protocol, and the backend to use with several workers. Entries and tag
+    versions are shared, so an invalidation from one worker applies to all
+    of them.
+
+A backend that errors is treated as a miss and the database answers, so
+the cache can make reads faster but not break them.
+"""
+import itertools
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Iterable, Optional
+
+from fastapi import Response
+
+logger = logging.getLogger(__name__)
+
+CACHE_URL = os.getenv("CACHE_URL", "memory://")
+CACHE_TTL_SECONDS = float(os.getenv("CACHE_TTL_SECONDS", "60"))
+CACHE_MAX_ENTRIES = int(os.getenv("CACHE_MAX_ENTRIES", "10000"))
+CACHE_NAMESPACE = os.getenv("CACHE_NAMESPACE", "boneka")
+WEB_CONCURRENCY = int(os.getenv("WEB_CONCURRENCY", "1"))
+
+
+class MemoryBackend:
+    """LRU of (deadline, value) plus the tag versions, guarded by one lock."""
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, tuple[float, bytes]]" = OrderedDict()
+        # tag -> (version, monotonic time of the last bump)
+        self._versions: dict[str, tuple[int, float]] = {}
+        # versions come from here, so no tag ever gets the same one twice
+        self._clock = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[bytes]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            deadline, value = entry
+            if deadline <= time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: bytes, ttl: float) -> None:
+        with self._lock:
+            self._entries[key] = (time.monotonic() + ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def versions(self, tags: list[str]) -> list[int]:
+        with self._lock:
+            return [self._versions.get(tag, (0, 0.0))[0] for tag in tags]
+
+    def bump(self, tags: Iterable[str], ttl: float) -> None:
+        now = time.monotonic()
+        with self._lock:
+            for tag in tags:
+                self._versions[tag] = (next(self._clock), now)
+            if len(self._versions) > self.max_entries:
+                self._forget_versions(now - 2 * ttl)
+
+    def _forget_versions(self, before: float) -> None:
+        # a forgotten tag reads as 0 again, which is only safe because every
+        # entry stored under 0 before its first bump expired long ago, and
+        # its next bump draws a version from the clock it has never had
+        for tag in [tag for tag, (_, bumped) in self._versions.items() if bumped < before]:
+            del self._versions[tag]
+
+
+class RedisBackend:
+    """Entries and tag versions in a Redis-protocol server shared by all workers."""
+
+    def __init__(self, url: str, namespace: str):
+        try:
+            import redis
+        except ImportError as exc:
+            raise RuntimeError("CACHE_URL points at redis but the `redis` package is not installed") from exc
+        self.client = redis.Redis.from_url(url, socket_timeout=0.25, socket_connect_timeout=0.25)
+        self.prefix = f"{namespace}:tag:"
+        # never expires, so versions keep growing across tag expiries
+        self.clock = f"{namespace}:tag-clock"
+
+    def get(self, key: str) -> Optional[bytes]:
+        return self.client.get(key)
+
+    def set(self, key: str, value: bytes, ttl: float) -> None:
+        self.client.set(key, value, px=int(ttl * 1000))
+
+    def versions(self, tags: list[str]) -> list[int]:
+        return [int(v or 0) for v in self.client.mget([self.prefix + tag for tag in tags])]
+
+    def bump(self, tags: Iterable[str], ttl: float) -> None:
+        # same reasoning as MemoryBackend._forget_versions: an idle tag may
+        # expire because its next version comes from the shared clock
+        tags = list(tags)
+        last = self.client.incrby(self.clock, len(tags))
+        pipe = self.client.pipeline(transaction=False)
+        for version, tag in enumerate(tags, start=last - len(tags) + 1):
+            pipe.set(self.prefix + tag, version, px=int(ttl * 2000) + 60_000)
+        pipe.execute()
+
+
+def backend_from_url(
+    url: str, namespace: str, max_entries: int, ttl: float = CACHE_TTL_SECONDS, workers: int = WEB_CONCURRENCY,
+):
+    if url.startswith(("redis://", "rediss://", "unix://")):
+        return RedisBackend(url, namespace)
+    if url.startswith("memory://"):
+        if workers > 1 and ttl > 0:
+            raise RuntimeError(
+                f"the memory cache would serve stale pages across {workers} workers; "
+                "set CACHE_URL to a redis:// server or CACHE_TTL_SECONDS=0"
+            )
+        return MemoryBackend(max_entries)
+    raise ValueError(f"unsupported CACHE_URL {url!r}")
+
+
+class ResponseCache:
+    """Rendered JSON bodies keyed by route, parameters and tag versions, with hit/miss counters."""
+
+    def __init__(self, backend, namespace: str, ttl: float):
+        self.backend = backend
+        self.namespace = namespace
+        self.ttl = ttl
+        self.stats = {"hits": 0, "misses": 0, "stores": 0, "bypasses": 0, "invalidations": 0, "errors": 0}
+        self._stats_lock = threading.Lock()
+
+    def _count(self, name: str) -> None:
+        with self._stats_lock:
+            self.stats[name] += 1
+
+    def _key(self, route: str, params: tuple, tags: list[str]) -> str:
+        versions = self.backend.versions(tags)
+        rendered = "&".join("" if p is None else str(p) for p in params)
+        return f"{self.namespace}:{route}?{rendered}|" + ".".join(map(str, versions))
+
+    def get_or_render(
+        self, route: str, params: tuple, tags: list[str], render: Callable[[], bytes], bypass: bool = False,
+    ) -> tuple[bytes, bool]:
+        """
+        The cached body for (route, params), or render() stored under `tags`.
+
+        Exceptions from render(), such as a 404, propagate and nothing is cached.
+        With `bypass` the cache is neither read nor written, for callers that
+        must see the primary (database.reads_primary): a replica read cached
+        under the versions their own write bumped would hand them stale rows.
+        """
+        if bypass:
+            self._count("bypasses")
+            return render(), False
+        try:
+            key = self._key(route, params, tags)
+            body = self.backend.get(key)
+        except Exception:
+            logger.warning("cache read failed for %s", route, exc_info=True)
+            self._count("errors")
+            return render(), False
+        if body is not None:
+            self._count("hits")
+            return body, True
+        self._count("misses")
+        body = render()
+        try:
+            self.backend.set(key, body, self.ttl)
+            self._count("stores")
+        except Exception:
+            logger.warning("cache write failed for %s", route, exc_info=True)
+            self._count("errors")
+        return body, False
+
+    def response(
+        self, route: str, params: tuple, tags: list[str], render: Callable[[], bytes], bypass: bool = False,
+    ) -> Response:
+        body, hit = self.get_or_render(route, params, tags, render, bypass)
+        state = "BYPASS" if bypass else "HIT" if hit else "MISS"
+        return Response(body, media_type="application/json", headers={"X-Cache": state})
+
+    def invalidate(self, *tags: str) -> None:
+        """Make every entry tagged with any of `tags` unreachable; call after the commit."""
+        tags = {tag for tag in tags if tag}
+        if not tags:
+            return
+        try:
+            self.backend.bump(tags, self.ttl)
+            self._count("invalidations")
+        except Exception:
+            # nothing else to do: entries expire on their own within the TTL
+            logger.error("cache invalidation failed for %s", sorted(tags), exc_info=True)
+            self._count("errors")
+
+    def snapshot(self) -> dict:
+        with self._stats_lock:
+            stats = dict(self.stats)
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_ratio"] = round(stats["hits"] / lookups, 4) if lookups else None
+        stats["backend"] = type(self.backend).__name__
+        stats["ttl_seconds"] = self.ttl
+        if isinstance(self.backend, MemoryBackend):
+            stats["entries"] = len(self.backend._entries)
+        return stats
+
+
+response_cache = ResponseCache(
+    backend_from_url(CACHE_URL, CACHE_NAMESPACE, CACHE_MAX_ENTRIES), CACHE_NAMESPACE, CACHE_TTL_SECONDS,
+)
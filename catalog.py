@@ -0,0 +1,238 @@
+"""
+Bookkeeping that has to follow every product write.
+
+Routers call these inside the same unit of work as the product insert,
+update or delete, so the derived rows commit (or roll back) with it.
+"""
+from typing import Optional
+from uuid import UUID
+
+from sqlalchemy import delete, exists, func, insert, select, update
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session
+
+from models import Category, Counter, Product, ProductImage, RequestPost, SupplierCategory, User
+
+PRODUCTS_COUNTER = "products"
+MAX_PRODUCT_IMAGES = 4
+
+
+def dialect_insert(db: Session, table):
+    """INSERT that supports ON CONFLICT on the database behind `db`."""
+    if db.get_bind().dialect.name == "postgresql":
+        return postgresql.insert(table)
+    return sqlite.insert(table)
+
+
+def canonical_category(name: str) -> str:
+    """Collapse whitespace and case, so "Home  Decor " and "home decor" match."""
+    return " ".join(name.split()).casefold()
+
+
+def category_id_of(db: Session, name: str) -> Optional[int]:
+    """
+    Id of an existing category, for filters; None if nothing uses the name.
+
+    Callers must not filter on a None id: `category_id == None` is IS NULL
+    and matches the rows backfill-categories has not linked yet.
+    """
+    canonical = canonical_category(name)
+    if not canonical:
+        return None
+    return db.scalar(select(Category.id).where(Category.name == canonical))
+
+
+def _require_name(canonical: str) -> str:
+    if not canonical:
+        raise ValueError("category name is blank")
+    return canonical
+
+
+def get_or_create_category(db: Session, name: str) -> int:
+    """Id of the category `name` belongs to, creating it on first use; a blank name is a ValueError."""
+    canonical = _require_name(canonical_category(name))
+    table = Category.__table__
+    # DO NOTHING keeps two writers introducing the same category from colliding
+    db.execute(
+        dialect_insert(db, table)
+        .values(name=canonical, display_name=" ".join(name.split()))
+        .on_conflict_do_nothing(index_elements=[table.c.name])
+    )
+    return db.scalar(select(Category.id).where(Category.name == canonical))
+
+
+def get_or_create_categories(db: Session, names) -> dict[str, int]:
+    """get_or_create_category for many names at once: {name as given: id}."""
+    canonical = {name: _require_name(canonical_category(name)) for name in names}
+    if not canonical:
+        return {}
+    table = Category.__table__
+    display = {}
+    for name, key in canonical.items():
+        display.setdefault(key, " ".join(name.split()))
+    db.execute(
+        dialect_insert(db, table).on_conflict_do_nothing(index_elements=[table.c.name]),
+        [{"name": key, "display_name": shown} for key, shown in display.items()],
+    )
+    ids = dict(db.execute(select(Category.name, Category.id).where(Category.name.in_(display))).all())
+    return {name: ids[key] for name, key in canonical.items()}
+
+
+def add_supplier_category(db: Session, supplier_id: UUID, category_id: int, count: int = 1) -> None:
+    table = SupplierCategory.__table__
+    statement = (
+        dialect_insert(db, table)
+        .values(supplier_id=supplier_id, category_id=category_id, product_count=count)
+        .on_conflict_do_update(
+            index_elements=[table.c.supplier_id, table.c.category_id],
+            set_={"product_count": table.c.product_count + count},
+        )
+    )
+    db.execute(statement)
+
+
+def add_supplier_categories(db: Session, supplier_id: UUID, counts: dict[int, int]) -> None:
+    """add_supplier_category for several categories in one statement: {category_id: count}."""
+    if not counts:
+        return
+    table = SupplierCategory.__table__
+    statement = dialect_insert(db, table)
+    db.execute(
+        statement.on_conflict_do_update(
+            index_elements=[table.c.supplier_id, table.c.category_id],
+            set_={"product_count": table.c.product_count + statement.excluded.product_count},
+        ),
+        [
+            {"supplier_id": supplier_id, "category_id": category_id, "product_count": count}
+            for category_id, count in counts.items()
+        ],
+    )
+
+
+def remove_supplier_category(db: Session, supplier_id: UUID, category_id: int, count: int = 1) -> None:
+    match = (SupplierCategory.supplier_id == supplier_id) & (SupplierCategory.category_id == category_id)
+    db.execute(
+        update(SupplierCategory)
+        .where(match)
+        .values(product_count=SupplierCategory.product_count - count)
+        .execution_options(synchronize_session=False)
+    )
+    db.execute(
+        delete(SupplierCategory)
+        .where(match, SupplierCategory.product_count <= 0)
+        .execution_options(synchronize_session=False)
+    )
+
+
+def add_products(db: Session, supplier_id: Optional[UUID], count: int = 1) -> None:
+    """Count `count` new products (negative when deleting) for the supplier and the total."""
+    if supplier_id is not None:
+        db.execute(
+            update(User)
+            .where(User.id == supplier_id)
+            .values(product_count=User.product_count + count)
+            .execution_options(synchronize_session=False)
+        )
+    table = Counter.__table__
+    db.execute(
+        dialect_insert(db, table)
+        .values(name=PRODUCTS_COUNTER, value=count)
+        .on_conflict_do_update(index_elements=[table.c.name], set_={"value": table.c.value + count})
+    )
+
+
+def product_total(db: Session) -> int:
+    return db.scalar(select(Counter.value).where(Counter.name == PRODUCTS_COUNTER)) or 0
+
+
+def supplier_product_count(db: Session, supplier_id: UUID) -> int:
+    return db.scalar(select(User.product_count).where(User.id == supplier_id)) or 0
+
+
+def claim_image_slot(product_id: UUID):
+    """
+    UPDATE taking one of the product's image slots; it matches no row once
+    the product has MAX_PRODUCT_IMAGES, so concurrent uploads can't overshoot.
+    Execute it in the unit of work that inserts the image.
+    """
+    return (
+        update(Product)
+        .where(Product.id == product_id, Product.image_count < MAX_PRODUCT_IMAGES)
+        .values(image_count=Product.image_count + 1)
+        .execution_options(synchronize_session=False)
+    )
+
+
+def supplier_carries(db: Session, supplier_id: UUID, category_id: Optional[int]) -> bool:
+    """Single-row primary key probe instead of loading the supplier's catalog."""
+    return db.query(
+        exists().where(SupplierCategory.supplier_id == supplier_id, SupplierCategory.category_id == category_id)
+    ).scalar()
+
+
+def rebuild_supplier_categories(db: Session) -> int:
+    """Recompute supplier_categories from products, e.g. after a backfill."""
+    db.execute(delete(SupplierCategory))
+    counts = (
+        select(Product.supplier_id, Product.category_id, func.count())
+        .where(Product.supplier_id.isnot(None), Product.category_id.isnot(None))
+        .group_by(Product.supplier_id, Product.category_id)
+    )
+    db.execute(
+        insert(SupplierCategory).from_select(["supplier_id", "category_id", "product_count"], counts)
+    )
+    db.commit()
+    return db.query(func.count()).select_from(SupplierCategory).scalar()
+
+
+def backfill_categories(db: Session) -> int:
+    """Point products and requests saved before categories existed at their category."""
+    filled = 0
+    for model in (Product, RequestPost):
+        names = db.scalars(
+            select(model.category).distinct().where(model.category_id.is_(None), model.category.isnot(None))
+        ).all()
+        for name in names:
+            if not name.strip():
+                continue
+            category_id = get_or_create_category(db, name)
+            filled += db.execute(
+                update(model)
+                .where(model.category == name, model.category_id.is_(None))
+                .values(category_id=category_id)
+                .execution_options(synchronize_session=False)
+            ).rowcount
+        db.commit()
+    return filled
+
+
+def reconcile_counters(db: Session) -> dict[str, int]:
+    """
+    Recompute every maintained counter from the rows it counts and repair
+    the ones that drifted, e.g. after writes that bypassed the routers.
+    Returns how many rows were corrected per counter.
+    """
+    images = (
+        select(func.count(ProductImage.id)).where(ProductImage.product_id == Product.id).scalar_subquery()
+    )
+    products = select(func.count(Product.id)).where(Product.supplier_id == User.id).scalar_subquery()
+    fixed = {
+        "products.image_count": db.execute(
+            update(Product).where(Product.image_count != images).values(image_count=images)
+            .execution_options(synchronize_session=False)
+        ).rowcount,
+        "users.product_count": db.execute(
+            update(User).where(User.product_count != products).values(product_count=products)
+            .execution_options(synchronize_session=False)
+        ).rowcount,
+    }
+    total = db.scalar(select(func.count(Product.id)))
+    fixed[PRODUCTS_COUNTER] = int(product_total(db) != total)
+    table = Counter.__table__
+    db.execute(
+        dialect_insert(db, table)
+        .values(name=PRODUCTS_COUNTER, value=total)
+        .on_conflict_do_update(index_elements=[table.c.name], set_={"value": total})
+    )
+    db.commit()
+    return fixed
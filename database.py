@@ -1,19 +1,219 @@
-from sqlalchemy import create_engine
+"""
+Engines and sessions, configured from the environment:
+
+    DATABASE_URL            sqlite:///./boneka.db (postgresql://... in prod)
+    DB_POOL_SIZE            connections kept open per engine (5)
+    DB_MAX_OVERFLOW         extra connections allowed under load (10)
+    DB_POOL_TIMEOUT         seconds to wait for a free connection (30)
+    DB_POOL_RECYCLE         reopen connections older than this, -1 = never (1800)
+    DB_POOL_PRE_PING        test a connection before handing it out (true)
+
+SQLite file databases get these on every connection, so readers don't wait
+for the writer and a busy writer is waited for instead of failing with
+"database is locked":
+
+    SQLITE_JOURNAL_MODE     WAL
+    SQLITE_SYNCHRONOUS      NORMAL (safe with WAL; a power cut can lose the last commits)
+    SQLITE_MMAP_SIZE        bytes of the file to memory-map (268435456)
+    SQLITE_CACHE_SIZE       page cache, negative = KiB (-65536)
+    SQLITE_BUSY_TIMEOUT_MS  how long to wait for a lock (5000)
+
+The sync and the async engine share the settings, each with its own pool.
+
+Reads can go to a replica:
+
+    DATABASE_REPLICA_URL      optional; routes that only read use it through
+                              get_read_db / get_async_read_db
+    READ_YOUR_WRITES_SECONDS  after a client writes, its reads go to the
+                              primary for this long (10); see
+                              middleware.ReadYourWritesMiddleware
+
+A response rendered from a lagging replica can be cached (cache.py) and
+served until CACHE_TTL_SECONDS even after the write reaches the replica, so
+keep the TTL in mind when sizing replica lag.
+
+Without a replica the read dependencies hand out primary sessions. For local
+testing a second SQLite file refreshed by `python manage.py snapshot-replica`
+stands in for one.
+"""
+import logging
+import os
+
+from fastapi import Request
+from sqlalchemy import create_engine, event, make_url, pool
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 
-SQLALCHEMY_DATABASE_URL = "sqlite:///./boneka.db"  # switch to PostgreSQL in prod
+logger = logging.getLogger(__name__)
 
-engine = create_engine(
-    SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False}
-)
+SQLALCHEMY_DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./boneka.db")  # switch to PostgreSQL in prod
+DATABASE_REPLICA_URL = os.getenv("DATABASE_REPLICA_URL") or None
+READ_YOUR_WRITES_SECONDS = float(os.getenv("READ_YOUR_WRITES_SECONDS", "10"))
+
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "true").lower() in ("1", "true", "yes")
+
+SQLITE_PRAGMAS = {
+    # first, so switching the journal mode waits out a lock too
+    "busy_timeout": int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000")),
+    "journal_mode": os.getenv("SQLITE_JOURNAL_MODE", "WAL"),
+    "synchronous": os.getenv("SQLITE_SYNCHRONOUS", "NORMAL"),
+    "mmap_size": int(os.getenv("SQLITE_MMAP_SIZE", str(256 * 1024 * 1024))),
+    "cache_size": int(os.getenv("SQLITE_CACHE_SIZE", "-65536")),
+}
+
+
+def is_sqlite(url: str) -> bool:
+    return make_url(url).get_backend_name() == "sqlite"
+
+
+def _is_sqlite_file(url: str) -> bool:
+    database = make_url(url).database
+    return is_sqlite(url) and bool(database) and database != ":memory:" and "mode=memory" not in url
+
+
+def engine_options(url: str, is_async: bool = False) -> dict:
+    """create_engine() keyword arguments for `url` from the DB_* settings."""
+    options = {"pool_pre_ping": DB_POOL_PRE_PING}
+    if is_sqlite(url):
+        options["connect_args"] = {"check_same_thread": False} if not is_async else {}
+        if not _is_sqlite_file(url):
+            # in-memory databases live and die with their single connection
+            return options
+        if is_async:
+            # aiosqlite defaults to opening a connection per checkout
+            options["poolclass"] = pool.AsyncAdaptedQueuePool
+    options.update(
+        pool_size=DB_POOL_SIZE,
+        max_overflow=DB_MAX_OVERFLOW,
+        pool_timeout=DB_POOL_TIMEOUT,
+        pool_recycle=DB_POOL_RECYCLE,
+    )
+    return options
+
+
+def apply_sqlite_pragmas(dbapi_connection, connection_record) -> None:
+    cursor = dbapi_connection.cursor()
+    try:
+        for name, value in SQLITE_PRAGMAS.items():
+            cursor.execute(f"PRAGMA {name}={value}")
+    finally:
+        cursor.close()
+
+
+def configure(sync_engine) -> None:
+    """Hook the per-connection setup onto an engine (the sync_engine of an async one)."""
+    if _is_sqlite_file(str(sync_engine.url)):
+        event.listen(sync_engine, "connect", apply_sqlite_pragmas)
+
+
+def _read_pragmas(connection) -> dict:
+    return {name: connection.exec_driver_sql(f"PRAGMA {name}").scalar() for name in SQLITE_PRAGMAS}
+
+
+def _describe_pool(sync_engine) -> dict:
+    settings = {
+        "url": sync_engine.url.render_as_string(hide_password=True),
+        "pool": type(sync_engine.pool).__name__,
+        "pre_ping": DB_POOL_PRE_PING,
+    }
+    if isinstance(sync_engine.pool, pool.QueuePool):
+        settings.update(
+            size=sync_engine.pool.size(),
+            max_overflow=sync_engine.pool._max_overflow,
+            timeout=sync_engine.pool.timeout(),
+            recycle=sync_engine.pool._recycle,
+        )
+    return settings
+
+
+engine = create_engine(SQLALCHEMY_DATABASE_URL, **engine_options(SQLALCHEMY_DATABASE_URL))
+configure(engine)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 Base = declarative_base()
 
+
+def async_database_url(url: str) -> str:
+    """Same database, reached through an asyncio driver (aiosqlite / asyncpg)."""
+    if url.startswith("sqlite://"):
+        return "sqlite+aiosqlite://" + url[len("sqlite://"):]
+    if url.startswith(("postgresql://", "postgres://")):
+        return "postgresql+asyncpg://" + url.split("://", 1)[1]
+    return url
+
+
+# used by the `async def` routes so queries don't block the event loop
+async_engine = create_async_engine(
+    async_database_url(SQLALCHEMY_DATABASE_URL), **engine_options(SQLALCHEMY_DATABASE_URL, is_async=True),
+)
+configure(async_engine.sync_engine)
+AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+
+if DATABASE_REPLICA_URL:
+    read_engine = create_engine(DATABASE_REPLICA_URL, **engine_options(DATABASE_REPLICA_URL))
+    configure(read_engine)
+    async_read_engine = create_async_engine(
+        async_database_url(DATABASE_REPLICA_URL), **engine_options(DATABASE_REPLICA_URL, is_async=True),
+    )
+    configure(async_read_engine.sync_engine)
+else:
+    read_engine, async_read_engine = engine, async_engine
+ReadSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=read_engine)
+AsyncReadSessionLocal = async_sessionmaker(async_read_engine, autoflush=False, expire_on_commit=False)
+
+
+async def log_settings() -> None:
+    """Log the pool and, on SQLite, the pragmas each engine ended up with; called at startup."""
+    engines = [("primary", engine, async_engine)]
+    if DATABASE_REPLICA_URL:
+        engines.append(("replica", read_engine, async_read_engine))
+    for label, sync_engine, async_engine_ in engines:
+        sqlite_file = _is_sqlite_file(str(sync_engine.url))
+        settings = _describe_pool(sync_engine)
+        if sqlite_file:
+            with sync_engine.connect() as connection:
+                settings.update(_read_pragmas(connection))
+        logger.info("database (%s): %s", label, settings)
+
+        settings = _describe_pool(async_engine_.sync_engine)
+        if sqlite_file:
+            async with async_engine_.connect() as connection:
+                settings.update(await connection.run_sync(_read_pragmas))
+        logger.info("database (%s, async): %s", label, settings)
+
 def get_db():
     db = SessionLocal()
     try:
         yield db
     finally:
         db.close()
-        
\ No newline at end of file
+
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
+
+
+def reads_primary(request: Request) -> bool:
+    """Whether this request's reads must see the primary (set by ReadYourWritesMiddleware)."""
+    return getattr(request.state, "read_primary", False)
+
+
+# for routes that only read; may lag the primary by the replica's delay
+def get_read_db(request: Request):
+    db = (SessionLocal if reads_primary(request) else ReadSessionLocal)()
+    try:
+        yield db
+    finally:
+        db.close()
+
+def async_read_session(request: Request) -> async_sessionmaker:
+    """Session factory for this request's reads, for code that outlives its dependencies."""
+    return AsyncSessionLocal if reads_primary(request) else AsyncReadSessionLocal
+
+async def get_async_read_db(request: Request):
+    async with async_read_session(request)() as db:
+        yield db
@@ -0,0 +1,94 @@
+"""
+Geohash cells for supplier locations.
+
+Every supplier row carries the geohash of its coordinates. Nearby cells share
+a prefix, so "everything inside this box" becomes a few index range scans on
+users(role, geohash) instead of a pass over every supplier.
+"""
+import math
+from typing import Optional
+
+import numpy as np
+
+GEOHASH_PRECISION = 7  # ~150 m cells
+EARTH_RADIUS_KM = 6371.0088
+KM_PER_DEGREE = 111.32
+
+_BASE32 = "0123456789bcdefghjkmnpqrstuvwxyz"
+
+
+def geohash(lat: Optional[float], lon: Optional[float], precision: int = GEOHASH_PRECISION) -> Optional[str]:
+    if lat is None or lon is None:
+        return None
+    lat_range, lon_range = [-90.0, 90.0], [-180.0, 180.0]
+    chars, bits, value, even = [], 0, 0, True
+    while len(chars) < precision:
+        # bits alternate longitude, latitude, starting with longitude
+        rng, coordinate = (lon_range, lon) if even else (lat_range, lat)
+        mid = (rng[0] + rng[1]) / 2
+        value <<= 1
+        if coordinate >= mid:
+            value |= 1
+            rng[0] = mid
+        else:
+            rng[1] = mid
+        even = not even
+        bits += 1
+        if bits == 5:
+            chars.append(_BASE32[value])
+            bits, value = 0, 0
+    return "".join(chars)
+
+
+def _cell_size(precision: int) -> tuple[float, float]:
+    """(height, width) of a cell in degrees."""
+    lon_bits = math.ceil(5 * precision / 2)
+    lat_bits = 5 * precision - lon_bits
+    return 180.0 / 2 ** lat_bits, 360.0 / 2 ** lon_bits
+
+
+def bounding_box(lat: float, lon: float, radius_km: float) -> tuple[float, float, float, float]:
+    """(min_lat, max_lat, min_lon, max_lon) around a point; longitudes may leave [-180, 180]."""
+    dlat = radius_km / KM_PER_DEGREE
+    dlon = min(radius_km / (KM_PER_DEGREE * max(math.cos(math.radians(lat)), 1e-6)), 180.0)
+    return max(lat - dlat, -90.0), min(lat + dlat, 90.0), lon - dlon, lon + dlon
+
+
+def covering_prefixes(lat: float, lon: float, radius_km: float) -> list[str]:
+    """
+    Geohash prefixes whose cells together cover the circle's bounding box.
+
+    Picks the finest precision whose cells are at least as big as the box, so
+    the four corners land in at most four distinct cells that cover it all.
+    An empty list means the box is too large to narrow down.
+    """
+    min_lat, max_lat, min_lon, max_lon = bounding_box(lat, lon, radius_km)
+    precision = 0
+    for candidate in range(GEOHASH_PRECISION, 0, -1):
+        height, width = _cell_size(candidate)
+        if height >= max_lat - min_lat and width >= max_lon - min_lon:
+            precision = candidate
+            break
+    if precision == 0:
+        return []
+    corners = [(la, (lo + 180.0) % 360.0 - 180.0) for la in (min_lat, max_lat) for lo in (min_lon, max_lon)]
+    return sorted({geohash(min(la, 90.0 - 1e-9), lo, precision) for la, lo in corners})
+
+
+def haversine_km(lat: float, lon: float, lats: np.ndarray, lons: np.ndarray) -> np.ndarray:
+    """Great-circle distance from one point to many, vectorized."""
+    lat1, lon1 = math.radians(lat), math.radians(lon)
+    lat2, lon2 = np.radians(lats), np.radians(lons)
+    a = np.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+
+def nearest(lat: float, lon: float, lats: np.ndarray, lons: np.ndarray, radius_km: float, k: int) -> tuple[np.ndarray, np.ndarray]:
+    """Indices and distances of the k closest points within radius_km, closest first."""
+    distances = haversine_km(lat, lon, lats, lons)
+    inside = np.flatnonzero(distances <= radius_km)
+    if len(inside) > k:
+        # partial selection is O(n); only the k winners get sorted
+        inside = inside[np.argpartition(distances[inside], k - 1)[:k]]
+    order = inside[np.argsort(distances[inside], kind="stable")]
+    return order, distances[order]
@@ -0,0 +1,122 @@
+import os
+from typing import Literal, Optional
+
+from fastapi import HTTPException, Request, Response, UploadFile
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import FileResponse
+
+from blob_store import BlobStore, BlobTooLarge, StoredBlob, sniff_content_type
+from thumbnails import VARIANT_FORMATS, schedule_variants, variant_name
+
+# largest image a client may upload, enforced while the body is read
+MAX_UPLOAD_BYTES = int(os.getenv("MAX_UPLOAD_BYTES", str(10 * 1024 * 1024)))
+UPLOAD_CHUNK_SIZE = 256 * 1024
+
+# values accepted by ?size= on the image GET routes
+ImageSize = Literal["thumb", "medium", "full"]
+
+# formats Pillow can decode without extra plugins
+_RESIZABLE_TYPES = {"image/jpeg", "image/png", "image/gif", "image/webp"}
+
+
+def _too_large() -> HTTPException:
+    return HTTPException(status_code=413, detail=f"file larger than {MAX_UPLOAD_BYTES} bytes")
+
+
+async def store_upload(file: UploadFile, store: BlobStore) -> StoredBlob:
+    """
+    Copy an uploaded file into the blob store chunk by chunk.
+
+    The bytes are hashed as they are copied and never held in memory as a
+    whole; the copy stops with a 413 as soon as MAX_UPLOAD_BYTES is passed.
+    """
+    if file.size is not None and file.size > MAX_UPLOAD_BYTES:
+        raise _too_large()
+
+    head = b""
+
+    def chunks():
+        nonlocal head
+        while chunk := file.file.read(UPLOAD_CHUNK_SIZE):
+            if not head:
+                head = chunk[:16]
+            yield chunk
+
+    try:
+        digest, size = await run_in_threadpool(store.put_stream, chunks(), MAX_UPLOAD_BYTES)
+    except BlobTooLarge:
+        raise _too_large()
+    return StoredBlob(
+        sha256=digest,
+        size=size,
+        content_type=sniff_content_type(head, file.content_type),
+    )
+
+
+def queue_variants(blob: StoredBlob, store: BlobStore) -> None:
+    """Start building the resized copies of a freshly stored upload."""
+    if blob.content_type in _RESIZABLE_TYPES:
+        schedule_variants(store, blob.sha256)
+
+
+# image rows never change their bytes, so URLs keyed by image id can be cached
+# forever; URLs keyed by user (profile pictures) must be revalidated
+IMMUTABLE = "public, max-age=31536000, immutable"
+REVALIDATE = "no-cache"
+
+
+def _etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    candidates = (tag.strip().removeprefix("W/") for tag in if_none_match.split(","))
+    return etag in candidates
+
+
+def _file_or_not_modified(request: Request, path: str, media_type: str, headers: dict) -> Response:
+    if _etag_matches(request.headers.get("if-none-match"), headers["ETag"]):
+        return Response(status_code=304, headers=headers)
+    return FileResponse(path, media_type=media_type, headers=headers)
+
+
+def image_response(
+    image,
+    store: BlobStore,
+    request: Request,
+    size: Optional[ImageSize] = None,
+    immutable: bool = True,
+) -> Response:
+    """
+    Serve an image row (ProductImage, RequestImage or ProfileImage).
+
+    The content hash stored at upload time is the ETag, so a client that
+    already has the file gets a 304 without the blob being opened. Files go
+    out through FileResponse, which answers Range requests and lets the
+    server use sendfile. With `size` the precomputed variant is sent, WebP
+    when the client accepts it and JPEG otherwise; until the variant exists
+    the original is sent, uncached. Rows that have not been moved to the
+    blob store yet are served from the legacy column without validators.
+    """
+    if image.sha256 is None:
+        data = image.image_data
+        if data is None:
+            # neither in the blob store nor in the legacy column
+            raise HTTPException(status_code=404, detail="Image not found")
+        return Response(content=data, media_type=sniff_content_type(data[:16]))
+
+    cache_control = IMMUTABLE if immutable else REVALIDATE
+    if size is not None and image.content_type in _RESIZABLE_TYPES:
+        fmt = "webp" if "image/webp" in request.headers.get("accept", "") else "jpeg"
+        name = variant_name(size, fmt)
+        path = store.variant_path(image.sha256, name)
+        if os.path.exists(path):
+            headers = {"ETag": f'"{image.sha256}.{name}"', "Cache-Control": cache_control, "Vary": "Accept"}
+            return _file_or_not_modified(request, path, VARIANT_FORMATS[fmt][1], headers)
+        # uploaded before variants existed, or the pool has not caught up yet;
+        # don't let caches pin the full size original to the variant URL
+        schedule_variants(store, image.sha256)
+        cache_control = REVALIDATE
+
+    headers = {"ETag": f'"{image.sha256}"', "Cache-Control": cache_control}
+    return _file_or_not_modified(request, store.path(image.sha256), image.content_type, headers)
@@ -0,0 +1,71 @@
+"""
+Batched, per-request lookups by primary key (the DataLoader pattern).
+
+A route that needs many rows by id asks a Loader instead of querying once
+per id. The loader drops duplicate ids, answers the ones it already fetched
+during this request from memory and gets the rest with one
+`WHERE id IN (...)` query:
+
+    products = get_loader(request, db, Product).load_many(ids)
+
+Results come back in the order of `ids`, with None for ids that match no
+row. Loaders live on request.state, so everything a request loads through
+them is fetched at most once and nothing is shared between requests.
+"""
+from typing import Hashable, Iterable, Optional
+
+from fastapi import Request
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+# ids per IN list, well under SQLite's bound parameter limit
+IN_CHUNK = 500
+
+
+class Loader:
+    """Rows of `model` by primary key, optionally limited by extra `criteria`."""
+
+    def __init__(self, db: Session, model, *criteria):
+        self.db = db
+        self.model = model
+        self.criteria = criteria
+        self.key = model.__mapper__.primary_key[0]
+        # id -> row, or None once the database said there is no such row
+        self._seen: dict = {}
+
+    def prime(self, rows: Iterable) -> None:
+        """Remember rows loaded some other way."""
+        for row in rows:
+            self._seen[getattr(row, self.key.key)] = row
+
+    def load_many(self, ids: Iterable[Hashable]) -> list[Optional[object]]:
+        ids = list(ids)
+        wanted = [i for i in dict.fromkeys(ids) if i not in self._seen]
+        for start in range(0, len(wanted), IN_CHUNK):
+            chunk = wanted[start:start + IN_CHUNK]
+            rows = self.db.scalars(select(self.model).where(self.key.in_(chunk), *self.criteria)).all()
+            self._seen.update(dict.fromkeys(chunk))
+            self.prime(rows)
+        return [self._seen[i] for i in ids]
+
+    def load(self, id: Hashable) -> Optional[object]:
+        return self.load_many([id])[0]
+
+
+def missing_ids(ids: list, rows: list) -> list:
+    """The ids load_many found no row for, each once, in request order."""
+    return list(dict.fromkeys(i for i, row in zip(ids, rows) if row is None))
+
+
+def get_loader(request: Request, db: Session, model, *criteria, name: str = "") -> Loader:
+    """
+    This request's loader for `model`; pass a `name` with `criteria` so
+    differently filtered loaders of one model don't share results.
+    """
+    loaders = getattr(request.state, "loaders", None)
+    if loaders is None:
+        loaders = request.state.loaders = {}
+    key = (model, name)
+    if key not in loaders or loaders[key].db is not db:
+        loaders[key] = Loader(db, model, *criteria)
+    return loaders[key]
@@ -0,0 +1,54 @@
+"""
+Eager-loading options derived from the response schemas.
+
+A route that returns ORM rows through a schema with nested models (OrderOut
+nests `request`) would otherwise lazy-load that relationship once per row
+while FastAPI serializes the response. eager_load() reads the schema's
+fields, finds the ones backed by a relationship on the model and loads them
+up front, so the number of queries stays fixed however many rows come back:
+
+    query = eager_load(db.query(Order), Order, OrderOut)
+
+Many-to-one relationships are joined into the main query; collections get
+one extra SELECT ... IN per level.
+"""
+import typing
+from functools import lru_cache
+
+from pydantic import BaseModel
+from sqlalchemy import inspect
+from sqlalchemy.orm import joinedload, selectinload
+
+
+def _nested_schema(annotation) -> type[BaseModel] | None:
+    """The model inside Optional[X], list[X] and friends, if there is one."""
+    if isinstance(annotation, type) and issubclass(annotation, BaseModel):
+        return annotation
+    for arg in typing.get_args(annotation):
+        schema = _nested_schema(arg)
+        if schema is not None:
+            return schema
+    return None
+
+
+@lru_cache(maxsize=None)
+def loader_options(model, schema: type[BaseModel]) -> tuple:
+    """Loader options covering every relationship `schema` serializes from `model`."""
+    relationships = inspect(model).relationships
+    options = []
+    for name, field in schema.model_fields.items():
+        relationship = relationships.get(field.alias or name)
+        nested = _nested_schema(field.annotation)
+        if relationship is None or nested is None:
+            continue
+        strategy = selectinload if relationship.uselist else joinedload
+        option = strategy(getattr(model, relationship.key))
+        children = loader_options(relationship.mapper.class_, nested)
+        options.append(option.options(*children) if children else option)
+    return tuple(options)
+
+
+def eager_load(query, model, schema: type[BaseModel]):
+    """Apply loader_options to a Query or Select returning `model` rows."""
+    options = loader_options(model, schema)
+    return query.options(*options) if options else query
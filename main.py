@@ -1,11 +1,51 @@
+import asyncio
+import logging
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
-from database import engine
-import models
-from routers import user, supplier,products,request,offer,auth,orders
+from fastapi.concurrency import run_in_threadpool
+from auth_tokens import LAST_USED_FLUSH_SECONDS, last_used
+from database import DATABASE_REPLICA_URL, READ_YOUR_WRITES_SECONDS, log_settings
+from images import MAX_UPLOAD_BYTES
+from middleware import ReadYourWritesMiddleware, UploadSizeLimitMiddleware
+from password_hashing import BCRYPT_ROUNDS, BCRYPT_TARGET_MS, password_hasher
+from request_feed import FEED_BROKER, request_feed, tail_outbox
+from routers import user, supplier,products,request,offer,auth,orders,metrics,admin
+from serialization import ORJSONResponse
+from thumbnails import shutdown_pool
 
-models.Base.metadata.create_all(bind=engine)
+logger = logging.getLogger(__name__)
 
-app = FastAPI()
+async def flush_token_usage():
+    while True:
+        await asyncio.sleep(LAST_USED_FLUSH_SECONDS)
+        try:
+            await run_in_threadpool(last_used.flush)
+        except Exception:
+            # the batch is kept and retried on the next tick
+            logger.exception("flushing token last_used failed")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # calibrate the bcrypt cost for this machine before taking traffic, unless
+    # the deployment pins one
+    if BCRYPT_ROUNDS:
+        password_hasher.rounds = BCRYPT_ROUNDS
+    else:
+        await run_in_threadpool(password_hasher.tune, BCRYPT_TARGET_MS)
+    await log_settings()
+    flusher = asyncio.create_task(flush_token_usage())
+    # request feed events from threadpool routes are delivered on this loop
+    request_feed.bind(asyncio.get_running_loop())
+    relay = asyncio.create_task(tail_outbox()) if FEED_BROKER == "outbox" else None
+    yield
+    flusher.cancel()
+    if relay is not None:
+        relay.cancel()
+    await run_in_threadpool(last_used.flush)
+    # stop the image resize workers with the app
+    shutdown_pool()
+
+app = FastAPI(lifespan=lifespan, default_response_class=ORJSONResponse)
 
 # add cors middleware 
 from fastapi.middleware.cors import CORSMiddleware
@@ -16,6 +56,11 @@ app.add_middleware(
     allow_methods=["*"],  # Allows all methods
     allow_headers=["*"],  # Allows all headers
 )
+# multipart framing adds a little on top of the file itself
+app.add_middleware(UploadSizeLimitMiddleware, max_bytes=MAX_UPLOAD_BYTES + 64 * 1024)
+if DATABASE_REPLICA_URL:
+    # reads go to the replica, except a client's own right after it wrote
+    app.add_middleware(ReadYourWritesMiddleware, window_seconds=READ_YOUR_WRITES_SECONDS)
 
 # add routers
 app.include_router(user.user_router, prefix="/users", tags=["users"])
@@ -25,6 +70,8 @@ app.include_router(request.request_router)
 app.include_router(offer.offer_router)
 app.include_router(auth.auth_router)
 app.include_router(orders.orders_router)
+app.include_router(metrics.metrics_router)
+app.include_router(admin.admin_router)
 
 if __name__ == "__main__":
     import uvicorn
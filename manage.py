@@ -0,0 +1,159 @@
+"""
+Maintenance commands, run next to the app:
+
+    python manage.py migrate
+    python manage.py migrate-blobs --batch-size 200
+    python manage.py rebuild-supplier-categories
+    python manage.py backfill-geohash
+    python manage.py backfill-categories
+    python manage.py reconcile-counters
+    python manage.py rebuild-daily-stats
+    python manage.py snapshot-replica --interval 5
+"""
+import argparse
+import os
+import sqlite3
+import time
+from contextlib import closing
+
+from alembic import command
+from alembic.config import Config
+
+from sqlalchemy import make_url
+from sqlalchemy.orm import undefer
+
+from blob_store import get_blob_store, sniff_content_type
+from catalog import backfill_categories, rebuild_supplier_categories, reconcile_counters
+from database import DATABASE_REPLICA_URL, SQLALCHEMY_DATABASE_URL, SessionLocal
+from geo import geohash
+from models import ProductImage, ProfileImage, RequestImage, User
+from stats import rebuild_daily_stats
+
+
+def migrate(revision: str) -> None:
+    """Apply schema migrations; same as `alembic upgrade <revision>`."""
+    command.upgrade(Config(os.path.join(os.path.dirname(os.path.abspath(__file__)), "alembic.ini")), revision)
+
+
+def migrate_blobs(batch_size: int) -> None:
+    """Move image bytes still stored in the database into the blob store."""
+    store = get_blob_store()
+    for model in (ProductImage, RequestImage, ProfileImage):
+        moved = 0
+        while True:
+            # a fresh session per batch keeps at most batch_size blobs in memory
+            with SessionLocal() as db:
+                rows = (
+                    db.query(model)
+                    .options(undefer(model.image_data))
+                    .filter(model.sha256.is_(None), model.image_data.isnot(None))
+                    .limit(batch_size)
+                    .all()
+                )
+                if not rows:
+                    break
+                for row in rows:
+                    data = row.image_data
+                    row.sha256 = store.put(data)
+                    row.size = len(data)
+                    row.content_type = sniff_content_type(data[:16])
+                    row.image_data = None
+                db.commit()
+                moved += len(rows)
+                print(f"{model.__tablename__}: moved {moved}")
+
+
+def backfill_geohash(batch_size: int) -> None:
+    """Fill users.geohash for suppliers saved before the column existed."""
+    done = 0
+    while True:
+        with SessionLocal() as db:
+            rows = (
+                db.query(User)
+                .filter(User.geohash.is_(None), User.latitude.isnot(None), User.longitude.isnot(None))
+                .limit(batch_size)
+                .all()
+            )
+            if not rows:
+                break
+            for row in rows:
+                row.geohash = geohash(row.latitude, row.longitude)
+            db.commit()
+            done += len(rows)
+            print(f"users: {done} geohashed")
+
+
+def snapshot_replica(interval: float) -> None:
+    """
+    Copy the primary SQLite database over the DATABASE_REPLICA_URL file, once
+    or every `interval` seconds: a local stand-in for a streaming replica.
+    """
+    primary, replica = make_url(SQLALCHEMY_DATABASE_URL), make_url(DATABASE_REPLICA_URL or "")
+    if primary.get_backend_name() != "sqlite" or replica.get_backend_name() != "sqlite" or not replica.database:
+        raise SystemExit("snapshot-replica needs DATABASE_URL and DATABASE_REPLICA_URL to be SQLite files")
+    while True:
+        started = time.perf_counter()
+        # the backup API copies a consistent snapshot while the app keeps writing,
+        # and replica readers see the whole new copy or none of it
+        with closing(sqlite3.connect(primary.database)) as source, closing(sqlite3.connect(replica.database)) as target:
+            source.backup(target)
+        print(f"replica {replica.database} refreshed in {time.perf_counter() - started:.2f}s")
+        if not interval:
+            return
+        time.sleep(interval)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Boneka maintenance commands")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    schema = commands.add_parser("migrate", help="apply schema migrations")
+    schema.add_argument("revision", nargs="?", default="head")
+
+    blobs = commands.add_parser("migrate-blobs", help="move image bytes out of the database")
+    blobs.add_argument("--batch-size", type=int, default=100)
+
+    commands.add_parser("rebuild-supplier-categories", help="recompute supplier_categories from products")
+
+    geo = commands.add_parser("backfill-geohash", help="compute users.geohash from latitude/longitude")
+    geo.add_argument("--batch-size", type=int, default=1000)
+
+    commands.add_parser("backfill-categories", help="link products and requests to the categories table")
+
+    commands.add_parser("reconcile-counters", help="recompute product and image counters and repair drift")
+
+    commands.add_parser("rebuild-daily-stats", help="recompute the daily_stats rollup from the base tables")
+
+    snapshot = commands.add_parser("snapshot-replica", help="copy the primary SQLite database to the replica file")
+    snapshot.add_argument("--interval", type=float, default=0, help="repeat every N seconds (default: once)")
+
+    args = parser.parse_args()
+    if args.command == "migrate":
+        migrate(args.revision)
+    elif args.command == "migrate-blobs":
+        migrate_blobs(args.batch_size)
+    elif args.command == "rebuild-supplier-categories":
+        with SessionLocal() as db:
+            print(f"supplier_categories: {rebuild_supplier_categories(db)} rows")
+    elif args.command == "backfill-geohash":
+        backfill_geohash(args.batch_size)
+    elif args.command == "backfill-categories":
+        with SessionLocal() as db:
+            print(f"category_id: {backfill_categories(db)} rows filled")
+            # supplier_categories is keyed by category id, so it follows the backfill
+            print(f"supplier_categories: {rebuild_supplier_categories(db)} rows")
+    elif args.command == "reconcile-counters":
+        with SessionLocal() as db:
+            for counter, fixed in reconcile_counters(db).items():
+                print(f"{counter}: {fixed} rows repaired")
+    elif args.command == "rebuild-daily-stats":
+        with SessionLocal() as db:
+            rows = rebuild_daily_stats(db)
+            db.commit()
+            print(f"daily_stats: {rows} rows")
+    elif args.command == "snapshot-replica":
+        snapshot_replica(args.interval)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+import math
+import time
+
+from fastapi import HTTPException
+from starlette.responses import PlainTextResponse
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+
+class UploadSizeLimitMiddleware:
+    """
+    Refuse multipart bodies larger than `max_bytes` before they are parsed.
+
+    Requests that declare a Content-Length over the limit are answered with
+    413 without reading the body at all. Chunked uploads are counted as they
+    arrive and cut off at the limit, so the form parser never spools more
+    than `max_bytes` to memory or disk.
+    """
+
+    def __init__(self, app: ASGIApp, max_bytes: int):
+        self.app = app
+        self.max_bytes = max_bytes
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        headers = dict(scope["headers"])
+        if not headers.get(b"content-type", b"").startswith(b"multipart/form-data"):
+            await self.app(scope, receive, send)
+            return
+
+        content_length = headers.get(b"content-length")
+        if content_length is not None and content_length.isdigit() and int(content_length) > self.max_bytes:
+            response = PlainTextResponse("Request body too large", status_code=413)
+            await response(scope, receive, send)
+            return
+
+        received = 0
+
+        async def limited_receive() -> Message:
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > self.max_bytes:
+                    raise HTTPException(status_code=413, detail="Request body too large")
+            return message
+
+        await self.app(scope, limited_receive, send)
+
+
+class ReadYourWritesMiddleware:
+    """
+    Send a client's reads to the primary for a while after it writes.
+
+    A successful POST/PUT/PATCH/DELETE answers with the time of the write,
+    both as an X-Last-Write header and a `last_write` cookie. A request that
+    brings either back within `window_seconds` is flagged in request.state,
+    and get_read_db / get_async_read_db give it a primary session instead of
+    a replica one, so nobody misses their own change because of replica lag.
+    The response cache is skipped for flagged requests too (cache.py).
+
+    POSTs to paths ending in one of `read_only_suffixes`, such as the
+    /batch lookups, only read and are not stamped.
+    """
+
+    SAFE_METHODS = {"GET", "HEAD", "OPTIONS"}
+
+    def __init__(self, app: ASGIApp, window_seconds: float, read_only_suffixes: tuple[str, ...] = ("/batch",)):
+        self.app = app
+        self.window_seconds = window_seconds
+        self.read_only_suffixes = read_only_suffixes
+
+    def _last_write(self, scope: Scope) -> float:
+        headers = dict(scope["headers"])
+        value = headers.get(b"x-last-write")
+        if value is None:
+            for cookie in headers.get(b"cookie", b"").split(b";"):
+                name, _, cookie_value = cookie.strip().partition(b"=")
+                if name == b"last_write":
+                    value = cookie_value
+                    break
+        try:
+            return float(value) if value else 0.0
+        except ValueError:
+            return 0.0
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        if time.time() - self._last_write(scope) < self.window_seconds:
+            scope.setdefault("state", {})["read_primary"] = True
+        if scope["method"] in self.SAFE_METHODS or (
+            scope["method"] == "POST" and scope["path"].rstrip("/").endswith(self.read_only_suffixes)
+        ):
+            await self.app(scope, receive, send)
+            return
+
+        async def send_with_stamp(message: Message) -> None:
+            if message["type"] == "http.response.start" and message["status"] < 400:
+                stamp = f"{time.time():.3f}".encode()
+                message["headers"] = [
+                    *message.get("headers", []),
+                    (b"x-last-write", stamp),
+                    (b"set-cookie", b"last_write=%s; Max-Age=%d; Path=/; HttpOnly; SameSite=Lax"
+                     % (stamp, math.ceil(self.window_seconds))),
+                ]
+            await send(message)
+
+        await self.app(scope, receive, send_with_stamp)
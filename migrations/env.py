@@ -0,0 +1,51 @@
+from logging.config import fileConfig
+
+from alembic import context
+
+import models
+from database import SQLALCHEMY_DATABASE_URL, engine
+
+config = context.config
+if config.config_file_name is not None:
+    fileConfig(config.config_file_name, disable_existing_loggers=False)
+
+target_metadata = models.Base.metadata
+
+
+def include_name(name, type_, parent_names) -> bool:
+    # the full-text tables are raw SQL, created in migrations 0002 and 0006
+    return not (type_ == "table" and name.startswith("products_fts"))
+
+
+def run_migrations_offline() -> None:
+    context.configure(
+        url=SQLALCHEMY_DATABASE_URL,
+        target_metadata=target_metadata,
+        include_name=include_name,
+        literal_binds=True,
+        dialect_opts={"paramstyle": "named"},
+        render_as_batch=True,
+    )
+    with context.begin_transaction():
+        context.run_migrations()
+
+
+def run_migrations_online() -> None:
+    with engine.connect() as connection:
+        context.configure(
+            connection=connection,
+            target_metadata=target_metadata,
+            include_name=include_name,
+            # SQLite can only change most of a table by copying it
+            render_as_batch=connection.dialect.name == "sqlite",
+            # and reports UUID columns back as NUMERIC
+            compare_type=connection.dialect.name != "sqlite",
+        )
+        with context.begin_transaction():
+            context.run_migrations()
+
+
+if context.is_offline_mode():
+    run_migrations_offline()
+else:
+    run_migrations_online()
@@ -0,0 +1,142 @@
+"""baseline: the schema create_all used to build at startup
+
+Databases that predate migrations already have these tables, so each one is
+only created when missing; `alembic upgrade head` then brings them forward.
+
+Revision ID: 0001
+Revises:
+Create Date: 2026-10-17
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects.postgresql import UUID
+
+revision = "0001"
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def _create_missing(name: str, *columns, **kwargs) -> None:
+    if not sa.inspect(op.get_bind()).has_table(name):
+        op.create_table(name, *columns, **kwargs)
+
+
+def upgrade() -> None:
+    _create_missing(
+        "users",
+        sa.Column("id", UUID(as_uuid=True), primary_key=True),
+        sa.Column("username", sa.String, nullable=True),
+        sa.Column("role", sa.Enum("customer", "supplier", "admin", name="user_roles"), nullable=False),
+        sa.Column("name", sa.String, nullable=False),
+        sa.Column("surname", sa.String, nullable=True),
+        sa.Column("phone_number", sa.String, nullable=True, index=True),
+        sa.Column("email", sa.String, nullable=False, unique=True, index=True),
+        sa.Column("password_hash", sa.String, nullable=True),
+        sa.Column("date_of_birth", sa.Date, nullable=True),
+        sa.Column("gender", sa.String),
+        sa.Column("created_at", sa.DateTime(timezone=True), server_default=sa.func.now(), nullable=False),
+        sa.Column(
+            "status",
+            sa.Enum("active", "disabled", "pending", name="user_statuses"),
+            server_default="active",
+            nullable=False,
+        ),
+        sa.Column("latitude", sa.Float, nullable=True),
+        sa.Column("longitude", sa.Float, nullable=True),
+    )
+    _create_missing(
+        "request_posts",
+        sa.Column("id", UUID(as_uuid=True), primary_key=True),
+        sa.Column("title", sa.String, nullable=False),
+        sa.Column("description", sa.Text),
+        sa.Column("category", sa.Text),
+        sa.Column("offer_price", sa.Numeric(12, 2)),
+        sa.Column("quantity", sa.Integer),
+        sa.Column(
+            "status",
+            sa.Enum("open", "accepted", "declined", "cancelled", name="request_statuses"),
+            server_default="open",
+            nullable=False,
+        ),
+        sa.Column("customer_id", UUID(as_uuid=True), sa.ForeignKey("users.id")),
+        sa.Column("created_at", sa.DateTime(timezone=True), server_default=sa.func.now(), nullable=False),
+    )
+    _create_missing(
+        "request_images",
+        sa.Column("id", UUID(as_uuid=True), primary_key=True),
+        # the model said Integer here, which only SQLite accepted; 0002
+        # converts tables created that way
+        sa.Column("request_id", UUID(as_uuid=True), sa.ForeignKey("request_posts.id")),
+        sa.Column("image_data", sa.LargeBinary, nullable=False),
+    )
+    _create_missing(
+        "offers",
+        sa.Column("id", UUID(as_uuid=True), primary_key=True),
+        sa.Column("request_id", UUID(as_uuid=True), sa.ForeignKey("request_posts.id"), nullable=False),
+        sa.Column("supplier_id", UUID(as_uuid=True), sa.ForeignKey("users.id"), nullable=False),
+        sa.Column("proposed", sa.Numeric(12, 2), nullable=False),
+        sa.Column(
+            "status",
+            sa.Enum("pending", "accepted", "rejected", name="offer_statuses"),
+            server_default="pending",
+            nullable=False,
+        ),
+        sa.Column("created_at", sa.DateTime(timezone=True), server_default=sa.func.now(), nullable=False),
+    )
+    _create_missing(
+        "products",
+        sa.Column("id", UUID(as_uuid=True), primary_key=True),
+        sa.Column("name", sa.String),
+        sa.Column("description", sa.Text),
+        sa.Column("category", sa.String, nullable=False),
+        sa.Column("price", sa.Numeric(12, 2), nullable=False),
+        sa.Column("supplier_id", UUID(as_uuid=True), sa.ForeignKey("users.id")),
+    )
+    _create_missing(
+        "product_images",
+        sa.Column("id", UUID(as_uuid=True), primary_key=True),
+        sa.Column("product_id", UUID(as_uuid=True), sa.ForeignKey("products.id")),
+        sa.Column("image_data", sa.LargeBinary, nullable=False),
+    )
+    _create_missing(
+        "profile_images",
+        sa.Column("id", UUID(as_uuid=True), primary_key=True),
+        sa.Column("user_id", UUID(as_uuid=True), sa.ForeignKey("users.id"), nullable=True),
+        sa.Column("image_data", sa.LargeBinary, nullable=False),
+    )
+    _create_missing(
+        "device_tokens",
+        sa.Column("id", UUID(as_uuid=True), primary_key=True),
+        sa.Column("user_id", UUID(as_uuid=True), sa.ForeignKey("users.id"), nullable=False),
+        sa.Column("device_id", sa.String, nullable=False),
+        sa.Column("token", sa.String, nullable=False, unique=True),
+        sa.Column("issued_at", sa.DateTime, server_default=sa.func.now(), nullable=False),
+        sa.Column("last_used", sa.DateTime, nullable=False),
+        sa.Column("expires_at", sa.DateTime, nullable=False),
+    )
+    _create_missing(
+        "orders",
+        sa.Column("id", UUID(as_uuid=True), primary_key=True),
+        sa.Column("request_id", UUID(as_uuid=True), sa.ForeignKey("request_posts.id"), nullable=False),
+        sa.Column("offer_id", UUID(as_uuid=True), sa.ForeignKey("offers.id"), nullable=False),
+        sa.Column("customer_id", UUID(as_uuid=True), sa.ForeignKey("users.id"), nullable=False),
+        sa.Column("supplier_id", UUID(as_uuid=True), sa.ForeignKey("users.id"), nullable=False),
+        sa.Column(
+            "status",
+            sa.Enum("placed", "delivered", "cancelled", name="order_statuses"),
+            server_default="placed",
+            nullable=False,
+        ),
+        sa.Column("total_price", sa.Numeric(12, 2), nullable=False),
+        sa.Column("quantity", sa.Integer, nullable=False),
+        sa.Column("created_at", sa.DateTime(timezone=True), server_default=sa.func.now(), nullable=False),
+    )
+
+
+def downgrade() -> None:
+    for name in (
+        "orders", "device_tokens", "profile_images", "product_images", "products",
+        "offers", "request_images", "request_posts", "users",
+    ):
+        op.drop_table(name)
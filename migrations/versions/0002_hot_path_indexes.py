@@ -0,0 +1,304 @@
+"""catch up with the models and index the hot filters
+
+Adds what the models grew since the baseline (blob store columns, products
+created_at, categories, supplier_categories, geohash, the request feed
+outbox) and the indexes the routers filter on: the foreign keys behind every
+per-parent listing, users.username, and composites such as
+offers(request_id, status) and orders(customer_id, status, created_at).
+
+Existing products and requests are linked to their categories and
+supplier_categories is rebuilt from them here, so the category listings and
+the supplier feed work on upgraded data without a separate backfill.
+
+Everything is guarded so databases that a create_all at startup already
+partly upgraded go through cleanly.
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-17
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects.postgresql import UUID
+
+revision = "0002"
+down_revision = "0001"
+branch_labels = None
+depends_on = None
+
+IMAGE_TABLES = {
+    "product_images": "product_id",
+    "request_images": "request_id",
+    "profile_images": "user_id",
+}
+
+INDEXES = [
+    ("ix_users_username", "users", ["username"]),
+    ("ix_users_created_at_id", "users", ["created_at", "id"]),
+    ("ix_users_role_created_at_id", "users", ["role", "created_at", "id"]),
+    ("ix_users_role_geohash", "users", ["role", "geohash"]),
+    ("ix_request_posts_created_at_id", "request_posts", ["created_at", "id"]),
+    ("ix_request_posts_status_category_id_created_at", "request_posts", ["status", "category_id", "created_at", "id"]),
+    ("ix_products_supplier_id", "products", ["supplier_id"]),
+    ("ix_products_created_at_id", "products", ["created_at", "id"]),
+    ("ix_products_category_id_price", "products", ["category_id", "price"]),
+    ("ix_offers_request_id_status", "offers", ["request_id", "status"]),
+    ("ix_offers_supplier_id_status", "offers", ["supplier_id", "status"]),
+    ("ix_orders_customer_id_status_created_at", "orders", ["customer_id", "status", "created_at"]),
+    ("ix_orders_supplier_id_status_created_at", "orders", ["supplier_id", "status", "created_at"]),
+    ("ix_device_tokens_user_id", "device_tokens", ["user_id"]),
+    ("ix_supplier_categories_category_id_supplier_id", "supplier_categories", ["category_id", "supplier_id"]),
+] + [
+    (f"ix_{table}_{parent}", table, [parent]) for table, parent in IMAGE_TABLES.items()
+] + [
+    (f"ix_{table}_sha256", table, ["sha256"]) for table in IMAGE_TABLES
+]
+
+# superseded by the category_id version
+STALE_INDEXES = [("ix_request_posts_status_category_created_at", "request_posts")]
+
+# the full-text index as this revision creates it; 0006 rekeys the SQLite
+# table, so later changes to search.py must not leak back in here
+SEARCH_SQLITE = [
+    """
+    CREATE VIRTUAL TABLE IF NOT EXISTS products_fts USING fts5(
+        name, description, category,
+        content='products',
+        tokenize='unicode61 remove_diacritics 2',
+        prefix='2 3'
+    )
+    """,
+    "CREATE VIRTUAL TABLE IF NOT EXISTS products_fts_vocab USING fts5vocab(products_fts, 'row')",
+    """
+    CREATE TRIGGER IF NOT EXISTS products_fts_ai AFTER INSERT ON products BEGIN
+        INSERT INTO products_fts(rowid, name, description, category)
+        VALUES (new.rowid, new.name, new.description, new.category);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS products_fts_ad AFTER DELETE ON products BEGIN
+        INSERT INTO products_fts(products_fts, rowid, name, description, category)
+        VALUES ('delete', old.rowid, old.name, old.description, old.category);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS products_fts_au AFTER UPDATE OF name, description, category ON products BEGIN
+        INSERT INTO products_fts(products_fts, rowid, name, description, category)
+        VALUES ('delete', old.rowid, old.name, old.description, old.category);
+        INSERT INTO products_fts(rowid, name, description, category)
+        VALUES (new.rowid, new.name, new.description, new.category);
+    END
+    """,
+]
+
+SEARCH_POSTGRES = [
+    """
+    ALTER TABLE products ADD COLUMN IF NOT EXISTS search_vector tsvector
+    GENERATED ALWAYS AS (
+        setweight(to_tsvector('simple', coalesce(name, '')), 'A') ||
+        setweight(to_tsvector('simple', coalesce(category, '')), 'B') ||
+        setweight(to_tsvector('simple', coalesce(description, '')), 'C')
+    ) STORED
+    """,
+    "CREATE INDEX IF NOT EXISTS ix_products_search_vector ON products USING GIN (search_vector)",
+]
+
+# typo fallback on Postgres needs pg_trgm, which may not be installable on a
+# managed database; search still works without it, just without fuzzy hits
+SEARCH_POSTGRES_TRGM = [
+    "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+    "CREATE INDEX IF NOT EXISTS ix_products_name_trgm ON products USING GIN (name gin_trgm_ops)",
+]
+
+
+def _columns(table: str) -> set[str]:
+    return {column["name"] for column in sa.inspect(op.get_bind()).get_columns(table)}
+
+
+def _indexes(table: str) -> set[str]:
+    return {index["name"] for index in sa.inspect(op.get_bind()).get_indexes(table)}
+
+
+def _has_table(table: str) -> bool:
+    return sa.inspect(op.get_bind()).has_table(table)
+
+
+def _create_search_index(bind) -> None:
+    if bind.dialect.name == "sqlite":
+        exists = bind.execute(sa.text("SELECT 1 FROM sqlite_master WHERE name = 'products_fts'")).first()
+        for statement in SEARCH_SQLITE:
+            op.execute(statement)
+        if not exists:
+            # index the rows that were there before the triggers
+            op.execute("INSERT INTO products_fts(products_fts) VALUES ('rebuild')")
+    elif bind.dialect.name == "postgresql":
+        for statement in SEARCH_POSTGRES:
+            op.execute(statement)
+        try:
+            with bind.begin_nested():
+                for statement in SEARCH_POSTGRES_TRGM:
+                    op.execute(statement)
+        except sa.exc.DBAPIError:
+            pass
+
+
+def _canonical_category(name: str) -> str:
+    # catalog.canonical_category as of this revision
+    return " ".join(name.split()).casefold()
+
+
+def _backfill_categories(bind) -> None:
+    """
+    Point products and requests saved before categories existed at their
+    category, then rebuild supplier_categories from products.
+    """
+    names = set()
+    for table in ("products", "request_posts"):
+        names.update(bind.execute(sa.text(
+            f"SELECT DISTINCT category FROM {table} WHERE category_id IS NULL AND category IS NOT NULL"
+        )).scalars())
+    names = sorted(name for name in names if name.strip())
+    if names:
+        existing = set(bind.execute(sa.text("SELECT name FROM categories")).scalars())
+        display = {}
+        for name in names:
+            display.setdefault(_canonical_category(name), " ".join(name.split()))
+        fresh = [{"name": key, "display_name": shown} for key, shown in display.items() if key not in existing]
+        if fresh:
+            bind.execute(sa.text("INSERT INTO categories (name, display_name) VALUES (:name, :display_name)"), fresh)
+        ids = dict(bind.execute(sa.text("SELECT name, id FROM categories")).all())
+
+        # raw name -> id, so each table is filled by one correlated UPDATE
+        op.create_table(
+            "category_backfill",
+            sa.Column("category", sa.String, primary_key=True),
+            sa.Column("category_id", sa.Integer, nullable=False),
+        )
+        bind.execute(
+            sa.text("INSERT INTO category_backfill (category, category_id) VALUES (:category, :category_id)"),
+            [{"category": name, "category_id": ids[_canonical_category(name)]} for name in names],
+        )
+        for table in ("products", "request_posts"):
+            op.execute(
+                f"UPDATE {table} SET category_id = "
+                f"(SELECT category_id FROM category_backfill WHERE category_backfill.category = {table}.category) "
+                "WHERE category_id IS NULL"
+            )
+        op.drop_table("category_backfill")
+
+    op.execute("DELETE FROM supplier_categories")
+    op.execute(
+        "INSERT INTO supplier_categories (supplier_id, category_id, product_count) "
+        "SELECT supplier_id, category_id, count(*) FROM products "
+        "WHERE supplier_id IS NOT NULL AND category_id IS NOT NULL "
+        "GROUP BY supplier_id, category_id"
+    )
+
+
+def upgrade() -> None:
+    bind = op.get_bind()
+    sqlite = bind.dialect.name == "sqlite"
+
+    if not _has_table("categories"):
+        op.create_table(
+            "categories",
+            sa.Column("id", sa.Integer, primary_key=True, autoincrement=True),
+            sa.Column("name", sa.String, nullable=False, unique=True),
+            sa.Column("display_name", sa.String, nullable=False),
+        )
+    # derived data; an older text-keyed copy is dropped and rebuilt below
+    if _has_table("supplier_categories") and "category_id" not in _columns("supplier_categories"):
+        op.drop_table("supplier_categories")
+    if not _has_table("supplier_categories"):
+        op.create_table(
+            "supplier_categories",
+            sa.Column("supplier_id", UUID(as_uuid=True), sa.ForeignKey("users.id", ondelete="CASCADE"), primary_key=True),
+            sa.Column("category_id", sa.Integer, sa.ForeignKey("categories.id"), primary_key=True),
+            sa.Column("product_count", sa.Integer, nullable=False),
+        )
+    if not _has_table("feed_events"):
+        op.create_table(
+            "feed_events",
+            sa.Column("id", sa.Integer, primary_key=True, autoincrement=True),
+            sa.Column("origin", sa.String(32), nullable=False),
+            sa.Column("category_id", sa.Integer, nullable=True),
+            sa.Column("payload", sa.Text, nullable=False),
+            sa.Column("created_at", sa.DateTime, server_default=sa.func.now(), nullable=False),
+        )
+
+    if "geohash" not in _columns("users"):
+        op.add_column("users", sa.Column("geohash", sa.String(12), nullable=True))
+
+    if "category_id" not in _columns("request_posts"):
+        with op.batch_alter_table("request_posts") as batch:
+            batch.add_column(sa.Column("category_id", sa.Integer, nullable=True))
+            batch.create_foreign_key("fk_request_posts_category_id", "categories", ["category_id"], ["id"])
+
+    products = _columns("products")
+    rebuild_search = False
+    if "created_at" not in products or "category_id" not in products:
+        # SQLite cannot add a NOT NULL column with a CURRENT_TIMESTAMP
+        # default in place, so the table is copied; that also drops the
+        # full-text triggers, which _create_search_index puts back below
+        rebuild_search = sqlite
+        with op.batch_alter_table("products", recreate="always" if sqlite else "auto") as batch:
+            if "created_at" not in products:
+                batch.add_column(
+                    sa.Column("created_at", sa.DateTime(timezone=True), server_default=sa.func.now(), nullable=False)
+                )
+            if "category_id" not in products:
+                batch.add_column(sa.Column("category_id", sa.Integer, nullable=True))
+                batch.create_foreign_key("fk_products_category_id", "categories", ["category_id"], ["id"])
+
+    _backfill_categories(bind)
+
+    for table, parent in IMAGE_TABLES.items():
+        columns = _columns(table)
+        parent_type = next(c["type"] for c in sa.inspect(bind).get_columns(table) if c["name"] == parent)
+        with op.batch_alter_table(table) as batch:
+            if "sha256" not in columns:
+                batch.add_column(sa.Column("sha256", sa.String(64), nullable=True))
+                batch.add_column(sa.Column("size", sa.Integer, nullable=True))
+                batch.add_column(sa.Column("content_type", sa.String, nullable=True))
+            # bytes now live in the blob store; rows keep them only until migrate-blobs
+            batch.alter_column("image_data", existing_type=sa.LargeBinary, nullable=True)
+            if isinstance(parent_type, sa.Integer):
+                batch.alter_column(
+                    parent,
+                    existing_type=sa.Integer,
+                    type_=UUID(as_uuid=True),
+                    postgresql_using=f"{parent}::text::uuid",
+                )
+
+    for name, table in STALE_INDEXES:
+        if name in _indexes(table):
+            op.drop_index(name, table_name=table)
+    for name, table, columns in INDEXES:
+        if name not in _indexes(table):
+            op.create_index(name, table, columns)
+
+    _create_search_index(bind)
+    if rebuild_search and sa.inspect(bind).has_table("products_fts"):
+        op.execute("INSERT INTO products_fts(products_fts) VALUES ('rebuild')")
+
+
+def downgrade() -> None:
+    for name, table, _ in reversed(INDEXES):
+        if name in _indexes(table):
+            op.drop_index(name, table_name=table)
+    for table in IMAGE_TABLES:
+        with op.batch_alter_table(table) as batch:
+            batch.drop_column("content_type")
+            batch.drop_column("size")
+            batch.drop_column("sha256")
+    with op.batch_alter_table("products") as batch:
+        batch.drop_constraint("fk_products_category_id", type_="foreignkey")
+        batch.drop_column("category_id")
+        batch.drop_column("created_at")
+    with op.batch_alter_table("request_posts") as batch:
+        batch.drop_constraint("fk_request_posts_category_id", type_="foreignkey")
+        batch.drop_column("category_id")
+    op.drop_column("users", "geohash")
+    op.drop_table("feed_events")
+    op.drop_table("supplier_categories")
+    op.drop_table("categories")
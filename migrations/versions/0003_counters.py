@@ -0,0 +1,45 @@
+"""maintained counters for products and product images
+
+Adds users.product_count, products.image_count and the counters table
+(holding the "products" total) so the count endpoints and the 4-image
+limit stop running COUNT(*), then fills them from the existing rows.
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2026-10-17
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0003"
+down_revision = "0002"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "counters",
+        sa.Column("name", sa.String(64), primary_key=True),
+        sa.Column("value", sa.Integer, nullable=False),
+    )
+    op.add_column("users", sa.Column("product_count", sa.Integer, nullable=False, server_default="0"))
+    op.add_column("products", sa.Column("image_count", sa.Integer, nullable=False, server_default="0"))
+
+    op.execute(
+        "UPDATE users SET product_count = "
+        "(SELECT count(*) FROM products WHERE products.supplier_id = users.id)"
+    )
+    op.execute(
+        "UPDATE products SET image_count = "
+        "(SELECT count(*) FROM product_images WHERE product_images.product_id = products.id)"
+    )
+    op.execute("INSERT INTO counters (name, value) SELECT 'products', count(*) FROM products")
+
+
+def downgrade() -> None:
+    with op.batch_alter_table("products") as batch:
+        batch.drop_column("image_count")
+    with op.batch_alter_table("users") as batch:
+        batch.drop_column("product_count")
+    op.drop_table("counters")
@@ -0,0 +1,60 @@
+"""daily_stats rollup for the admin dashboards
+
+One row per (day, category) with signups, requests, offers, orders and GMV,
+filled from the existing rows.
+
+Revision ID: 0004
+Revises: 0003
+Create Date: 2026-10-17
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0004"
+down_revision = "0003"
+branch_labels = None
+depends_on = None
+
+# the totals stats.rebuild_daily_stats computed when this revision was written;
+# signups, and requests without a category, are filed under category 0
+FILL = """
+INSERT INTO daily_stats (day, category_id, signups, requests, offers, orders, gmv)
+SELECT day, category_id, sum(signups), sum(requests), sum(offers), sum(orders), sum(gmv)
+FROM (
+    SELECT date(created_at) AS day, 0 AS category_id,
+           count(*) AS signups, 0 AS requests, 0 AS offers, 0 AS orders, 0 AS gmv
+    FROM users
+    GROUP BY date(created_at)
+    UNION ALL
+    SELECT date(created_at), coalesce(category_id, 0), 0, count(*), 0, 0, 0
+    FROM request_posts
+    GROUP BY date(created_at), coalesce(category_id, 0)
+    UNION ALL
+    SELECT date(o.created_at), coalesce(r.category_id, 0), 0, 0, count(*), 0, 0
+    FROM offers AS o JOIN request_posts AS r ON r.id = o.request_id
+    GROUP BY date(o.created_at), coalesce(r.category_id, 0)
+    UNION ALL
+    SELECT date(o.created_at), coalesce(r.category_id, 0), 0, 0, 0, count(*), coalesce(sum(o.total_price), 0)
+    FROM orders AS o JOIN request_posts AS r ON r.id = o.request_id
+    GROUP BY date(o.created_at), coalesce(r.category_id, 0)
+) AS events
+GROUP BY day, category_id
+"""
+
+
+def upgrade() -> None:
+    op.create_table(
+        "daily_stats",
+        sa.Column("day", sa.Date, primary_key=True),
+        sa.Column("category_id", sa.Integer, primary_key=True),
+        sa.Column("signups", sa.Integer, nullable=False),
+        sa.Column("requests", sa.Integer, nullable=False),
+        sa.Column("offers", sa.Integer, nullable=False),
+        sa.Column("orders", sa.Integer, nullable=False),
+        sa.Column("gmv", sa.Numeric(14, 2), nullable=False),
+    )
+    op.execute(FILL)
+
+
+def downgrade() -> None:
+    op.drop_table("daily_stats")
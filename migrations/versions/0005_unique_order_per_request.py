@@ -0,0 +1,34 @@
+"""one order per request
+
+Adds a unique constraint on orders.request_id so two concurrent accepts of
+offers on the same request cannot both place an order.
+
+Revision ID: 0005
+Revises: 0004
+Create Date: 2026-10-17
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0005"
+down_revision = "0004"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    duplicated = op.get_bind().execute(sa.text(
+        "SELECT count(*) FROM (SELECT request_id FROM orders GROUP BY request_id HAVING count(*) > 1) AS d"
+    )).scalar()
+    if duplicated:
+        # which order stands is a business decision, not something to guess here
+        raise RuntimeError(
+            f"{duplicated} requests have more than one order; resolve them before adding uq_orders_request_id"
+        )
+    with op.batch_alter_table("orders") as batch:
+        batch.create_unique_constraint("uq_orders_request_id", ["request_id"])
+
+
+def downgrade() -> None:
+    with op.batch_alter_table("orders") as batch:
+        batch.drop_constraint("uq_orders_request_id", type_="unique")
@@ -0,0 +1,122 @@
+"""key the SQLite full-text index on a stable integer
+
+products_fts was an external-content table over products.rowid. products has
+a UUID primary key, so that rowid is not stable and VACUUM may renumber it,
+leaving the index pointing at the wrong products. The index is now a regular
+FTS5 table keyed through products_fts_keys, whose INTEGER PRIMARY KEY
+survives a VACUUM; the old layout is dropped and the new one filled from
+products.
+
+Postgres keeps its search_vector column and is not touched.
+
+Revision ID: 0006
+Revises: 0005
+Create Date: 2026-10-17
+"""
+from alembic import op
+
+revision = "0006"
+down_revision = "0005"
+branch_labels = None
+depends_on = None
+
+KEYED_LAYOUT = [
+    """
+    CREATE TABLE products_fts_keys (
+        fts_rowid INTEGER PRIMARY KEY,
+        product_id NOT NULL UNIQUE
+    )
+    """,
+    """
+    CREATE VIRTUAL TABLE products_fts USING fts5(
+        name, description, category,
+        tokenize='unicode61 remove_diacritics 2',
+        prefix='2 3'
+    )
+    """,
+    "CREATE VIRTUAL TABLE products_fts_vocab USING fts5vocab(products_fts, 'row')",
+    """
+    CREATE TRIGGER products_fts_ai AFTER INSERT ON products BEGIN
+        INSERT INTO products_fts_keys(product_id) VALUES (new.id);
+        INSERT INTO products_fts(rowid, name, description, category)
+        VALUES ((SELECT fts_rowid FROM products_fts_keys WHERE product_id = new.id),
+                new.name, new.description, new.category);
+    END
+    """,
+    """
+    CREATE TRIGGER products_fts_ad AFTER DELETE ON products BEGIN
+        DELETE FROM products_fts WHERE rowid = (SELECT fts_rowid FROM products_fts_keys WHERE product_id = old.id);
+        DELETE FROM products_fts_keys WHERE product_id = old.id;
+    END
+    """,
+    """
+    CREATE TRIGGER products_fts_au AFTER UPDATE OF name, description, category ON products BEGIN
+        UPDATE products_fts SET name = new.name, description = new.description, category = new.category
+        WHERE rowid = (SELECT fts_rowid FROM products_fts_keys WHERE product_id = new.id);
+    END
+    """,
+    "INSERT INTO products_fts_keys(product_id) SELECT id FROM products",
+    """
+    INSERT INTO products_fts(rowid, name, description, category)
+    SELECT k.fts_rowid, p.name, p.description, p.category
+    FROM products_fts_keys AS k JOIN products AS p ON p.id = k.product_id
+    """,
+]
+
+# the external-content layout over products.rowid that this revision replaces
+ROWID_LAYOUT = [
+    """
+    CREATE VIRTUAL TABLE products_fts USING fts5(
+        name, description, category,
+        content='products',
+        tokenize='unicode61 remove_diacritics 2',
+        prefix='2 3'
+    )
+    """,
+    "CREATE VIRTUAL TABLE products_fts_vocab USING fts5vocab(products_fts, 'row')",
+    """
+    CREATE TRIGGER products_fts_ai AFTER INSERT ON products BEGIN
+        INSERT INTO products_fts(rowid, name, description, category)
+        VALUES (new.rowid, new.name, new.description, new.category);
+    END
+    """,
+    """
+    CREATE TRIGGER products_fts_ad AFTER DELETE ON products BEGIN
+        INSERT INTO products_fts(products_fts, rowid, name, description, category)
+        VALUES ('delete', old.rowid, old.name, old.description, old.category);
+    END
+    """,
+    """
+    CREATE TRIGGER products_fts_au AFTER UPDATE OF name, description, category ON products BEGIN
+        INSERT INTO products_fts(products_fts, rowid, name, description, category)
+        VALUES ('delete', old.rowid, old.name, old.description, old.category);
+        INSERT INTO products_fts(rowid, name, description, category)
+        VALUES (new.rowid, new.name, new.description, new.category);
+    END
+    """,
+    "INSERT INTO products_fts(products_fts) VALUES ('rebuild')",
+]
+
+DROP_SEARCH_INDEX = [
+    "DROP TRIGGER IF EXISTS products_fts_ai",
+    "DROP TRIGGER IF EXISTS products_fts_ad",
+    "DROP TRIGGER IF EXISTS products_fts_au",
+    "DROP TABLE IF EXISTS products_fts_vocab",
+    "DROP TABLE IF EXISTS products_fts",
+    "DROP TABLE IF EXISTS products_fts_keys",
+]
+
+
+def _swap(layout: list[str]) -> None:
+    if op.get_bind().dialect.name != "sqlite":
+        return
+    for statement in DROP_SEARCH_INDEX + layout:
+        op.execute(statement)
+
+
+def upgrade() -> None:
+    _swap(KEYED_LAYOUT)
+
+
+def downgrade() -> None:
+    _swap(ROWID_LAYOUT)
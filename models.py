@@ -1,16 +1,29 @@
-from sqlalchemy import Boolean, Column, DateTime, Enum, Integer, Numeric,UniqueConstraint, String, Text, Date, Float, ForeignKey, LargeBinary, event, func, text
-from sqlalchemy.orm import relationship
+from sqlalchemy import Boolean, Column, DateTime, Enum, Index, Integer, Numeric,UniqueConstraint, String, Text, Date, Float, ForeignKey, LargeBinary, event, func, text
+from sqlalchemy.dialects.sqlite import DATETIME as SQLITE_DATETIME
+from sqlalchemy.orm import mapped_column, relationship
 from database import Base
 from datetime import datetime
 from sqlalchemy.dialects.postgresql import UUID
 import uuid
 
+# SQLite's CURRENT_TIMESTAMP has no fractional seconds; bind created_at the same
+# way so keyset comparisons against stored values line up (see pagination.py)
+Timestamp = DateTime(timezone=True).with_variant(SQLITE_DATETIME(truncate_microseconds=True), "sqlite")
+
+
+# image bytes live in the blob store (blob_store.py); rows only describe them
+class StoredImageMixin:
+    sha256 = Column(String(64), index=True, nullable=True)
+    size = Column(Integer, nullable=True)
+    content_type = Column(String, nullable=True)
+    # legacy in-row bytes, emptied by `python manage.py migrate-blobs`
+    image_data = mapped_column(LargeBinary, nullable=True, deferred=True)
 
 
 class User(Base):
     __tablename__ = "users"
     id         = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
-    username   = Column(String, nullable=True)
+    username   = Column(String, index=True, nullable=True)
     role       = Column(Enum("customer","supplier","admin", name="user_roles"), nullable=False)
     name       = Column(String, nullable=False)
     surname    = Column(String, nullable=True) 
@@ -19,7 +32,7 @@ class User(Base):
     password_hash = Column(String, nullable=True)
     date_of_birth = Column(Date, nullable=True)
     gender = Column(String) # male or female
-    created_at    = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+    created_at    = Column(Timestamp, server_default=func.now(), nullable=False)
     status     = Column(Enum("active",
                             "disabled",
                             "pending",
@@ -27,15 +40,58 @@ class User(Base):
                             server_default="active", nullable=False)
     latitude  = Column(Float, nullable=True)
     longitude = Column(Float, nullable=True)
+    # cell of (latitude, longitude), kept in step by the supplier routes (geo.py)
+    geohash = Column(String(12), nullable=True)
+    # products this supplier has, maintained by catalog.py
+    product_count = Column(Integer, nullable=False, default=0, server_default="0")
     
     #relationships
     requests = relationship("RequestPost", back_populates="customer", cascade="all, delete")
     offers = relationship("Offer", back_populates="supplier", cascade="all, delete")
     profile_image = relationship("ProfileImage", back_populates="user", uselist=False, cascade="all, delete")
     products = relationship("Product", back_populates="supplier", cascade="all, delete")
+    supplier_categories = relationship("SupplierCategory", cascade="all, delete")
+    device_tokens = relationship("DeviceToken", cascade="all, delete-orphan")
     customer_orders = relationship("Order", foreign_keys="[Order.customer_id]", back_populates="customer")
     supplier_orders = relationship("Order", foreign_keys="[Order.supplier_id]", back_populates="supplier")
 
+    __table_args__ = (
+        # keyset pagination for /users and /suppliers
+        Index("ix_users_created_at_id", "created_at", "id"),
+        Index("ix_users_role_created_at_id", "role", "created_at", "id"),
+        # prefix range scans for /suppliers/nearby
+        Index("ix_users_role_geohash", "role", "geohash"),
+    )
+
+
+# running totals that would otherwise be COUNT(*) over a large table, e.g.
+# "products"; maintained by catalog.py, repaired by `manage.py reconcile-counters`
+class Counter(Base):
+    __tablename__ = "counters"
+    name = Column(String(64), primary_key=True)
+    value = Column(Integer, nullable=False, default=0)
+
+
+# per day and category: signups, requests, offers, orders and order value;
+# maintained by the write routes through stats.record_daily (0 = no category)
+class DailyStat(Base):
+    __tablename__ = "daily_stats"
+    day = Column(Date, primary_key=True)
+    category_id = Column(Integer, primary_key=True)
+    signups = Column(Integer, nullable=False, default=0)
+    requests = Column(Integer, nullable=False, default=0)
+    offers = Column(Integer, nullable=False, default=0)
+    orders = Column(Integer, nullable=False, default=0)
+    gmv = Column(Numeric(14, 2), nullable=False, default=0)
+
+
+# canonical categories; products and requests point here by id so matching
+# ignores casing and stray whitespace (catalog.get_or_create_category)
+class Category(Base):
+    __tablename__ = "categories"
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    name = Column(String, unique=True, nullable=False)  # canonical form
+    display_name = Column(String, nullable=False)
 
 
 class RequestPost(Base):
@@ -44,6 +100,7 @@ class RequestPost(Base):
     title = Column(String, nullable=False)
     description = Column(Text)
     category = Column(Text)
+    category_id = Column(Integer, ForeignKey("categories.id"), nullable=True)
     offer_price = Column(Numeric(12,2))
     quantity = Column(Integer, default=1)
     status = Column(
@@ -52,18 +109,23 @@ class RequestPost(Base):
         nullable=False,
     )
     customer_id = Column(UUID(as_uuid=True), ForeignKey("users.id"))
-    created_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+    created_at = Column(Timestamp, server_default=func.now(), nullable=False)
 
     customer = relationship("User", back_populates="requests")
     offers = relationship("Offer", back_populates="request", cascade="all, delete")
     images = relationship("RequestImage", back_populates="request", cascade="all, delete")
+
+    __table_args__ = (
+        Index("ix_request_posts_created_at_id", "created_at", "id"),
+        # supplier feed: open requests in a category, newest first
+        Index("ix_request_posts_status_category_id_created_at", "status", "category_id", "created_at", "id"),
+    )
     
     
-class RequestImage(Base):
+class RequestImage(StoredImageMixin, Base):
     __tablename__ = "request_images"
     id           = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
-    request_id = Column(Integer, ForeignKey("request_posts.id"))
-    image_data = Column(LargeBinary, nullable=False)
+    request_id = Column(UUID(as_uuid=True), ForeignKey("request_posts.id"), index=True)
     
     request = relationship("RequestPost", back_populates="images")
     
@@ -75,10 +137,16 @@ class Offer(Base):
     proposed     = Column(Numeric(12,2), nullable=False)
     status       = Column(Enum("pending","accepted","rejected", name="offer_statuses"),
                         server_default="pending", nullable=False)
-    created_at   = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+    created_at   = Column(Timestamp, server_default=func.now(), nullable=False)
 
     request = relationship("RequestPost", back_populates="offers")
     supplier = relationship("User", back_populates="offers")
+
+    __table_args__ = (
+        # offers on a request, and a supplier's offers, by status
+        Index("ix_offers_request_id_status", "request_id", "status"),
+        Index("ix_offers_supplier_id_status", "supplier_id", "status"),
+    )
     
 class Product(Base):
     __tablename__ = "products"
@@ -86,27 +154,48 @@ class Product(Base):
     name = Column(String)
     description = Column(Text)
     category = Column(String, nullable=False) # e.g. electronics, furniture, etc.
+    category_id = Column(Integer, ForeignKey("categories.id"), nullable=True)
     price = Column(Numeric(12,2), nullable=False)
-    supplier_id = Column(UUID(as_uuid=True), ForeignKey("users.id"))
+    supplier_id = Column(UUID(as_uuid=True), ForeignKey("users.id"), index=True)
+    created_at = Column(Timestamp, server_default=func.now(), nullable=False)
+    # rows in product_images, maintained by catalog.py (at most MAX_PRODUCT_IMAGES)
+    image_count = Column(Integer, nullable=False, default=0, server_default="0")
 
     supplier = relationship("User", back_populates="products")
     images = relationship("ProductImage", back_populates="product", cascade="all, delete")
 
+    __table_args__ = (
+        Index("ix_products_created_at_id", "created_at", "id"),
+        # category listings, optionally filtered or sorted by price
+        Index("ix_products_category_id_price", "category_id", "price"),
+    )
+
+
+# which categories a supplier carries, with how many products in each;
+# maintained by catalog.py whenever products are written
+class SupplierCategory(Base):
+    __tablename__ = "supplier_categories"
+    supplier_id = Column(UUID(as_uuid=True), ForeignKey("users.id", ondelete="CASCADE"), primary_key=True)
+    category_id = Column(Integer, ForeignKey("categories.id"), primary_key=True)
+    product_count = Column(Integer, nullable=False, default=0)
+
+    __table_args__ = (
+        Index("ix_supplier_categories_category_id_supplier_id", "category_id", "supplier_id"),
+    )
 
-class ProductImage(Base):
+
+class ProductImage(StoredImageMixin, Base):
     __tablename__ = "product_images"
     id           = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
-    product_id = Column(UUID(as_uuid=True), ForeignKey("products.id"))
-    image_data = Column(LargeBinary, nullable=False)
+    product_id = Column(UUID(as_uuid=True), ForeignKey("products.id"), index=True)
         
     product = relationship("Product", back_populates="images")
 
 # class for profile images for both users and suppliers
-class ProfileImage(Base):
+class ProfileImage(StoredImageMixin, Base):
     __tablename__ = "profile_images"
     id      = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
-    user_id = Column(UUID(as_uuid=True), ForeignKey("users.id"), nullable=True)
-    image_data = Column(LargeBinary, nullable=False)
+    user_id = Column(UUID(as_uuid=True), ForeignKey("users.id"), index=True, nullable=True)
 
     user = relationship("User", back_populates="profile_image", uselist=False)
     
@@ -115,7 +204,7 @@ class ProfileImage(Base):
 class DeviceToken(Base):
     __tablename__ = "device_tokens"
     id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
-    user_id = Column(UUID(as_uuid=True), ForeignKey("users.id"), nullable=False)
+    user_id = Column(UUID(as_uuid=True), ForeignKey("users.id"), index=True, nullable=False)
     device_id = Column(String, nullable=False)  # provided by the app
     token = Column(String, unique=True, nullable=False)
     issued_at = Column(DateTime, server_default=func.now(), nullable=False)
@@ -123,6 +212,17 @@ class DeviceToken(Base):
     expires_at = Column(DateTime, nullable=False)
 
 
+# outbox for the live request feed when several workers serve it
+# (request_feed.py, FEED_BROKER=outbox); rows are pruned after an hour
+class FeedEvent(Base):
+    __tablename__ = "feed_events"
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    origin = Column(String(32), nullable=False)
+    category_id = Column(Integer, nullable=True)
+    payload = Column(Text, nullable=False)
+    created_at = Column(DateTime, server_default=func.now(), nullable=False)
+
+
 # orders for supplier
 class Order(Base):
     __tablename__ = "orders"
@@ -140,10 +240,18 @@ class Order(Base):
     total_price = Column(Numeric(12, 2), nullable=False)
     quantity = Column(Integer, nullable=False)
 
-    created_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+    created_at = Column(Timestamp, server_default=func.now(), nullable=False)
 
     # Relationships
     request = relationship("RequestPost")
     offer = relationship("Offer")
     customer = relationship("User", foreign_keys=[customer_id], back_populates="customer_orders")
     supplier = relationship("User", foreign_keys=[supplier_id], back_populates="supplier_orders")
+
+    __table_args__ = (
+        # order lists per customer or supplier, filtered by status
+        Index("ix_orders_customer_id_status_created_at", "customer_id", "status", "created_at"),
+        Index("ix_orders_supplier_id_status_created_at", "supplier_id", "status", "created_at"),
+        # a request is accepted once; the last line of defence against two concurrent accepts
+        UniqueConstraint("request_id", name="uq_orders_request_id"),
+    )
@@ -0,0 +1,64 @@
+import base64
+import json
+from datetime import datetime
+from typing import Optional
+from uuid import UUID
+
+from fastapi import HTTPException
+from sqlalchemy import and_, or_
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+
+def encode_cursor(payload: dict) -> str:
+    """Pack a cursor payload into an opaque url-safe token."""
+    raw = json.dumps(payload, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> dict:
+    """Unpack a token produced by encode_cursor, 400 if it was tampered with."""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode()))
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="invalid cursor")
+    if not isinstance(payload, dict):
+        raise HTTPException(status_code=400, detail="invalid cursor")
+    return payload
+
+
+def apply_keyset(query, model, cursor: Optional[str], limit: int):
+    """
+    Restrict a Query/Select to the page after `cursor`, newest first.
+
+    Rows are ordered by (created_at, id) descending so the page boundary is
+    a single index seek no matter how deep the client has scrolled. One
+    extra row is fetched so make_page can tell whether another page exists.
+    """
+    if cursor:
+        payload = decode_cursor(cursor)
+        try:
+            created_at = datetime.fromisoformat(payload["c"])
+            row_id = UUID(payload["i"])
+        except (KeyError, TypeError, ValueError):
+            raise HTTPException(status_code=400, detail="invalid cursor")
+        query = query.filter(
+            or_(
+                model.created_at < created_at,
+                and_(model.created_at == created_at, model.id < row_id),
+            )
+        )
+    return query.order_by(model.created_at.desc(), model.id.desc()).limit(limit + 1)
+
+
+def make_page(rows: list, limit: int) -> dict:
+    """Trim the look-ahead row and build the next cursor from the last item."""
+    rows = list(rows)
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]
+        next_cursor = encode_cursor({"c": last.created_at.isoformat(), "i": str(last.id)})
+    return {"items": rows, "next_cursor": next_cursor}
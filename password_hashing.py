@@ -0,0 +1,100 @@
+import asyncio
+import logging
+import math
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import bcrypt
+from fastapi import HTTPException
+
+logger = logging.getLogger(__name__)
+
+# how long one hash should take on this machine; the cost factor is tuned to it
+BCRYPT_TARGET_MS = float(os.getenv("BCRYPT_TARGET_MS", "250"))
+# a fixed cost for the whole deployment instead of each worker tuning its own
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "0")) or None
+BCRYPT_MIN_ROUNDS = 10
+BCRYPT_MAX_ROUNDS = 15
+# hashes running at once, callers allowed to wait for a slot, and how long
+HASH_WORKERS = int(os.getenv("HASH_WORKERS", str(os.cpu_count() or 2)))
+HASH_QUEUE_LIMIT = int(os.getenv("HASH_QUEUE_LIMIT", "64"))
+HASH_QUEUE_TIMEOUT = float(os.getenv("HASH_QUEUE_TIMEOUT", "5"))
+
+
+def _rounds_of(hashed: str) -> int:
+    # $2b$12$<salt+hash>
+    try:
+        return int(hashed.split("$")[2])
+    except (IndexError, ValueError):
+        return 0
+
+
+class PasswordHasher:
+    """
+    Runs bcrypt on a dedicated thread pool with bounded concurrency.
+
+    bcrypt releases the GIL, so a few threads keep every core busy without
+    ever stalling the event loop. At most `workers` hashes run at once and at
+    most `queue_limit` callers wait for a slot; anyone beyond that, or
+    waiting longer than `timeout` seconds, gets a 503 so a login burst
+    degrades into fast refusals instead of taking the API down.
+    """
+
+    def __init__(self, workers: int, queue_limit: int, timeout: float):
+        self.rounds = 12
+        self.queue_limit = queue_limit
+        self.timeout = timeout
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="bcrypt")
+        self._slots = asyncio.Semaphore(workers)
+        self._waiting = 0
+
+    def tune(self, target_ms: float) -> int:
+        """Pick the cost factor whose hash time is closest to `target_ms`."""
+        started = time.perf_counter()
+        bcrypt.hashpw(b"calibration", bcrypt.gensalt(rounds=BCRYPT_MIN_ROUNDS))
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        # every extra round doubles the work
+        extra = round(math.log2(max(target_ms, 1) / max(elapsed_ms, 0.001)))
+        self.rounds = min(max(BCRYPT_MIN_ROUNDS + extra, BCRYPT_MIN_ROUNDS), BCRYPT_MAX_ROUNDS)
+        logger.info(
+            "bcrypt cost %d (%.0f ms at cost %d, target %.0f ms)",
+            self.rounds, elapsed_ms, BCRYPT_MIN_ROUNDS, target_ms,
+        )
+        return self.rounds
+
+    def hash_sync(self, password: str) -> str:
+        return bcrypt.hashpw(password.encode(), bcrypt.gensalt(rounds=self.rounds)).decode()
+
+    @staticmethod
+    def verify_sync(password: str, hashed: str) -> bool:
+        return bcrypt.checkpw(password.encode(), hashed.encode())
+
+    def needs_rehash(self, hashed: str) -> bool:
+        # only ever upgrade: workers tune independently, and rehashing down to
+        # whichever cost a worker happened to pick would flip hashes back and forth
+        return _rounds_of(hashed) < self.rounds
+
+    async def _run(self, fn, *args):
+        if self._waiting >= self.queue_limit:
+            raise HTTPException(status_code=503, detail="server busy, try again", headers={"Retry-After": "1"})
+        self._waiting += 1
+        try:
+            await asyncio.wait_for(self._slots.acquire(), self.timeout)
+        except asyncio.TimeoutError:
+            raise HTTPException(status_code=503, detail="server busy, try again", headers={"Retry-After": "1"})
+        finally:
+            self._waiting -= 1
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self._executor, fn, *args)
+        finally:
+            self._slots.release()
+
+    async def hash(self, password: str) -> str:
+        return await self._run(self.hash_sync, password)
+
+    async def verify(self, password: str, hashed: str) -> bool:
+        return await self._run(self.verify_sync, password, hashed)
+
+
+password_hasher = PasswordHasher(HASH_WORKERS, HASH_QUEUE_LIMIT, HASH_QUEUE_TIMEOUT)
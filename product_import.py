@@ -0,0 +1,235 @@
+"""
+Bulk product import from NDJSON or CSV request bodies.
+
+The body is read as it arrives and cut into records: one JSON object per
+line for NDJSON, or one CSV record (with a header row naming the columns)
+for CSV. Records are validated a batch of IMPORT_CHUNK_ROWS at a time, and
+each batch that validates is inserted with one executemany INSERT and the
+catalog bookkeeping (categories, supplier_categories, counters) in its own
+transaction. Neither the body nor the rows are ever held in full.
+
+A record that does not parse or validate is skipped and reported by the
+line of the body it starts on; the rest of its batch still goes in. A line
+longer than IMPORT_MAX_LINE_BYTES, or not valid UTF-8, is dropped up to the
+next newline and reported the same way. If a batch fails in the database, that batch is
+rolled back and each of its rows is reported.
+"""
+import codecs
+import csv
+import os
+from collections import Counter as Tally
+from typing import AsyncIterator, Optional
+from uuid import UUID
+
+import orjson
+from pydantic import ValidationError
+from sqlalchemy import insert
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.orm import Session
+
+from catalog import add_products, add_supplier_categories, canonical_category, get_or_create_categories
+from models import Product
+from schemas.products_schema import ProductImportRow
+
+IMPORT_CHUNK_ROWS = int(os.getenv("IMPORT_CHUNK_ROWS", "500"))
+# a longer line is skipped and reported instead of being buffered
+IMPORT_MAX_LINE_BYTES = int(os.getenv("IMPORT_MAX_LINE_BYTES", str(64 * 1024)))
+# the response lists at most this many errors, the count covers all of them
+IMPORT_MAX_ERRORS = int(os.getenv("IMPORT_MAX_ERRORS", "1000"))
+
+NDJSON_TYPES = {"application/x-ndjson", "application/ndjson", "application/jsonl", "application/json-seq"}
+CSV_TYPES = {"text/csv", "application/csv"}
+
+
+class RowError(str):
+    """Why a record couldn't be read; kept apart from records that parse to a string."""
+
+
+def _decoded(number: int, raw: bytes) -> tuple[int, str, Optional[str]]:
+    try:
+        return number, raw.decode("utf-8"), None
+    except UnicodeDecodeError:
+        return number, "", "line is not valid UTF-8"
+
+
+async def iter_lines(chunks: AsyncIterator[bytes]) -> AsyncIterator[tuple[int, str, Optional[str]]]:
+    """
+    Split a byte stream into lines and yield (line number, line decoded as
+    UTF-8 with its newline, None) for each. A line that can't be read comes
+    out as (line number, "", error message): one over IMPORT_MAX_LINE_BYTES
+    is dropped up to its newline, one that isn't UTF-8 is dropped whole.
+    """
+    # no UTF-8 multibyte sequence contains the newline byte, so splitting
+    # the raw bytes first is safe and keeps a bad line from spoiling others
+    pending = b""
+    number = 0
+    too_long = f"line longer than {IMPORT_MAX_LINE_BYTES} bytes"
+    # inside a runaway line, discarding until its newline
+    skipping = False
+    async for chunk in chunks:
+        pending += chunk
+        *lines, pending = pending.split(b"\n")
+        for raw in lines:
+            number += 1
+            if skipping or len(raw) > IMPORT_MAX_LINE_BYTES:
+                skipping = False
+                yield number, "", too_long
+                continue
+            if number == 1:
+                raw = raw.removeprefix(codecs.BOM_UTF8)
+            yield _decoded(number, raw + b"\n")
+        if len(pending) > IMPORT_MAX_LINE_BYTES:
+            skipping = True
+            pending = b""
+    if skipping:
+        yield number + 1, "", too_long
+    elif pending:
+        yield _decoded(number + 1, pending.removeprefix(codecs.BOM_UTF8) if number == 0 else pending)
+
+
+Lines = AsyncIterator[tuple[int, str, Optional[str]]]
+
+
+async def ndjson_records(lines: Lines) -> AsyncIterator[tuple[int, object]]:
+    """(line number, parsed value or a RowError) for each non-blank line."""
+    async for number, line, error in lines:
+        if error is not None:
+            yield number, RowError(error)
+            continue
+        if not line.strip():
+            continue
+        try:
+            yield number, orjson.loads(line.strip())
+        except orjson.JSONDecodeError as exc:
+            yield number, RowError(f"invalid JSON: {exc}")
+
+
+async def csv_records(lines: Lines) -> AsyncIterator[tuple[int, object]]:
+    """(line the record starts on, dict keyed by the header or a RowError) for each CSV record."""
+    header: Optional[list[str]] = None
+    record = ""
+    start = 0
+    async for number, line, error in lines:
+        if not record:
+            start = number
+        if error is not None:
+            # an unreadable line takes the record it belongs to with it
+            yield start, RowError(error)
+            record = ""
+            if header is None:
+                # without the header no later record can be read
+                return
+            continue
+        record += line
+        # RFC 4180 doubles quotes inside fields, so an odd count means the
+        # record continues on the next line
+        if record.count('"') % 2:
+            continue
+        text, record = record, ""
+        if not text.strip():
+            continue
+        fields = next(csv.reader([text]))
+        if header is None:
+            header = [name.strip().lower() for name in fields]
+            continue
+        if len(fields) != len(header):
+            yield start, RowError(f"expected {len(header)} columns, got {len(fields)}")
+            continue
+        # empty cells are missing values, not empty strings
+        yield start, {name: value for name, value in zip(header, fields) if value != ""}
+    if record.strip():
+        yield start, RowError("unterminated quoted field")
+
+
+def validate(record: object) -> ProductImportRow | str:
+    if isinstance(record, RowError):
+        return str(record)
+    if not isinstance(record, dict):
+        return "expected an object"
+    try:
+        return ProductImportRow.model_validate(record)
+    except ValidationError as exc:
+        return "; ".join(
+            f"{'.'.join(map(str, error['loc'])) or 'row'}: {error['msg']}" for error in exc.errors()
+        )
+
+
+def insert_chunk(db: Session, supplier_id: UUID, rows: list[ProductImportRow]) -> set[str]:
+    """
+    Insert `rows` for the supplier with the bookkeeping create_product does;
+    the caller commits. Returns the cache tags to invalidate afterwards.
+    """
+    category_ids = get_or_create_categories(db, {row.category for row in rows})
+    db.execute(
+        insert(Product),
+        [
+            {
+                "name": row.name,
+                "description": row.description,
+                "price": row.price,
+                "category": row.category,
+                "category_id": category_ids[row.category],
+                "supplier_id": supplier_id,
+            }
+            for row in rows
+        ],
+    )
+    add_supplier_categories(db, supplier_id, Tally(category_ids[row.category] for row in rows))
+    add_products(db, supplier_id, len(rows))
+    return {"products", f"supplier:{supplier_id}"} | {f"category:{canonical_category(row.category)}" for row in rows}
+
+
+class ImportReport:
+    def __init__(self):
+        self.inserted = 0
+        self.failed = 0
+        self.errors: list[dict] = []
+
+    def error(self, row: int, message: str) -> None:
+        self.failed += 1
+        if len(self.errors) < IMPORT_MAX_ERRORS:
+            self.errors.append({"row": row, "error": message})
+
+    def result(self) -> dict:
+        return {
+            "inserted": self.inserted,
+            "failed": self.failed,
+            "errors": self.errors,
+            "errors_truncated": self.failed > len(self.errors),
+        }
+
+
+async def import_products(db, supplier_id: UUID, records: AsyncIterator[tuple[int, object]], invalidate) -> dict:
+    """
+    Validate and insert `records` in chunks through the AsyncSession `db`;
+    `invalidate(*tags)` is called after each committed chunk.
+    """
+    report = ImportReport()
+    batch: list[tuple[int, ProductImportRow]] = []
+
+    async def flush() -> None:
+        if not batch:
+            return
+        rows = [row for _, row in batch]
+        try:
+            tags = await db.run_sync(insert_chunk, supplier_id, rows)
+            await db.commit()
+        except DBAPIError as exc:
+            await db.rollback()
+            for number, _ in batch:
+                report.error(number, f"not saved, its batch failed: {exc.orig}")
+        else:
+            report.inserted += len(rows)
+            invalidate(*tags)
+        batch.clear()
+
+    async for number, record in records:
+        row = validate(record)
+        if isinstance(row, str):
+            report.error(number, row)
+            continue
+        batch.append((number, row))
+        if len(batch) >= IMPORT_CHUNK_ROWS:
+            await flush()
+    await flush()
+    return report.result()
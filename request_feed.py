@@ -0,0 +1,171 @@
+"""
+Live feed of new requests for suppliers.
+
+create_request publishes every committed RequestPost to the hub of the worker
+that handled it; the hub hands it to the suppliers connected to that worker
+whose categories match. With FEED_BROKER=outbox the event is also written
+to the feed_events table in the same transaction, and every worker tails
+that table so suppliers connected anywhere hear about it.
+"""
+import asyncio
+import json
+import logging
+import os
+import time
+import uuid
+from datetime import timedelta
+from typing import Optional
+from uuid import UUID
+
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import delete, func, select
+from sqlalchemy.orm import Session
+
+from auth_tokens import utcnow
+from database import SessionLocal
+from models import FeedEvent
+
+logger = logging.getLogger(__name__)
+
+FEED_BROKER = os.getenv("FEED_BROKER", "local")  # "local" or "outbox"
+FEED_QUEUE_SIZE = int(os.getenv("FEED_QUEUE_SIZE", "100"))
+FEED_HEARTBEAT_SECONDS = float(os.getenv("FEED_HEARTBEAT_SECONDS", "15"))
+FEED_POLL_SECONDS = float(os.getenv("FEED_POLL_SECONDS", "1"))
+# how long after a row shows up an outbox row with a lower id may still commit
+FEED_SETTLE_SECONDS = float(os.getenv("FEED_SETTLE_SECONDS", "10"))
+FEED_RETENTION = timedelta(hours=1)
+
+# tells the client it missed events and should reload the REST feed
+RESYNC = {"type": "resync"}
+
+WORKER_ID = uuid.uuid4().hex
+
+
+class Subscription:
+    def __init__(self, supplier_id: UUID, categories: set[int]):
+        self.supplier_id = supplier_id
+        self.categories = categories
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=FEED_QUEUE_SIZE)
+
+    def offer(self, event: dict) -> None:
+        if self.queue.full():
+            # a slow consumer must not hold memory or stall the publisher:
+            # drop its backlog and ask it to resync from the REST feed
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            self.queue.put_nowait(RESYNC)
+        self.queue.put_nowait(event)
+
+
+class RequestFeedHub:
+    """In-process fan-out of request events, indexed by category."""
+
+    def __init__(self):
+        self._by_category: dict[int, set[Subscription]] = {}
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def bind(self, loop: asyncio.AbstractEventLoop) -> None:
+        self._loop = loop
+
+    def subscribe(self, supplier_id: UUID, categories: set[int]) -> Subscription:
+        subscription = Subscription(supplier_id, set())
+        self.update_categories(subscription, categories)
+        return subscription
+
+    def update_categories(self, subscription: Subscription, categories: set[int]) -> None:
+        for category in subscription.categories - categories:
+            self._by_category[category].discard(subscription)
+            if not self._by_category[category]:
+                del self._by_category[category]
+        for category in categories - subscription.categories:
+            self._by_category.setdefault(category, set()).add(subscription)
+        subscription.categories = set(categories)
+
+    def unsubscribe(self, subscription: Subscription) -> None:
+        self.update_categories(subscription, set())
+
+    def publish(self, event: dict) -> None:
+        """Deliver an event; must run on the hub's event loop."""
+        for subscription in list(self._by_category.get(event.get("category_id"), ())):
+            subscription.offer(event)
+
+    def publish_threadsafe(self, event: dict) -> None:
+        """Deliver an event from a threadpool route."""
+        if self._loop is not None and not self._loop.is_closed():
+            self._loop.call_soon_threadsafe(self.publish, event)
+
+
+request_feed = RequestFeedHub()
+
+
+def record_event(db: Session, event: dict) -> None:
+    """Add the event to the outbox in the caller's transaction, if enabled."""
+    if FEED_BROKER == "outbox":
+        db.add(FeedEvent(origin=WORKER_ID, category_id=event.get("category_id"), payload=json.dumps(event)))
+
+
+class OutboxCursor:
+    """
+    Which outbox rows this worker has relayed.
+
+    Ids are handed out when a row is inserted but become visible when its
+    transaction commits, so on Postgres a row can appear after rows with
+    higher ids were already read; `id > last id` would skip it for good.
+    Instead every id above `floor` is listed on each poll and the unseen
+    ones are read. The floor only moves past ids seen FEED_SETTLE_SECONDS
+    ago, so a transaction that commits within that window is still caught.
+    """
+
+    def __init__(self):
+        self.floor: Optional[int] = None
+        # id -> monotonic time it was first read
+        self.seen: dict[int, float] = {}
+
+    def settle(self, now: float) -> None:
+        settled = [i for i, at in self.seen.items() if at <= now - FEED_SETTLE_SECONDS]
+        if settled:
+            self.floor = max(self.floor, *settled)
+            self.seen = {i: at for i, at in self.seen.items() if i > self.floor}
+
+
+def _read_outbox(cursor: OutboxCursor) -> list[dict]:
+    with SessionLocal() as db:
+        if cursor.floor is None:
+            # start from now; older events were for suppliers already served
+            cursor.floor = db.scalar(select(func.coalesce(func.max(FeedEvent.id), 0)))
+            return []
+        ids = db.scalars(select(FeedEvent.id).where(FeedEvent.id > cursor.floor).order_by(FeedEvent.id)).all()
+        unseen = [i for i in ids if i not in cursor.seen][:500]
+        rows = db.execute(
+            select(FeedEvent.id, FeedEvent.origin, FeedEvent.payload)
+            .where(FeedEvent.id.in_(unseen))
+            .order_by(FeedEvent.id)
+        ).all() if unseen else []
+    now = time.monotonic()
+    for row in rows:
+        cursor.seen[row.id] = now
+    cursor.settle(now)
+    return [json.loads(row.payload) for row in rows if row.origin != WORKER_ID]
+
+
+def _prune_outbox() -> None:
+    with SessionLocal() as db:
+        db.execute(delete(FeedEvent).where(FeedEvent.created_at < utcnow() - FEED_RETENTION))
+        db.commit()
+
+
+async def tail_outbox() -> None:
+    """Relay events written by other workers to this worker's subscribers."""
+    cursor = OutboxCursor()
+    polls = 0
+    while True:
+        try:
+            events = await run_in_threadpool(_read_outbox, cursor)
+            for event in events:
+                request_feed.publish(event)
+            polls += 1
+            if polls % 600 == 0:
+                await run_in_threadpool(_prune_outbox)
+        except Exception:
+            logger.exception("request feed outbox poll failed")
+        await asyncio.sleep(FEED_POLL_SECONDS)
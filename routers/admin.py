@@ -1,20 +1,26 @@
-from datetime import datetime, timedelta, timezone
+from datetime import date, datetime, timedelta, timezone
 from typing import List, Dict, Optional
+from uuid import UUID
 
-from fastapi import APIRouter, Depends, HTTPException, status, Query
+from fastapi import APIRouter, Depends, HTTPException, Response, status, Query
 from sqlalchemy.orm import Session
-from sqlalchemy import func
+from sqlalchemy import case, func, select
 
-from database import get_db
-from models import User
-from schemas import UserOut, UserUpdate, StatsResponse
-from auth import get_current_user
+from auth_tokens import CurrentUser, token_cache
+from cache import response_cache
+from catalog import add_products
+from database import get_db, get_read_db
+from models import DailyStat, DeviceToken, User
+from schemas.admin_schema import DailyStatOut, UserOut, UserUpdate, StatsResponse
+from routers.auth import get_current_user
+from serialization import render_list
+from stats import COUNTERS, NO_CATEGORY
 
 # Router for admin-only operations\
 admin_router = APIRouter(prefix="/admin", tags=["admin"], dependencies=[Depends(get_current_user)])
 
 # Dependency to check admin role
-def require_admin(current_user: User = Depends(get_current_user)):
+def require_admin(current_user: CurrentUser = Depends(get_current_user)):
     if current_user.role != "admin":
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Admin privileges required")
     return current_user
@@ -25,8 +31,8 @@ def list_users(
     limit: int = 100,
     role: Optional[str] = Query(None, description="Filter by role"),
     status: Optional[str] = Query(None, description="Filter by user status"),
-    db: Session = Depends(get_db),
-    _: User = Depends(require_admin)
+    db: Session = Depends(get_read_db),
+    _: CurrentUser = Depends(require_admin)
 ):
     """
     List users with optional filters.
@@ -41,9 +47,9 @@ def list_users(
 
 @admin_router.get("/users/{user_id}", response_model=UserOut)
 def get_user(
-    user_id: str,
-    db: Session = Depends(get_db),
-    _: User = Depends(require_admin)
+    user_id: UUID,
+    db: Session = Depends(get_read_db),
+    _: CurrentUser = Depends(require_admin)
 ):
     """
     Retrieve a single user's details.
@@ -55,10 +61,10 @@ def get_user(
 
 @admin_router.patch("/users/{user_id}", response_model=UserOut)
 def update_user(
-    user_id: str,
+    user_id: UUID,
     data: UserUpdate,
     db: Session = Depends(get_db),
-    _: User = Depends(require_admin)
+    _: CurrentUser = Depends(require_admin)
 ):
     """
     Update user fields like status or role.
@@ -66,18 +72,24 @@ def update_user(
     user = db.query(User).filter(User.id == user_id).first()
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
-    for field, value in data.dict(exclude_unset=True).items():
+    changes = data.dict(exclude_unset=True)
+    for field, value in changes.items():
         setattr(user, field, value)
+    if changes.get("status") == "disabled":
+        # a disabled account is signed out on every device
+        db.query(DeviceToken).filter(DeviceToken.user_id == user_id).delete(synchronize_session=False)
     db.add(user)
     db.commit()
+    # cached tokens carry the old role and status; user_id, since the commit expired `user`
+    token_cache.invalidate_user(user_id)
     db.refresh(user)
     return user
 
 @admin_router.delete("/users/{user_id}", status_code=204)
 def delete_user(
-    user_id: str,
+    user_id: UUID,
     db: Session = Depends(get_db),
-    _: User = Depends(require_admin)
+    _: CurrentUser = Depends(require_admin)
 ):
     """
     Delete a user (hard delete).
@@ -86,14 +98,19 @@ def delete_user(
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
     db.delete(user)
+    if user.product_count:
+        add_products(db, None, -user.product_count)
     db.commit()
+    token_cache.invalidate_user(user_id)
+    if user.role == "supplier":
+        response_cache.invalidate("catalog")
     return
 
 @admin_router.get("/stats/users", response_model=StatsResponse)
 def user_stats(
     period_days: int = Query(30, description="Days back to calculate stats from"),
-    db: Session = Depends(get_db),
-    _: User = Depends(require_admin)
+    db: Session = Depends(get_read_db),
+    _: CurrentUser = Depends(require_admin)
 ) -> StatsResponse:
     """
     Return user statistics: total, active, disabled, new in period.
@@ -101,10 +118,15 @@ def user_stats(
     now = datetime.now(timezone.utc)
     since = now - timedelta(days=period_days)
 
-    total = db.query(func.count(User.id)).scalar()
-    active = db.query(func.count(User.id)).filter(User.status == 'active').scalar()
-    disabled = db.query(func.count(User.id)).filter(User.status == 'disabled').scalar()
-    new_users = db.query(func.count(User.id)).filter(User.created_at >= since).scalar()
+    # one pass over users instead of a COUNT per figure
+    total, active, disabled, new_users = db.execute(
+        select(
+            func.count(),
+            func.count(case((User.status == 'active', 1))),
+            func.count(case((User.status == 'disabled', 1))),
+            func.count(case((User.created_at >= since, 1))),
+        ).select_from(User)
+    ).one()
 
     return StatsResponse(
         total_users=total,
@@ -113,3 +135,40 @@ def user_stats(
         new_users=new_users,
         period_days=period_days
     )
+
+@admin_router.get("/stats/daily", response_model=List[DailyStatOut])
+def daily_stats(
+    start: Optional[date] = Query(None, description="First day (UTC), default 30 days before end"),
+    end: Optional[date] = Query(None, description="Last day (UTC), default today"),
+    category_id: Optional[int] = Query(None, description=f"Only this category ({NO_CATEGORY} = uncategorised)"),
+    per_category: bool = Query(False, description="One row per day and category instead of per day"),
+    db: Session = Depends(get_read_db),
+    _: CurrentUser = Depends(require_admin)
+):
+    """
+    Signups, requests, offers, orders and GMV per day from the daily_stats
+    rollup, oldest day first. Days with no activity are left out.
+    """
+    end = end or datetime.now(timezone.utc).date()
+    start = start or end - timedelta(days=30)
+    if start > end:
+        raise HTTPException(status_code=400, detail="start is after end")
+    if (end - start).days > 366 * 5:
+        raise HTTPException(status_code=400, detail="range is limited to five years")
+
+    if per_category or category_id is not None:
+        query = select(DailyStat.__table__).order_by(DailyStat.day, DailyStat.category_id)
+        if category_id is not None:
+            query = query.where(DailyStat.category_id == category_id)
+        rows = db.execute(query.where(DailyStat.day.between(start, end))).all()
+    else:
+        totals = [func.sum(getattr(DailyStat, name)).label(name) for name in COUNTERS]
+        rows = db.execute(
+            select(DailyStat.day, *totals)
+            .where(DailyStat.day.between(start, end))
+            .group_by(DailyStat.day)
+            .order_by(DailyStat.day)
+        ).all()
+    # a year per category is thousands of rows; skip the response_model round trip
+    return Response(render_list([dict(row._mapping) for row in rows], DailyStatOut), media_type="application/json")
+
@@ -1,24 +1,25 @@
 from typing import Optional
-from sqlalchemy.orm import Session
-from database import get_db
+from sqlalchemy import delete, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from auth_tokens import CurrentUser, hash_token, last_used, new_token, token_cache, token_expiry, utcnow
+from database import get_async_db
 from fastapi import APIRouter, Depends, HTTPException, status
-from models import User
-from schemas.auth_schema import AuthBase as AuthCreate, AuthResponse, PasswordChange, PasswordResetRequest
-import bcrypt
+from fastapi.security import HTTPAuthorizationCredentials, HTTPBearer
+from models import DeviceToken, User
+from schemas.auth_schema import AuthBase as AuthCreate, AuthResponse, LoginRequest, PasswordChange, PasswordResetRequest
+from password_hashing import password_hasher
 from uuid import UUID
 import string
 import secrets
 
 def verify_password(plain_password: str, hashed_password: str) -> bool:
-    """Verifies if a given password matches the stored hash."""
-    return bcrypt.checkpw(plain_password.encode(), hashed_password.encode())
+    """Verifies if a given password matches the stored hash. Blocks; not for async routes."""
+    return password_hasher.verify_sync(plain_password, hashed_password)
 
 # Hash password
 def hash_password(password: str) -> str:
-    """Hashes a password using bcrypt."""
-    salt = bcrypt.gensalt()
-    hashed_password = bcrypt.hashpw(password.encode(), salt)
-    return hashed_password.decode()
+    """Hashes a password using bcrypt. Blocks; not for async routes."""
+    return password_hasher.hash_sync(password)
 
 def create_reset_pin(length: int = 8) -> str:
     """
@@ -31,65 +32,158 @@ def create_reset_pin(length: int = 8) -> str:
     alphabet = string.ascii_letters + string.digits
     return ''.join(secrets.choice(alphabet) for _ in range(length))
 
-def authenticate_user(db: Session,  password: str, user_id) -> Optional[User]:
-    user = db.query(User).filter(User.id == user_id).first()
-    if not user or not verify_password(password, user.password_hash):
+async def authenticate_user(db: AsyncSession,  password: str, user_id) -> Optional[User]:
+    user = await db.scalar(select(User).where(User.id == user_id))
+    if not user or not user.password_hash or not await password_hasher.verify(password, user.password_hash):
         return None
+    # upgrade hashes made with an older cost factor while we have the password
+    if password_hasher.needs_rehash(user.password_hash):
+        user.password_hash = await password_hasher.hash(password)
+        await db.commit()
     return user
 
 
+bearer_scheme = HTTPBearer(auto_error=False)
+
+
+def _unauthorized(detail: str) -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_401_UNAUTHORIZED,
+        detail=detail,
+        headers={"WWW-Authenticate": "Bearer"},
+    )
+
+
+async def get_current_user(
+    credentials: Optional[HTTPAuthorizationCredentials] = Depends(bearer_scheme),
+    db: AsyncSession = Depends(get_async_db),
+) -> CurrentUser:
+    """
+    Resolve the bearer token issued by /auth/access to its user.
+
+    A token seen recently is answered from the in-memory cache without
+    touching the database; last_used is recorded in memory and written
+    back in batches.
+    """
+    if credentials is None:
+        raise _unauthorized("Not authenticated")
+    key = hash_token(credentials.credentials)
+
+    current_user = token_cache.get(key)
+    if current_user is None:
+        row = (
+            await db.execute(
+                select(DeviceToken, User)
+                .join(User, User.id == DeviceToken.user_id)
+                .where(DeviceToken.token == key)
+            )
+        ).first()
+        if row is None or row.DeviceToken.expires_at <= utcnow():
+            raise _unauthorized("Invalid or expired token")
+        token, user = row
+        current_user = CurrentUser(user.id, user.role, user.status, token.id, token.device_id)
+        token_cache.put(key, current_user, token.expires_at)
+
+    if current_user.status == "disabled":
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="account disabled")
+    last_used.touch(current_user.token_id)
+    return current_user
+
+
+async def revoke_user_tokens(db: AsyncSession, user_id: UUID) -> None:
+    """
+    Sign the user out everywhere and commit, together with whatever credential
+    change is pending on `db`. The token cache is cleared only after the
+    commit, so a concurrent request can't cache a token the database still has.
+    """
+    await db.execute(delete(DeviceToken).where(DeviceToken.user_id == user_id))
+    await db.commit()
+    token_cache.invalidate_user(user_id)
+
+
 # Create a new router for users
 auth_router = APIRouter(prefix="/auth",tags=["Auth"])
 
 # add password to a user and change status to active
 @auth_router.post("/create_password", response_model=AuthResponse)
-def add_password(auth:AuthCreate , db:Session = Depends(get_db)):
+async def add_password(auth:AuthCreate , db: AsyncSession = Depends(get_async_db)):
     # check if the user exists 
-    user = db.query(User).filter(User.id == auth.user_id).first()
+    user = await db.scalar(select(User).where(User.id == auth.user_id))
     
     if not user :
         raise HTTPException(status_code=404, detail="user not found")
     
     #if user exist add password and change status
-    hash_pass = hash_password(auth.password)
-    
-    user.password_hash = hash_password
+    user.password_hash = await password_hasher.hash(auth.password)
     user.status = "active"
-    db.commit()
-    db.refresh(user)
-    return user
+    await db.commit()
+    return AuthResponse(user_id=user.id, status=user.status, role=user.role)
 
 
 @auth_router.post("/forgot-password")
-async def forgot_password(request: PasswordResetRequest, db: Session = Depends(get_db)):
-    user = db.query(User).filter(User.email == request.email).first()
+async def forgot_password(request: PasswordResetRequest, db: AsyncSession = Depends(get_async_db)):
+    user = await db.scalar(select(User).where(User.email == request.email))
     if user:
         # generate reset password and send email
         reset_token = create_reset_pin()
-        user.password_hash = hash_password(reset_token)
-        print(reset_token)
-        # TODO: send email with the new password
+        user.password_hash = await password_hasher.hash(reset_token)
+        await revoke_user_tokens(db, user.id)
+        # TODO: send email with the new password; it is never printed or logged
     return
 
 
 # Endpoints
 @auth_router.post("/access", response_model=AuthResponse)
-async def login(form_data: AuthCreate, db: Session = Depends(get_db)):
-    user = authenticate_user(db,form_data.password,form_data.user_id)
+async def login(form_data: LoginRequest, db: AsyncSession = Depends(get_async_db)):
+    user = await authenticate_user(db,form_data.password,form_data.user_id)
     
     if not user:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect username or password",
         )
-    return user
+
+    # one live token per device: logging in again replaces the old one
+    device_id = form_data.device_id or new_token()
+    await db.execute(
+        delete(DeviceToken).where(DeviceToken.user_id == user.id, DeviceToken.device_id == device_id)
+    )
+    token = new_token()
+    expires_at = token_expiry()
+    db.add(DeviceToken(
+        user_id=user.id,
+        device_id=device_id,
+        token=hash_token(token),
+        expires_at=expires_at,
+    ))
+    await db.commit()
+    token_cache.invalidate_user(user.id, device_id)
+    return AuthResponse(user_id=user.id, status=user.status, role=user.role, token=token, expires_at=expires_at)
+
+
+@auth_router.get("/me", response_model=AuthResponse)
+async def me(current_user: CurrentUser = Depends(get_current_user)):
+    return AuthResponse(user_id=current_user.id, status=current_user.status, role=current_user.role)
+
+
+@auth_router.post("/logout", status_code=204)
+async def logout(
+    credentials: Optional[HTTPAuthorizationCredentials] = Depends(bearer_scheme),
+    db: AsyncSession = Depends(get_async_db),
+):
+    if credentials is None:
+        raise _unauthorized("Not authenticated")
+    key = hash_token(credentials.credentials)
+    await db.execute(delete(DeviceToken).where(DeviceToken.token == key))
+    await db.commit()
+    token_cache.invalidate(key)
 
 
 @auth_router.post("/change-password")
-async def change_password(data: PasswordChange, db: Session = Depends(get_db)):
+async def change_password(data: PasswordChange, db: AsyncSession = Depends(get_async_db)):
     
     #verify if the current password matches with the one supplied from the user
-    user = authenticate_user(db,data.old_password,data.user_id)
+    user = await authenticate_user(db,data.old_password,data.user_id)
     
     if not user:
         raise HTTPException(
@@ -97,8 +191,8 @@ async def change_password(data: PasswordChange, db: Session = Depends(get_db)):
             detail="incorrect password"
         )
         
-    user.password_hash = hash_password(data.new_password)
-    db.commit()
+    user.password_hash = await password_hasher.hash(data.new_password)
+    await revoke_user_tokens(db, user.id)
     return {"msg":"succesful"}
 
 
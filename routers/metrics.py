@@ -0,0 +1,10 @@
+from fastapi import APIRouter
+from cache import response_cache
+
+metrics_router = APIRouter(prefix="/metrics", tags=["metrics"])
+
+
+# hit/miss counters of this worker's response cache
+@metrics_router.get("/cache")
+def cache_metrics():
+    return response_cache.snapshot()
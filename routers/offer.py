@@ -1,9 +1,20 @@
-from typing import List
-from sqlalchemy.orm import Session
-from database import get_db
-from fastapi import APIRouter, Depends, HTTPException, HTTPException
-from models import Offer, Order, RequestPost, User
+import asyncio
+import json
+from typing import List, Optional
+from sqlalchemy import exists, select, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session, contains_eager
+from catalog import supplier_carries
+from database import AsyncReadSessionLocal, get_db, get_read_db
+from fastapi import APIRouter, Depends, HTTPException, HTTPException, Query
+from fastapi.responses import StreamingResponse
+from models import Offer, Order, RequestPost, SupplierCategory, User
+from pagination import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, apply_keyset, make_page
 from schemas.offer_schema import OfferAction, OfferCreate, OfferRead, RequestRead,OfferAccept
+from schemas.pagination_schema import Page
+from request_feed import FEED_HEARTBEAT_SECONDS, RESYNC, request_feed
+from schemas.request_schema import Request as RequestBase
+from stats import record_daily
 from uuid import UUID
 
         
@@ -12,22 +23,106 @@ offer_router = APIRouter(prefix="/offers", tags=["offers"])
 
 
 # fetch all the requests that a supplier can respond to
-@offer_router.get("/requests/{supplier_id}")
+@offer_router.get("/requests/{supplier_id}", response_model=Page[RequestBase])
 def get_requests_for_supplier(
     supplier_id: UUID ,
-    db: Session = Depends(get_db),
+    cursor: Optional[str] = None,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    db: Session = Depends(get_read_db),
 ):
     current_user = db.query(User).filter(User.id == supplier_id).first()
-    # pull the supplier’s categories
-    categories = {p.category for p in current_user.products}
-    # find all open requests matching those categories
-    return (
+    if not current_user:
+        raise HTTPException(404, "Supplier not found")
+    # find all open requests in the categories the supplier carries
+    query = (
         db.query(RequestPost)
+          .join(SupplierCategory, SupplierCategory.category_id == RequestPost.category_id)
+          .filter(SupplierCategory.supplier_id == supplier_id)
           .filter(RequestPost.status == "open")
-          .filter(RequestPost.category.in_(categories))
-          .all()
     )
+    requests = apply_keyset(query, RequestPost, cursor, limit).all()
+    return make_page(requests, limit)
+
+
+async def _supplier_categories(supplier_id: UUID) -> set[int]:
+    async with AsyncReadSessionLocal() as db:
+        rows = await db.scalars(select(SupplierCategory.category_id).where(SupplierCategory.supplier_id == supplier_id))
+        return set(rows)
+
+
+# live version of the feed above: new matching requests are pushed as
+# server-sent events instead of being polled for
+@offer_router.get("/requests/{supplier_id}/stream")
+async def stream_requests_for_supplier(supplier_id: UUID):
+    async with AsyncReadSessionLocal() as db:
+        if await db.get(User, supplier_id) is None:
+            raise HTTPException(404, "Supplier not found")
+    subscription = request_feed.subscribe(supplier_id, await _supplier_categories(supplier_id))
+
+    async def events():
+        try:
+            yield "retry: 5000\n\n"
+            while True:
+                try:
+                    event = await asyncio.wait_for(subscription.queue.get(), FEED_HEARTBEAT_SECONDS)
+                except asyncio.TimeoutError:
+                    # keeps proxies from closing an idle stream, and picks up
+                    # categories the supplier started carrying since
+                    request_feed.update_categories(subscription, await _supplier_categories(supplier_id))
+                    yield ": keep-alive\n\n"
+                    continue
+                if event is RESYNC:
+                    yield "event: resync\ndata: {}\n\n"
+                else:
+                    yield f"event: request\nid: {event['id']}\ndata: {json.dumps(event)}\n\n"
+        finally:
+            request_feed.unsubscribe(subscription)
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+# the literal path has to be registered before /{request_id}/ or it is never reached
+# accept offer at face value
+@offer_router.post("/accept_request/")
+def accept_request(offer: OfferAccept,
+                   db:Session=Depends(get_db)):
+    """_summary_
+
+    Args:
+        offer (OfferAccept): _description_
+        db (Session, optional): _description_. Defaults to Depends(get_db).
 
+    Raises:
+        HTTPException: _description_
+        HTTPException: _description_
+
+    Returns:
+        _type_: _description_
+    """
+    req = db.query(RequestPost).filter_by(id=offer.request_id, status="open").first()
+    if not req:
+        raise HTTPException(404, "Request not found or not open")
+    current_user = db.query(User).filter(User.id == offer.supplier_id).first()
+    if not current_user:
+        raise HTTPException(404, "Supplier not found")
+    # ensure supplier actually has a matching product (optional)
+    if not supplier_carries(db, current_user.id, req.category_id):
+        raise HTTPException(403, "You don’t carry that category")
+
+    offer = Offer(
+        request_id  = req.id,
+        supplier_id = current_user.id,
+        proposed    = req.offer_price,
+    )
+    db.add(offer)
+    record_daily(db, req.category_id, offers=1)
+    db.commit()
+    db.refresh(offer)
+    return offer    
 
 # creating a counter offer
 @offer_router.post("/{request_id}/", response_model=OfferRead)
@@ -40,8 +135,10 @@ def make_offer(
     if not req:
         raise HTTPException(404, "Request not found or not open")
     current_user = db.query(User).filter(User.id == offer_in.supplier_id).first()
+    if not current_user:
+        raise HTTPException(404, "Supplier not found")
     # ensure supplier actually has a matching product (optional)
-    if req.category not in {p.category for p in current_user.products}:
+    if not supplier_carries(db, current_user.id, req.category_id):
         raise HTTPException(403, "You don’t carry that category")
 
     offer = Offer(
@@ -50,6 +147,7 @@ def make_offer(
         proposed    = offer_in.proposed,
     )
     db.add(offer)
+    record_daily(db, req.category_id, offers=1)
     db.commit()
     db.refresh(offer)
     return offer
@@ -58,17 +156,17 @@ def make_offer(
 @offer_router.get("/requests/{request_id}/offers/", response_model=List[OfferRead])
 def list_offers(
     request_id: UUID,
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_read_db),
 ):
-    req = db.query(RequestPost).filter_by(id=request_id).first()
-    if not req:
+    if not db.query(exists().where(RequestPost.id == request_id)).scalar():
         raise HTTPException(404, "Not your request or doesn’t exist")
-    return req.offers
+    return db.query(Offer).filter(Offer.request_id == request_id).all()
 
 
 #Accept / decline a specific offer
 
-# verify this sketchy logic i just wrote
+# a request is accepted once: the conditional UPDATEs below let exactly one of
+# several concurrent accepts through, and uq_orders_request_id backs them up
 @offer_router.patch("/offers/{offer_id}/")
 def respond_to_offer(
     offer_id: UUID,
@@ -83,8 +181,8 @@ def respond_to_offer(
         db (Session, optional): _description_. Defaults to Depends(get_db).
 
     Raises:
-        HTTPException: _description_
-        HTTPException: _description_
+        HTTPException: 404 if the offer is not the customer's, 400 if it was
+            already answered, 409 if the request was accepted meanwhile
 
     Returns:
         order: The created order object if the offer is accepted, otherwise a message indicating rejection.
@@ -93,6 +191,7 @@ def respond_to_offer(
     offer = (
         db.query(Offer)
           .join(RequestPost)
+          .options(contains_eager(Offer.request))
           .filter(Offer.id == offer_id)
           .filter(RequestPost.customer_id == action.customer_id)
           .first()
@@ -101,72 +200,55 @@ def respond_to_offer(
         raise HTTPException(404, "Offer not found or not yours")
     if offer.status != "pending":
         raise HTTPException(400, "Offer already responded to")
-
-    offer.status = "accepted" if action.action == "accept" else "rejected"
-    # if accepted, you may also want to close the request:
-    if action.action == "accept":
-        offer.request.status = "accepted"
-
-        # Reject all other offers for this request
-        other_offers = (
-            db.query(Offer)
-            .filter(Offer.request_id == offer.request.id)
-            .filter(Offer.id != offer.id)
-            .filter(Offer.status == "pending")
-            .all()
-        )
-        for other_offer in other_offers:
-            other_offer.status = "rejected"
-        
-        #create an order if the requested is accepted by the customer
-        order = Order(
-            request_id = offer.request.id,
-            offer_id = offer.id,
-            customer_id = offer.request.customer_id,
-            supplier_id = offer.supplier_id,
-            status = "placed",
-            total_price = offer.proposed,
-            quantity = offer.request.quantity
-        )
-        db.add(order)
-        db.commit()
-        db.refresh(order)
-        return order
-    else:
+    request = offer.request
+
+    def claim(model, row_id, expected: str, status: str) -> bool:
+        # matches nothing if someone else moved the row on since we read it
+        return db.execute(
+            update(model)
+            .where(model.id == row_id, model.status == expected)
+            .values(status=status)
+            .execution_options(synchronize_session=False)
+        ).rowcount == 1
+
+    if action.action != "accept":
+        if not claim(Offer, offer.id, "pending", "rejected"):
+            db.rollback()
+            raise HTTPException(400, "Offer already responded to")
         db.commit()
         return {"msg":"offer rejected"}
 
-# accept offer at face value
-@offer_router.post("/accept_request/")
-def accept_request(offer: OfferAccept,
-                   db:Session=Depends(get_db)):
-    """_summary_
-
-    Args:
-        offer (OfferAccept): _description_
-        db (Session, optional): _description_. Defaults to Depends(get_db).
-
-    Raises:
-        HTTPException: _description_
-        HTTPException: _description_
-
-    Returns:
-        _type_: _description_
-    """
-    req = db.query(RequestPost).filter_by(id=offer.request_id, status="open").first()
-    if not req:
-        raise HTTPException(404, "Request not found or not open")
-    current_user = db.query(User).filter(User.id == offer.supplier_id).first()
-    # ensure supplier actually has a matching product (optional)
-    if req.category not in {p.category for p in current_user.products}:
-        raise HTTPException(403, "You don’t carry that category")
+    # the request first: it is the row concurrent accepts of different offers share
+    if not claim(RequestPost, request.id, "open", "accepted"):
+        db.rollback()
+        raise HTTPException(409, "Request is no longer open")
+    if not claim(Offer, offer.id, "pending", "accepted"):
+        db.rollback()
+        raise HTTPException(400, "Offer already responded to")
+    # every other pending offer is turned down in one statement
+    db.execute(
+        update(Offer)
+        .where(Offer.request_id == request.id, Offer.id != offer.id, Offer.status == "pending")
+        .values(status="rejected")
+        .execution_options(synchronize_session=False)
+    )
 
-    offer = Offer(
-        request_id  = req.id,
-        supplier_id = current_user.id,
-        proposed    = req.offer_price,
+    #create an order if the requested is accepted by the customer
+    order = Order(
+        request_id = request.id,
+        offer_id = offer.id,
+        customer_id = request.customer_id,
+        supplier_id = offer.supplier_id,
+        status = "placed",
+        total_price = offer.proposed,
+        quantity = request.quantity
     )
-    db.add(offer)
-    db.commit()
-    db.refresh(offer)
-    return offer    
+    db.add(order)
+    record_daily(db, request.category_id, orders=1, gmv=offer.proposed)
+    try:
+        db.commit()
+    except IntegrityError:
+        db.rollback()
+        raise HTTPException(409, "Request already has an order")
+    db.refresh(order)
+    return order
@@ -1,7 +1,9 @@
 from typing import List
+from sqlalchemy import or_
 from sqlalchemy.orm import Session
-from database import get_db
+from database import get_db, get_read_db
 from fastapi import APIRouter, Depends, HTTPException
+from loading import eager_load
 from models import Offer, Order, RequestPost, User
 from uuid import UUID
 from schemas.orders_schema import OrderAction, OrderOut
@@ -11,8 +13,8 @@ orders_router = APIRouter(prefix="/orders", tags=["orders"])
 
 #get all orders that havent been  for a user (customer and supplier)
 @orders_router.get("/get_order/{user_id}")
-def get_all_orders(user_id:UUID,db:Session=Depends(get_db)):
-    orders = db.query(Order).filter(Order.customer_id == user_id or Order.supplier_id == user_id,
+def get_all_orders(user_id:UUID,db:Session=Depends(get_read_db)):
+    orders = db.query(Order).filter(or_(Order.customer_id == user_id, Order.supplier_id == user_id),
                                     Order.status == "placed").all()
     return orders
 
@@ -37,10 +39,7 @@ def mark_order(action:OrderAction,db:Session=Depends(get_db)):
 
 # get all delivered orders , can be used as history
 @orders_router.get("/completed_orders", response_model=list[OrderOut])
-def get_all_completed_orders(user_id: UUID, db: Session = Depends(get_db)):
-    orders = (
-        db.query(Order)
-        .filter(Order.status == "delivered", Order.customer_id == user_id)
-        .all()
-    )
+def get_all_completed_orders(user_id: UUID, db: Session = Depends(get_read_db)):
+    query = db.query(Order).filter(Order.status == "delivered", Order.customer_id == user_id)
+    orders = eager_load(query, Order, OrderOut).all()
     return orders
\ No newline at end of file
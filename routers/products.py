@@ -1,17 +1,54 @@
-from io import BytesIO
 from typing import Optional
-from fastapi.responses import StreamingResponse
+import orjson
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
-from database import get_db
-from fastapi import APIRouter, Depends, File, HTTPException, HTTPException, UploadFile
+from blob_store import BlobStore, get_blob_store
+from cache import response_cache
+from catalog import (
+    MAX_PRODUCT_IMAGES,
+    add_products,
+    add_supplier_category,
+    canonical_category,
+    category_id_of,
+    claim_image_slot,
+    get_or_create_category,
+    product_total,
+    remove_supplier_category,
+    supplier_product_count,
+)
+from database import async_read_session, get_async_db, get_db, get_read_db, reads_primary
+from fastapi import APIRouter, Depends, File, HTTPException, HTTPException, Query, Request, UploadFile
+from fastapi.responses import StreamingResponse
+from images import ImageSize, image_response, queue_variants, store_upload
 from models import Product , User, ProductImage
-from schemas.products_schema import Product as ProductBase, ProductCreate
+from pagination import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, apply_keyset
+from schemas.pagination_schema import Page
+from serialization import list_adapter, render_list, render_one, render_page
+from schemas.products_schema import Product as ProductBase, ProductCreate, ProductImportResult
+from product_import import CSV_TYPES, NDJSON_TYPES, csv_records, import_products, iter_lines, ndjson_records
+from search import search_page
+from loaders import get_loader, missing_ids
+from schemas.batch_schema import Batch, BatchRequest
 from uuid import UUID
 
 
 # Create a new router for users
 product_router = APIRouter()
 
+EXPORT_CHUNK_ROWS = 1000
+
+
+# response cache tags: every cached catalog read carries "catalog" plus what it
+# lists. Writes invalidate the tags of the rows they touched, after committing.
+def _stale_tags(product: Product) -> list[str]:
+    return [
+        "products",
+        f"product:{product.id}",
+        f"supplier:{product.supplier_id}",
+        f"category:{canonical_category(product.category)}",
+    ]
+
 #crud operations for products
 @product_router.post("/", response_model=ProductBase)
 def create_product(product: ProductCreate, db: Session = Depends(get_db)):
@@ -20,18 +57,56 @@ def create_product(product: ProductCreate, db: Session = Depends(get_db)):
         description = product.description,
         price = product.price,
         category = product.category,
+        category_id = get_or_create_category(db, product.category),
         supplier_id = product.supplier_id
     )
     db.add(db_product)
+    add_supplier_category(db, db_product.supplier_id, db_product.category_id)
+    add_products(db, db_product.supplier_id)
     db.commit()
     db.refresh(db_product)
+    response_cache.invalidate(*_stale_tags(db_product))
     return db_product
 
+# resolve many ids in one round trip, e.g. everything a list screen refers to
+@product_router.post("/batch", response_model=Batch[ProductBase])
+def get_products_batch(batch: BatchRequest, request: Request, db: Session = Depends(get_read_db)):
+    rows = get_loader(request, db, Product).load_many(batch.ids)
+    return {"items": rows, "missing": missing_ids(batch.ids, rows)}
+
+# many products for one supplier from an NDJSON or CSV body, see product_import.py
+@product_router.post("/bulk", response_model=ProductImportResult)
+async def bulk_import_products(
+    request: Request,
+    supplier_id: UUID = Query(...),
+    db: AsyncSession = Depends(get_async_db),
+):
+    """
+    Rows are name, description, price and category: one JSON object per line
+    (application/x-ndjson) or CSV with a header row (text/csv). Valid rows are
+    saved in chunks as they arrive; the rest come back in `errors`.
+    """
+    content_type = request.headers.get("content-type", "").split(";")[0].strip().lower()
+    if content_type in NDJSON_TYPES:
+        parse = ndjson_records
+    elif content_type in CSV_TYPES:
+        parse = csv_records
+    else:
+        raise HTTPException(status_code=415, detail="send application/x-ndjson or text/csv")
+    supplier = await db.scalar(select(User.id).where(User.id == supplier_id, User.role == "supplier"))
+    if supplier is None:
+        raise HTTPException(status_code=404, detail="Supplier not found")
+    await db.commit()  # don't hold the read transaction open while the body streams in
+
+    records = parse(iter_lines(request.stream()))
+    return await import_products(db, supplier_id, records, response_cache.invalidate)
+
 @product_router.post("/{product_id}/images")
 async def add_product_images(
     product_id: UUID,
     file: UploadFile = File(...),  # required
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db),
+    store: BlobStore = Depends(get_blob_store),
 ):
     """
     add up to 4 images for a product 
@@ -45,31 +120,34 @@ async def add_product_images(
     Returns:
         _type_: _description_
     """
-    db_product = db.query(Product).filter(Product.id == product_id).first()
+    db_product = await db.scalar(select(Product).where(Product.id == product_id))
     if not db_product:
         raise HTTPException(status_code=404, detail="Product not found")
 
     #check if the amount of images for a product have reached the maximum allowed 4
-    
-    image_count = db.query(ProductImage).filter(ProductImage.product_id == db_product.id).count()
-    if image_count >= 4:
+    if db_product.image_count >= MAX_PRODUCT_IMAGES:
+        raise HTTPException(status_code=500 , detail="upload amount reachecd")
+    # write file1 to the blob store, the row only keeps its hash
+    blob = await store_upload(file, store)
+    # the check above was only a shortcut; this is what holds under concurrent uploads
+    if not (await db.execute(claim_image_slot(product_id))).rowcount:
         raise HTTPException(status_code=500 , detail="upload amount reachecd")
-    # Read file1
-    contents = await file.read()
     new_image = ProductImage(
         product_id=product_id,
-        image_data=contents
+        sha256=blob.sha256,
+        size=blob.size,
+        content_type=blob.content_type,
     )
     db.add(new_image)
-    db.commit()
-    db.refresh(new_image)
+    await db.commit()
+    queue_variants(blob, store)
 
     return {"msg": "successful",
             "image_id1": new_image.id}
     
 
 @product_router.get("/{product_id}/images", response_model=list[UUID])
-def list_product_images(product_id: UUID, db: Session = Depends(get_db)):
+def list_product_images(product_id: UUID, db: Session = Depends(get_read_db)):
     """
     Return a list of ProductImage IDs for this product.
     """
@@ -77,16 +155,19 @@ def list_product_images(product_id: UUID, db: Session = Depends(get_db)):
     if not product:
         raise HTTPException(404, "Product not found")
 
-    images = db.query(ProductImage).filter(ProductImage.product_id == product_id).all()
+    images = db.query(ProductImage.id).filter(ProductImage.product_id == product_id).all()
     return [img.id for img in images]
 
 @product_router.get("/images/{image_id}")
 def get_product_image(
     image_id: UUID,
-    db: Session = Depends(get_db)
+    request: Request,
+    size: Optional[ImageSize] = None,
+    db: Session = Depends(get_read_db),
+    store: BlobStore = Depends(get_blob_store),
 ):
     """
-    Stream back the stored image blobs.
+    Send back the stored image file, or its resized variant with ?size=.
 
     """
     img: ProductImage | None = (
@@ -97,24 +178,43 @@ def get_product_image(
     if not img:
         raise HTTPException(404, "Image not found")
 
-    data = img.image_data
-    
-    # return raw bytes as image/jpeg (or you can detect/parameterize the MIME-type)
-    return StreamingResponse(BytesIO(data), media_type="image/jpeg")
+    return image_response(img, store, request, size)
 
 
+@product_router.get("/count", response_model=int)
+def count_all_products(request: Request, db: Session = Depends(get_read_db)):
+    return response_cache.response(
+        "products.count", (), ["catalog", "products"], lambda: orjson.dumps(product_total(db)),
+        bypass=reads_primary(request),
+    )
+
 @product_router.get("/{product_id}", response_model=ProductBase)
-def get_product(product_id: UUID, db: Session = Depends(get_db)):
-    db_product = db.query(Product).filter(Product.id == product_id).first()
-    if not db_product:
-        raise HTTPException(status_code=404, detail="Product not found")
-    return db_product
+def get_product(product_id: UUID, request: Request, db: Session = Depends(get_read_db)):
+    def render():
+        db_product = db.query(Product).filter(Product.id == product_id).first()
+        if not db_product:
+            raise HTTPException(status_code=404, detail="Product not found")
+        return render_one(db_product, ProductBase)
+
+    return response_cache.response(
+        "products.get", (product_id,), ["catalog", f"product:{product_id}"], render, bypass=reads_primary(request),
+    )
 
-#get all products
-@product_router.get("/", response_model=list[ProductBase])
-def get_all_products(db: Session = Depends(get_db)):
-    products = db.query(Product).all()
-    return products
+#get all products, newest first, one page at a time
+@product_router.get("/", response_model=Page[ProductBase])
+def get_all_products(
+    request: Request,
+    cursor: Optional[str] = None,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    db: Session = Depends(get_read_db),
+):
+    def render():
+        products = apply_keyset(db.query(Product), Product, cursor, limit).all()
+        return render_page(products, limit, ProductBase)
+
+    return response_cache.response(
+        "products.list", (cursor, limit), ["catalog", "products"], render, bypass=reads_primary(request),
+    )
 
 @product_router.put("/{product_id}", response_model=ProductBase)
 def update_product(product_id: UUID, product: ProductCreate, db: Session = Depends(get_db)):
@@ -122,11 +222,21 @@ def update_product(product_id: UUID, product: ProductCreate, db: Session = Depen
     if not db_product:
         raise HTTPException(status_code=404, detail="Product not found")
     
+    old_supplier_id, old_category_id = db_product.supplier_id, db_product.category_id
+    stale = _stale_tags(db_product)
     for key, value in product.dict().items():
         setattr(db_product, key, value)
+    db_product.category_id = get_or_create_category(db, product.category)
+    if (old_supplier_id, old_category_id) != (db_product.supplier_id, db_product.category_id):
+        remove_supplier_category(db, old_supplier_id, old_category_id)
+        add_supplier_category(db, db_product.supplier_id, db_product.category_id)
+    if old_supplier_id != db_product.supplier_id:
+        add_products(db, old_supplier_id, -1)
+        add_products(db, db_product.supplier_id)
     
     db.commit()
     db.refresh(db_product)
+    response_cache.invalidate(*stale, *_stale_tags(db_product))
     return db_product
 
 @product_router.delete("/{product_id}")
@@ -135,40 +245,89 @@ def delete_product(product_id: UUID, db: Session = Depends(get_db)):
     if not db_product:
         raise HTTPException(status_code=404, detail="Product not found")
     
+    stale = _stale_tags(db_product)
     db.delete(db_product)
+    remove_supplier_category(db, db_product.supplier_id, db_product.category_id)
+    add_products(db, db_product.supplier_id, -1)
     db.commit()
+    response_cache.invalidate(*stale)
     return {"detail": "Product deleted successfully"}
 
 @product_router.get("/supplier/{supplier_id}", response_model=list[ProductBase])
-def get_products_by_supplier(supplier_id: UUID, db: Session = Depends(get_db)):
-    db_supplier = db.query(User).filter(User.id == supplier_id).first()
-    if not db_supplier:
-        raise HTTPException(status_code=404, detail="Supplier not found")
-    
-    products = db.query(Product).filter(Product.supplier_id == supplier_id).all()
-    return products
+def get_products_by_supplier(supplier_id: UUID, request: Request, db: Session = Depends(get_read_db)):
+    def render():
+        db_supplier = db.query(User).filter(User.id == supplier_id).first()
+        if not db_supplier:
+            raise HTTPException(status_code=404, detail="Supplier not found")
+        return render_list(db.query(Product).filter(Product.supplier_id == supplier_id), ProductBase)
+
+    return response_cache.response(
+        "products.by_supplier", (supplier_id,), ["catalog", f"supplier:{supplier_id}"], render,
+        bypass=reads_primary(request),
+    )
 
 @product_router.get("/category/{category}", response_model=list[ProductBase])
-def get_products_by_category(category: str, db: Session = Depends(get_db)):
-    products = db.query(Product).filter(Product.category == category).all()
-    if not products:
-        raise HTTPException(status_code=404, detail="No products found in this category")
-    return products
-
-@product_router.get("/search/{query}", response_model=list[ProductBase])
-def search_products(query: str, db: Session = Depends(get_db)):
-    products = db.query(Product).filter(Product.name.ilike(f"%{query}%")).all()
-    if not products:
+def get_products_by_category(category: str, request: Request, db: Session = Depends(get_read_db)):
+    def render():
+        category_id = category_id_of(db, category)
+        if category_id is None:
+            raise HTTPException(status_code=404, detail="No products found in this category")
+        products = db.query(Product).filter(Product.category_id == category_id).all()
+        if not products:
+            raise HTTPException(status_code=404, detail="No products found in this category")
+        return render_list(products, ProductBase)
+
+    name = canonical_category(category)
+    return response_cache.response(
+        "products.by_category", (name,), ["catalog", f"category:{name}"], render, bypass=reads_primary(request),
+    )
+
+@product_router.get("/search/{query}", response_model=Page[ProductBase])
+def search_products(
+    query: str,
+    cursor: Optional[str] = None,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    db: Session = Depends(get_read_db),
+):
+    page = search_page(db, query, cursor, limit)
+    if not page["items"] and not cursor:
         raise HTTPException(status_code=404, detail="No products found matching the query")
-    return products
+    return page
+
+# the whole catalog, one JSON object per line, read from the database a chunk at a time
+@product_router.get("/supplier/{supplier_id}/export")
+async def export_supplier_products(supplier_id: UUID, request: Request):
+    # the response outlives request-scoped dependencies, so the stream opens its own session
+    sessions = async_read_session(request)
+    async with sessions() as db:
+        if await db.scalar(select(User.id).where(User.id == supplier_id)) is None:
+            raise HTTPException(status_code=404, detail="Supplier not found")
 
-@product_router.get("/supplier/{supplier_id}/count")
-def count_products_by_supplier(supplier_id: UUID, db: Session = Depends(get_db)):
-    count = db.query(Product).filter(Product.supplier_id == supplier_id).count()
-    return count
+    columns = [Product.id, Product.name, Product.description, Product.price, Product.supplier_id, Product.category]
+    adapter = list_adapter(ProductBase)
 
-@product_router.get("/count")
-def count_all_products(db: Session = Depends(get_db)):
-    count = db.query(Product).count()
-    return count
+    async def lines():
+        async with sessions() as db:
+            result = await db.stream(
+                select(*columns)
+                .where(Product.supplier_id == supplier_id)
+                .order_by(Product.created_at, Product.id)
+                .execution_options(yield_per=EXPORT_CHUNK_ROWS)
+            )
+            async for rows in result.partitions():
+                products = adapter.validate_python([row._mapping for row in rows])
+                yield b"".join(ProductBase.__pydantic_serializer__.to_json(p) + b"\n" for p in products)
 
+    return StreamingResponse(
+        lines(),
+        media_type="application/x-ndjson",
+        headers={"Content-Disposition": f'attachment; filename="products-{supplier_id}.ndjson"'},
+    )
+
+@product_router.get("/supplier/{supplier_id}/count", response_model=int)
+def count_products_by_supplier(supplier_id: UUID, request: Request, db: Session = Depends(get_read_db)):
+    return response_cache.response(
+        "products.count_by_supplier", (supplier_id,), ["catalog", f"supplier:{supplier_id}"],
+        lambda: orjson.dumps(supplier_product_count(db, supplier_id)),
+        bypass=reads_primary(request),
+    )
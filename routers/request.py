@@ -1,8 +1,20 @@
-from typing import List
+from typing import List, Optional
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
-from database import get_db
-from fastapi import APIRouter, Depends, File, HTTPException, HTTPException, UploadFile
+from blob_store import BlobStore, get_blob_store
+from catalog import get_or_create_category
+from database import get_async_db, get_async_read_db, get_db, get_read_db
+from fastapi import APIRouter, Depends, File, HTTPException, HTTPException, Query, Request, UploadFile
+from images import ImageSize, image_response, queue_variants, store_upload
 from models import  RequestPost, RequestImage
+from request_feed import record_event, request_feed
+from pagination import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, apply_keyset
+from schemas.pagination_schema import Page
+from serialization import page_response
+from stats import record_daily
+from loaders import get_loader, missing_ids
+from schemas.batch_schema import Batch, BatchRequest
 from schemas.request_schema import RequestCreate, Request as RequestBase, RequestImageRead, RequestUpdate
 from uuid import UUID
 
@@ -18,14 +30,21 @@ def create_request(request: RequestCreate, db: Session = Depends(get_db)):
     db_request = RequestPost(
         title = request.title,
         category = request.category,
+        category_id = get_or_create_category(db, request.category),
         description = request.description,
         quantity = request.quantity,
         offer_price = request.offer_price,
         customer_id = request.customer_id
     )
     db.add(db_request)
-    db.commit()
+    db.flush()
     db.refresh(db_request)
+    # the feed event rides in the same transaction as the request itself
+    event = RequestBase.model_validate(db_request, from_attributes=True).model_dump(mode="json")
+    record_event(db, event)
+    record_daily(db, db_request.category_id, requests=1)
+    db.commit()
+    request_feed.publish_threadsafe(event)
     return db_request
 
 # add a picture to the request
@@ -33,44 +52,73 @@ def create_request(request: RequestCreate, db: Session = Depends(get_db)):
 async def upload_request_image(
     request_id: UUID,
     file: UploadFile = File(...),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
+    store: BlobStore = Depends(get_blob_store),
 ):
     # 1. Make sure the request exists
-    request_obj = db.query(RequestPost).filter_by(id=request_id).first()
+    request_obj = await db.scalar(select(RequestPost).where(RequestPost.id == request_id))
     if not request_obj:
         raise HTTPException(status_code=404, detail="Request not found")
 
-    # 2. Read the file contents
-    contents = await file.read()       # bytes
+    # 2. Write the file to the blob store
+    blob = await store_upload(file, store)
 
     # 3. Create the RequestImage row
     img = RequestImage(
         request_id = request_obj.id,
-        image_data = contents
+        sha256 = blob.sha256,
+        size = blob.size,
+        content_type = blob.content_type,
     )
     db.add(img)
-    db.commit()
-    db.refresh(img)
+    await db.commit()
+    queue_variants(blob, store)
 
     return img
 
-# Get all request posts
-@request_router.get("/get_all",response_model=List[RequestBase])
-async def get_all_requests(db:Session = Depends(get_db)):
-    requests = db.query(RequestPost).all()
-    return requests
+# get the file behind a request image
+@request_router.get("/images/{image_id}")
+def get_request_image(
+    image_id: UUID,
+    request: Request,
+    size: Optional[ImageSize] = None,
+    db: Session = Depends(get_read_db),
+    store: BlobStore = Depends(get_blob_store),
+):
+    img = db.query(RequestImage).filter(RequestImage.id == image_id).first()
+    if not img:
+        raise HTTPException(status_code=404, detail="Image not found")
+    return image_response(img, store, request, size)
+
+# Get all request posts, newest first, one page at a time
+@request_router.get("/get_all",response_model=Page[RequestBase])
+async def get_all_requests(
+    cursor: Optional[str] = None,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    db:AsyncSession = Depends(get_async_read_db),
+):
+    requests = (await db.scalars(apply_keyset(select(RequestPost), RequestPost, cursor, limit))).all()
+    return page_response(requests, limit, RequestBase)
 
 # Get a request by id 
 @request_router.get("/get_single/{request_id}",response_model=RequestBase)
-async def get_all_requests(request_id:int, db:Session = Depends(get_db)):
-    request = db.query(RequestPost).filter(RequestPost.id == request_id).first()
+async def get_request(request_id:UUID, db:AsyncSession = Depends(get_async_read_db)):
+    request = await db.scalar(select(RequestPost).where(RequestPost.id == request_id))
+    if not request:
+        raise HTTPException(status_code=404, detail="request not found")
     return request
 
+# resolve many ids in one round trip, e.g. everything a list screen refers to
+@request_router.post("/batch", response_model=Batch[RequestBase])
+def get_requests_batch(batch: BatchRequest, request: Request, db: Session = Depends(get_read_db)):
+    rows = get_loader(request, db, RequestPost).load_many(batch.ids)
+    return {"items": rows, "missing": missing_ids(batch.ids, rows)}
+
 # get image for a request
 @request_router.get("/{request_id}/images/", response_model=List[RequestImageRead])
 def list_request_images(
     request_id: UUID,
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_read_db),
 ):
     images = (
         db.query(RequestImage)
@@ -84,9 +132,9 @@ def list_request_images(
 
 # update a request
 @request_router.put("/update/{request_id}", response_model=RequestBase)
-async def update_request(requestupdate:RequestUpdate,db:Session= Depends(get_db)):
+async def update_request(requestupdate:RequestUpdate,db:AsyncSession= Depends(get_async_db)):
     #check if the request still exist 
-    existing_request = db.query(RequestPost).filter(RequestPost.id == requestupdate.id).first()
+    existing_request = await db.scalar(select(RequestPost).where(RequestPost.id == requestupdate.id))
     if not existing_request:
         raise HTTPException(status_code=404, detail="request not found")
     
@@ -95,13 +143,14 @@ async def update_request(requestupdate:RequestUpdate,db:Session= Depends(get_db)
         existing_request.title = requestupdate.title
         existing_request.description = requestupdate.description
         existing_request.category = requestupdate.category
+        existing_request.category_id = await db.run_sync(get_or_create_category, requestupdate.category)
         existing_request.offer_price = requestupdate.offer_price
         
-        db.commit()
-        db.refresh(existing_request)
+        await db.commit()
+        await db.refresh(existing_request)
         return existing_request
     except:
-        db.rollback()
+        await db.rollback()
         raise HTTPException(status_code=500,detail="internal error")
 
 # Delete a request
@@ -1,12 +1,25 @@
-from io import BytesIO
-from typing import List
+from typing import List, Optional
+import numpy as np
+from sqlalchemy import and_, exists, or_, select
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
-from database import get_db
-from fastapi import APIRouter, Depends, File, HTTPException, HTTPException, UploadFile
-from models import  ProfileImage, User
-from schemas.supplier_schema import Supplier as SupplierBase, SupplierCreate, SupplierUpdate
+from auth_tokens import token_cache
+from blob_store import BlobStore, get_blob_store
+from cache import response_cache
+from database import get_async_db, get_db, get_read_db
+from fastapi import APIRouter, Depends, File, HTTPException, HTTPException, Query, Request, UploadFile
+from images import ImageSize, image_response, queue_variants, store_upload
+from catalog import add_products, category_id_of
+from geo import bounding_box, covering_prefixes, geohash, nearest
+from models import  ProfileImage, SupplierCategory, User
+from pagination import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, apply_keyset
+from schemas.pagination_schema import Page
+from serialization import page_response
+from stats import record_daily
+from loaders import get_loader, missing_ids
+from schemas.batch_schema import Batch, BatchRequest
+from schemas.supplier_schema import NearbySupplier, Supplier as SupplierBase, SupplierCreate, SupplierUpdate
 from uuid import UUID
-from fastapi.responses import StreamingResponse
 
 # Create a new router for users
 supplier_router = APIRouter()
@@ -28,16 +41,68 @@ def create_supplier(supplier: SupplierCreate, db: Session = Depends(get_db)):
         phone_number=supplier.phone_number if supplier.phone_number else None,
         latitude=supplier.latitude,
         longitude=supplier.longitude,
+        geohash=geohash(supplier.latitude, supplier.longitude),
         role="supplier"
     )
     db.add(new_supplier)
+    record_daily(db, signups=1)
     db.commit()
     db.refresh(new_supplier)
     
     return new_supplier
 
+# resolve many ids in one round trip, e.g. everything a list screen refers to
+@supplier_router.post("/batch", response_model=Batch[SupplierBase])
+def get_suppliers_batch(batch: BatchRequest, request: Request, db: Session = Depends(get_read_db)):
+    rows = get_loader(request, db, User, User.role == "supplier", name="suppliers").load_many(batch.ids)
+    return {"items": rows, "missing": missing_ids(batch.ids, rows)}
+
+# suppliers closest to a point, optionally only those carrying a category
+@supplier_router.get("/nearby", response_model=List[NearbySupplier])
+def get_nearby_suppliers(
+    lat: float = Query(..., ge=-90, le=90),
+    lon: float = Query(..., ge=-180, le=180),
+    radius_km: float = Query(10, gt=0, le=500),
+    category: Optional[str] = None,
+    limit: int = Query(20, ge=1, le=100),
+    db: Session = Depends(get_read_db),
+):
+    # 1. coarse filter in SQL: geohash prefix ranges plus the latitude band
+    min_lat, max_lat, _, _ = bounding_box(lat, lon, radius_km)
+    query = (
+        select(User.id, User.latitude, User.longitude)
+        .where(User.role == "supplier", User.latitude.between(min_lat, max_lat), User.longitude.isnot(None))
+    )
+    prefixes = covering_prefixes(lat, lon, radius_km)
+    if prefixes:
+        query = query.where(or_(*(and_(User.geohash >= p, User.geohash < p + "~") for p in prefixes)))
+    if category is not None:
+        category_id = category_id_of(db, category)
+        if category_id is None:
+            return []
+        query = query.where(
+            exists().where(SupplierCategory.supplier_id == User.id, SupplierCategory.category_id == category_id)
+        )
+    candidates = db.execute(query).all()
+    if not candidates:
+        return []
+
+    # 2. exact distances for the survivors, vectorized, keeping only the top k
+    ids, lats, lons = zip(*candidates)
+    order, distances = nearest(lat, lon, np.array(lats), np.array(lons), radius_km, limit)
+    winners = [ids[i] for i in order]
+
+    suppliers = {s.id: s for s in db.query(User).filter(User.id.in_(winners))}
+    return [
+        NearbySupplier(
+            **SupplierBase.model_validate(suppliers[supplier_id], from_attributes=True).model_dump(),
+            distance_km=round(float(distance), 3),
+        )
+        for supplier_id, distance in zip(winners, distances)
+    ]
+
 @supplier_router.get("/{name}", response_model=SupplierBase)
-def get_supplier(name: str, db: Session = Depends(get_db)):
+def get_supplier(name: str, db: Session = Depends(get_read_db)):
     supplier = db.query(User).filter(User.name == name).first()
     if not supplier:
         raise HTTPException(status_code=404, detail="Supplier not found")
@@ -45,7 +110,7 @@ def get_supplier(name: str, db: Session = Depends(get_db)):
 
 # get supplier by id
 @supplier_router.get("{user_id}/suplier",response_model=SupplierBase)
-def get_supplier_by_id(user_id:UUID, db:Session = Depends(get_db)): 
+def get_supplier_by_id(user_id:UUID, db:Session = Depends(get_read_db)): 
     supplier = db.query(User).filter(User.id == user_id).first()
     if not supplier:
         raise HTTPException(status_code=404, detail="Supplier not found")
@@ -66,6 +131,7 @@ def update_supplier(user_id: UUID, supplier: SupplierUpdate, db: Session = Depen
     existing_supplier.phone_number = supplier.phone_number 
     existing_supplier.latitude = supplier.latitude
     existing_supplier.longitude = supplier.longitude
+    existing_supplier.geohash = geohash(supplier.latitude, supplier.longitude)
     
     db.commit()
     db.refresh(existing_supplier)
@@ -79,17 +145,27 @@ def delete_supplier(user_id:UUID, db: Session = Depends(get_db)):
         raise HTTPException(status_code=404, detail="Supplier not found")
     
     db.delete(supplier)
+    if supplier.product_count:
+        add_products(db, None, -supplier.product_count)
     db.commit()
+    token_cache.invalidate_user(user_id)
+    # their products went with them (cascade), without per-product invalidations
+    response_cache.invalidate("catalog")
     
     return supplier
 
-@supplier_router.get("/", response_model=list[SupplierBase])
-def get_all_suppliers(db: Session = Depends(get_db)):
-    suppliers = db.query(User).filter(User.role == "supplier").all()
-    return suppliers
+@supplier_router.get("/", response_model=Page[SupplierBase])
+def get_all_suppliers(
+    cursor: Optional[str] = None,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    db: Session = Depends(get_read_db),
+):
+    query = db.query(User).filter(User.role == "supplier")
+    suppliers = apply_keyset(query, User, cursor, limit).all()
+    return page_response(suppliers, limit, SupplierBase)
 
 @supplier_router.get("/exists/{email}", response_model=bool)
-def supplier_exists(email: str, db: Session = Depends(get_db)):
+def supplier_exists(email: str, db: Session = Depends(get_read_db)):
     supplier = db.query(User).filter(User.email == email).first()
     if supplier is None:
         return False
@@ -98,36 +174,33 @@ def supplier_exists(email: str, db: Session = Depends(get_db)):
     
 # add a profile picture to the suppiler
 @supplier_router.post("/image/{user_id}")
-async def add_profile_image(user_id:UUID,file: UploadFile = File(...), db:Session = Depends(get_db)):
-    supplier = db.query(User).filter(User.id == user_id).first()
+async def add_profile_image(user_id:UUID,file: UploadFile = File(...), db:AsyncSession = Depends(get_async_db), store: BlobStore = Depends(get_blob_store)):
+    supplier = await db.scalar(select(User).where(User.id == user_id))
     if not supplier:
         raise HTTPException(status_code=404, detail="User not found")
     
-    # 1. Read the file contents
-    contents = await file.read()       # bytes
+    # 1. Write the file to the blob store
+    blob = await store_upload(file, store)
     
     # 2. check if user profile alread exists if so then update
-    if supplier.profile_image:
-        supplier.profile_image.image_data = contents
-
-    else:
-    # 3. Create the RequestImage row if it wasnt already created
-        img = ProfileImage(
-            user_id=supplier.id,
-            image_data = contents
-        )
-    
+    img = await db.scalar(select(ProfileImage).where(ProfileImage.user_id == supplier.id))
+    if img is None:
+    # 3. Create the ProfileImage row if it wasnt already created
+        img = ProfileImage(user_id=supplier.id)
         db.add(img)
-        db.commit()
-        db.refresh(img)
-    
-    db.commit()
 
-    return {"msg": "successful", "image_id": img.id if supplier.profile_image is None else supplier.profile_image.id}
+    img.sha256 = blob.sha256
+    img.size = blob.size
+    img.content_type = blob.content_type
+    img.image_data = None
+    await db.commit()
+    queue_variants(blob, store)
+
+    return {"msg": "successful", "image_id": img.id}
     
 #get image of supplier profile
 @supplier_router.get("/image/{supplier_id}")
-def get_profile_image(supplier_id: UUID, db: Session = Depends(get_db)):
+def get_profile_image(supplier_id: UUID, request: Request, size: Optional[ImageSize] = None, db: Session = Depends(get_read_db), store: BlobStore = Depends(get_blob_store)):
     supplier = db.query(User).filter(User.id == supplier_id).first()
     if not supplier:
         raise HTTPException(status_code=404, detail="User not found")
@@ -135,4 +208,4 @@ def get_profile_image(supplier_id: UUID, db: Session = Depends(get_db)):
     if not supplier.profile_image:
         raise HTTPException(status_code=404, detail="Profile image not found")
     
-    return StreamingResponse(BytesIO(supplier.profile_image.image_data), media_type="image/png")
\ No newline at end of file
+    return image_response(supplier.profile_image, store, request, size, immutable=False)
\ No newline at end of file
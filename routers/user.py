@@ -1,10 +1,21 @@
-from io import BytesIO
-from typing import List
-from fastapi.responses import StreamingResponse
+from typing import List, Optional
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
-from database import get_db
-from fastapi import APIRouter, Depends, File, HTTPException, HTTPException, UploadFile
+from auth_tokens import token_cache
+from blob_store import BlobStore, get_blob_store
+from cache import response_cache
+from catalog import add_products
+from database import get_async_db, get_db, get_read_db
+from fastapi import APIRouter, Depends, File, HTTPException, HTTPException, Query, Request, UploadFile
+from images import ImageSize, image_response, queue_variants, store_upload
 from models import User,ProfileImage
+from pagination import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, apply_keyset
+from schemas.pagination_schema import Page
+from serialization import page_response
+from stats import record_daily
+from loaders import get_loader, missing_ids
+from schemas.batch_schema import Batch, BatchRequest
 from schemas.user_schema import User as UserBase , UserCreate
 from uuid import UUID
 
@@ -41,42 +52,46 @@ def create_user(user: UserCreate, db: Session = Depends(get_db)):
         role="customer"
     )
     db.add(new_user)
+    record_daily(db, signups=1)
     db.commit()
     db.refresh(new_user)
     return new_user
 
+# resolve many customer ids in one round trip; suppliers are looked up with /suppliers/batch
+@user_router.post("/batch", response_model=Batch[UserBase])
+def get_users_batch(batch: BatchRequest, request: Request, db: Session = Depends(get_read_db)):
+    rows = get_loader(request, db, User, User.role == "customer", name="customers").load_many(batch.ids)
+    return {"items": rows, "missing": missing_ids(batch.ids, rows)}
+
 # add image to user profile
 @user_router.post("/image/{user_id}")
-async def add_profile_image(user_id:UUID,file: UploadFile = File(...), db:Session = Depends(get_db)):
-    user = db.query(User).filter(User.id == user_id).first()
+async def add_profile_image(user_id:UUID,file: UploadFile = File(...), db:AsyncSession = Depends(get_async_db), store: BlobStore = Depends(get_blob_store)):
+    user = await db.scalar(select(User).where(User.id == user_id))
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
     
-    # 1. Read the file contents
-    contents = await file.read()       # bytes
+    # 1. Write the file to the blob store
+    blob = await store_upload(file, store)
     
     # 2. check if user profile alread exists if so then update
-    if user.profile_image:
-        user.profile_image.image_data = contents
-
-    else:
-    # 3. Create the RequestImage row if it wasnt already created
-        img = ProfileImage(
-            user_id=user.id,
-            image_data = contents
-        )
-    
+    img = await db.scalar(select(ProfileImage).where(ProfileImage.user_id == user.id))
+    if img is None:
+    # 3. Create the ProfileImage row if it wasnt already created
+        img = ProfileImage(user_id=user.id)
         db.add(img)
-        db.commit()
-        db.refresh(img)
-    
-    db.commit()
 
-    return {"msg": "successful", "image_id": img.id if user.profile_image is None else user.profile_image.id}
+    img.sha256 = blob.sha256
+    img.size = blob.size
+    img.content_type = blob.content_type
+    img.image_data = None
+    await db.commit()
+    queue_variants(blob, store)
+
+    return {"msg": "successful", "image_id": img.id}
 
 #get image of user profile
 @user_router.get("/image/{user_id}")
-def get_profile_image(user_id: UUID, db: Session = Depends(get_db)):
+def get_profile_image(user_id: UUID, request: Request, size: Optional[ImageSize] = None, db: Session = Depends(get_read_db), store: BlobStore = Depends(get_blob_store)):
     user = db.query(User).filter(User.id == user_id).first()
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
@@ -84,13 +99,13 @@ def get_profile_image(user_id: UUID, db: Session = Depends(get_db)):
     if not user.profile_image:
         raise HTTPException(status_code=404, detail="Profile image not found")
     
-    return StreamingResponse(BytesIO(user.profile_image.image_data), media_type="image/png")
+    return image_response(user.profile_image, store, request, size, immutable=False)
    
 
 
 # Endpoint to get user details by username
 @user_router.get("/{username}", response_model=List[UserBase])
-def get_user(username: str, db: Session = Depends(get_db)):
+def get_user(username: str, db: Session = Depends(get_read_db)):
     user = db.query(User).filter(User.username == username).all()
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
@@ -98,7 +113,7 @@ def get_user(username: str, db: Session = Depends(get_db)):
 
 #endpoint to get user details by id
 @user_router.get("/{user_id}/user",response_model=UserBase)
-def get_user_by_id(user_id: UUID, db: Session = Depends(get_db)):
+def get_user_by_id(user_id: UUID, db: Session = Depends(get_read_db)):
     user = db.query(User).filter(User.id == user_id).first()
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
@@ -124,26 +139,36 @@ def update_user(email: str, user: UserCreate, db: Session = Depends(get_db)):
     return existing_user
 
 # Endpoint to delete a user
-@user_router.delete("/{user_id}", response_model=UserBase)
+@user_router.delete("/{user_id}")
 def delete_user(user_id:UUID, db: Session = Depends(get_db)):
     user = db.query(User).filter(User.id == user_id).first()
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
     
     db.delete(user)
+    if user.product_count:
+        add_products(db, None, -user.product_count)
     db.commit()
+    token_cache.invalidate_user(user_id)
+    if user.role == "supplier":
+        # their products went with them (cascade), without per-product invalidations
+        response_cache.invalidate("catalog")
     return {"msg": "successful"}
 
 
-# endpoint to get all users
-@user_router.get("/", response_model=list[UserBase])
-def get_all_users(db: Session = Depends(get_db)):
-    users = db.query(User).all()
-    return users
+# endpoint to get all users, newest first, one page at a time
+@user_router.get("/", response_model=Page[UserBase])
+def get_all_users(
+    cursor: Optional[str] = None,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    db: Session = Depends(get_read_db),
+):
+    users = apply_keyset(db.query(User), User, cursor, limit).all()
+    return page_response(users, limit, UserBase)
 
 # endpoint to check if a user exists by email
 @user_router.get("/exists/{email}", response_model=bool)
-def user_exists(email: str, db: Session = Depends(get_db)):
+def user_exists(email: str, db: Session = Depends(get_read_db)):
     user = db.query(User).filter(User.email == email).first()
     if user is None:
         return False
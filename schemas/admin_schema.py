@@ -0,0 +1,40 @@
+from pydantic import BaseModel, ConfigDict
+from typing import Optional
+from datetime import date, datetime
+from decimal import Decimal
+from uuid import UUID
+
+class UserOut(BaseModel):
+    id: UUID
+    email: str
+    name: str
+    surname: Optional[str] = None
+    username: Optional[str] = None
+    role: str
+    status: str
+    created_at: Optional[datetime] = None
+
+    model_config = ConfigDict(from_attributes=True)
+
+class UserUpdate(BaseModel):
+    status: Optional[str] = None
+    role: Optional[str] = None
+
+class StatsResponse(BaseModel):
+    total_users: int
+    active_users: int
+    disabled_users: int
+    new_users: int
+    period_days: int
+
+class DailyStatOut(BaseModel):
+    day: date
+    # None when the row sums every category for the day
+    category_id: Optional[int] = None
+    signups: int
+    requests: int
+    offers: int
+    orders: int
+    gmv: Decimal
+
+    model_config = ConfigDict(from_attributes=True)
@@ -9,10 +9,17 @@ class AuthBase(BaseModel):
     password : str
     
 
+class LoginRequest(AuthBase):
+    # apps that don't send one get a token of their own on every login
+    device_id : Optional[str] = None
+    
+
 class AuthResponse(BaseModel):
     user_id : UUID
     status : str
     role : str
+    token : Optional[str] = None
+    expires_at : Optional[datetime] = None
     
 class PasswordResetRequest(BaseModel):
     email: str
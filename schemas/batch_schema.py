@@ -0,0 +1,17 @@
+from pydantic import BaseModel, Field
+from typing import Generic, List, Optional, TypeVar
+from uuid import UUID
+
+T = TypeVar("T")
+
+MAX_BATCH_IDS = 100
+
+
+class BatchRequest(BaseModel):
+    ids: List[UUID] = Field(min_length=1, max_length=MAX_BATCH_IDS)
+
+
+class Batch(BaseModel, Generic[T]):
+    # one entry per requested id, in the same order; null where nothing was found
+    items: List[Optional[T]]
+    missing: List[UUID]
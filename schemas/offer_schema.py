@@ -1,5 +1,5 @@
 from decimal import Decimal
-from pydantic import BaseModel, EmailStr
+from pydantic import BaseModel, EmailStr, ConfigDict
 from typing import Literal, Optional
 from datetime import datetime
 from uuid import UUID
@@ -16,8 +16,7 @@ class OfferRead(BaseModel):
     status: str
     created_at: datetime
 
-    class Config:
-        orm_mode = True
+    model_config = ConfigDict(from_attributes=True)
 
 class RequestRead(BaseModel):
     id: UUID
@@ -28,8 +27,7 @@ class RequestRead(BaseModel):
     status: str
     offers_count: int
 
-    class Config:
-        orm_mode = True
+    model_config = ConfigDict(from_attributes=True)
 
 class OfferAction(BaseModel):
     action: Literal["accept","reject"]
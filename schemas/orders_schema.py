@@ -1,6 +1,6 @@
 import datetime
 from decimal import Decimal
-from pydantic import BaseModel
+from pydantic import BaseModel, ConfigDict
 from typing import Literal, Optional
 from uuid import UUID
 
@@ -15,9 +15,7 @@ class RequestInfo(BaseModel):
     description: Optional[str]
     category: Optional[str]
 
-    model_config = {
-        "from_attributes": True 
-    }
+    model_config = ConfigDict(from_attributes=True)
 
 class OrderOut(BaseModel):
     id: UUID
@@ -27,6 +25,4 @@ class OrderOut(BaseModel):
     created_at: datetime.datetime  
     request: RequestInfo
 
-    model_config = {
-        "from_attributes": True  
-    }
+    model_config = ConfigDict(from_attributes=True)
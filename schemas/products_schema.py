@@ -1,5 +1,5 @@
-from pydantic import BaseModel
-from typing import Optional
+from pydantic import BaseModel, ConfigDict, Field
+from typing import List, Optional
 from uuid import UUID
 
 class ProductBase(BaseModel):
@@ -10,11 +10,28 @@ class ProductBase(BaseModel):
     category: str  # e.g. electronics, furniture, etc.
     
 class ProductCreate(ProductBase):
-    pass
+    category: str = Field(pattern=r"\S")
     
 class Product(ProductBase):
     id: UUID
     
-    class Config:
-        orm_mode = True
-        
\ No newline at end of file
+    model_config = ConfigDict(from_attributes=True)
+        
+# one line of a bulk import; the supplier comes from the URL
+class ProductImportRow(BaseModel):
+    name: str = Field(min_length=1)
+    description: Optional[str] = None
+    # fits products.price, Numeric(12, 2)
+    price: float = Field(ge=0, lt=1e10, allow_inf_nan=False)
+    category: str = Field(pattern=r"\S")
+
+class ProductImportError(BaseModel):
+    row: int  # 1-based line of the body the record starts on
+    error: str
+
+class ProductImportResult(BaseModel):
+    inserted: int
+    failed: int
+    errors: List[ProductImportError]
+    # more rows failed than are listed in errors
+    errors_truncated: bool = False
@@ -1,5 +1,5 @@
 import datetime
-from pydantic import BaseModel
+from pydantic import BaseModel, ConfigDict, Field
 from typing import Optional
 from uuid import UUID
 
@@ -13,17 +13,17 @@ class RequestBase(BaseModel):
     customer_id: UUID
     
 class RequestCreate(RequestBase):
-    pass
+    category: str = Field(pattern=r"\S")
 
-class RequestUpdate(RequestBase):
+class RequestUpdate(RequestCreate):
     id : UUID 
         
 class Request(RequestBase):
     id: UUID
+    category_id: Optional[int] = None
     created_at: datetime.datetime    
     
-    class Config:
-        orm_mode = True
+    model_config = ConfigDict(from_attributes=True)
 
 
 
@@ -31,5 +31,4 @@ class RequestImageRead(BaseModel):
     id: UUID
     request_id: UUID
 
-    class Config:
-        orm_mode = True
+    model_config = ConfigDict(from_attributes=True)
@@ -16,9 +16,10 @@ class UserCreate(UserBase):
 
 class User(UserBase):
     id: UUID
-    username: str
+    # suppliers and admins are created without a surname, so without a username
+    surname: Optional[str] = None
+    username: Optional[str] = None
     status: str
     role: str
     
-    class Config:
-        orm_mode = True
\ No newline at end of file
+    model_config = ConfigDict(from_attributes=True)
\ No newline at end of file
@@ -0,0 +1,153 @@
+import re
+from typing import Optional
+
+from sqlalchemy import text
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.orm import Session
+
+from models import Product
+from pagination import decode_cursor, encode_cursor
+
+# bm25 column weights for (name, description, category) on SQLite and the
+# matching setweight classes on Postgres: a hit in the name outranks one in
+# the category, which outranks one buried in the description
+_BM25_WEIGHTS = "10.0, 1.0, 4.0"
+
+def _terms(query: str) -> list[str]:
+    return re.findall(r"\w+", query.lower())
+
+
+def _edit_distance(a: str, b: str, limit: int) -> int:
+    """
+    Optimal string alignment distance: Levenshtein plus swaps of adjacent
+    letters ("chiar" is one edit from "chair"), giving up once it is known
+    to exceed `limit`.
+    """
+    before, previous = None, list(range(len(b) + 1))
+    for i, ca in enumerate(a, 1):
+        current = [i]
+        for j, cb in enumerate(b, 1):
+            cost = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (ca != cb))
+            if before is not None and j > 1 and ca == b[j - 2] and a[i - 2] == cb:
+                cost = min(cost, before[j - 2] + 1)
+            current.append(cost)
+        # a swap reaches back two rows, so both have to be past the limit
+        if min(current) > limit and min(previous) >= limit:
+            return limit + 1
+        before, previous = previous, current
+    return previous[-1]
+
+
+def _similar_terms(db: Session, term: str) -> list[str]:
+    """
+    Indexed terms within one or two edits of `term`, counting a swap of
+    adjacent letters as one edit.
+
+    Candidates come from range scans of the FTS vocabulary on the term's
+    first and second letters, so the cost depends on the vocabulary size,
+    not the catalog. The second scan finds a stray first letter ("xchair")
+    and swapped first letters ("hcair"); a wrong or missing first letter
+    ("xhair", "hair") is not found.
+    """
+    if len(term) < 3:
+        return []
+    limit = 1 if len(term) <= 6 else 2
+    similar = []
+    for first in dict.fromkeys(term[:2]):
+        rows = db.execute(
+            text(
+                "SELECT term FROM products_fts_vocab "
+                "WHERE term >= :lo AND term < :hi AND length(term) BETWEEN :short AND :long"
+            ),
+            {"lo": first, "hi": chr(ord(first) + 1), "short": len(term) - limit, "long": len(term) + limit},
+        )
+        similar += [row.term for row in rows if _edit_distance(term, row.term, limit) <= limit]
+    return similar
+
+
+# products has a UUID primary key, so its implicit rowid is not stable (VACUUM
+# may renumber it) and cannot key the index. products_fts_keys hands every
+# product an INTEGER PRIMARY KEY, which is what products_fts rows are keyed on
+# (built by migration 0006).
+def _search_sqlite(db: Session, terms: list[str], limit: int, offset: int, fuzzy: bool) -> list[Product]:
+    groups = []
+    for term in terms:
+        alternatives = [f'"{term}"*']
+        if fuzzy:
+            alternatives += [f'"{similar}"' for similar in _similar_terms(db, term)]
+        groups.append("(" + " OR ".join(alternatives) + ")")
+    statement = text(
+        "SELECT products.* FROM products_fts "
+        "JOIN products_fts_keys ON products_fts_keys.fts_rowid = products_fts.rowid "
+        "JOIN products ON products.id = products_fts_keys.product_id "
+        "WHERE products_fts MATCH :match "
+        f"ORDER BY bm25(products_fts, {_BM25_WEIGHTS}), products.id "
+        "LIMIT :limit OFFSET :offset"
+    )
+    return (
+        db.query(Product)
+        .from_statement(statement)
+        .params(match=" AND ".join(groups), limit=limit, offset=offset)
+        .all()
+    )
+
+
+def _search_postgres(db: Session, terms: list[str], limit: int, offset: int, fuzzy: bool) -> list[Product]:
+    if fuzzy:
+        statement = text(
+            "SELECT products.* FROM products WHERE name % :query "
+            "ORDER BY similarity(name, :query) DESC, id LIMIT :limit OFFSET :offset"
+        )
+        params = {"query": " ".join(terms)}
+    else:
+        statement = text(
+            "SELECT products.* FROM products "
+            "WHERE search_vector @@ to_tsquery('simple', :tsquery) "
+            "ORDER BY ts_rank_cd(search_vector, to_tsquery('simple', :tsquery)) DESC, id "
+            "LIMIT :limit OFFSET :offset"
+        )
+        params = {"tsquery": " & ".join(f"{term}:*" for term in terms)}
+    try:
+        with db.begin_nested():
+            return (
+                db.query(Product)
+                .from_statement(statement)
+                .params(limit=limit, offset=offset, **params)
+                .all()
+            )
+    except DBAPIError:
+        if not fuzzy:
+            raise
+        # pg_trgm is not available on this database
+        return []
+
+
+def search_page(db: Session, query: str, cursor: Optional[str], limit: int) -> dict:
+    """
+    One ranked page of products matching `query`.
+
+    Every term is matched as a prefix across name, description and category.
+    When a fresh search finds nothing it is retried with typo-tolerant terms,
+    and the cursor remembers that so later pages stay on the same ranking.
+    """
+    terms = _terms(query)
+    if not terms:
+        return {"items": [], "next_cursor": None}
+
+    payload = decode_cursor(cursor) if cursor else {}
+    offset = payload.get("o", 0)
+    fuzzy = bool(payload.get("f", False))
+    if not isinstance(offset, int) or offset < 0:
+        offset = 0
+
+    run = _search_postgres if db.get_bind().dialect.name == "postgresql" else _search_sqlite
+    rows = run(db, terms, limit + 1, offset, fuzzy)
+    if not rows and not cursor:
+        fuzzy = True
+        rows = run(db, terms, limit + 1, offset, fuzzy)
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor({"o": offset + limit, "f": fuzzy})
+    return {"items": rows, "next_cursor": next_cursor}
@@ -0,0 +1,94 @@
+"""
+Daily rollups for the admin dashboards.
+
+daily_stats holds one row per (day, category) with what happened that day:
+signups, requests posted, offers made, orders placed and their value (GMV).
+Write routes bump the row for today in the same unit of work as the write,
+so dashboards read a few hundred precomputed rows instead of scanning users,
+request_posts, offers and orders.
+
+Rows count events when they happen; deleting a user or request later does
+not take them back out. `python manage.py rebuild-daily-stats` recomputes
+everything from the rows that exist now.
+
+Signups have no category and neither do requests saved without one; both
+are filed under category_id NO_CATEGORY (0).
+"""
+from collections import defaultdict
+from datetime import date, datetime, timezone
+from decimal import Decimal
+from typing import Optional
+
+from sqlalchemy import delete, func, insert, select
+
+from catalog import dialect_insert
+from models import DailyStat, Offer, Order, RequestPost, User
+
+NO_CATEGORY = 0
+COUNTERS = ("signups", "requests", "offers", "orders", "gmv")
+
+
+def today() -> date:
+    return datetime.now(timezone.utc).date()
+
+
+def record_daily(db, category_id: Optional[int] = None, day: Optional[date] = None, **increments) -> None:
+    """Add `increments` (e.g. offers=1) to the day's row for `category_id`."""
+    unknown = set(increments) - set(COUNTERS)
+    if unknown:
+        raise ValueError(f"unknown daily_stats counters: {sorted(unknown)}")
+    table = DailyStat.__table__
+    key = {"day": day or today(), "category_id": category_id or NO_CATEGORY}
+    db.execute(
+        dialect_insert(db, table)
+        .values(**key, **{name: increments.get(name, 0) for name in COUNTERS})
+        .on_conflict_do_update(
+            index_elements=[table.c.day, table.c.category_id],
+            set_={name: table.c[name] + value for name, value in increments.items()},
+        )
+    )
+
+
+def _day(column):
+    return func.date(column)
+
+
+def rebuild_daily_stats(db) -> int:
+    """
+    Replace daily_stats with totals computed from the base tables. Runs on a
+    Session or a Connection; the caller commits. Returns the number of rows.
+    """
+    totals: dict[tuple, dict] = defaultdict(lambda: dict.fromkeys(COUNTERS, 0))
+
+    def add(query):
+        for row in db.execute(query):
+            day = row.day if isinstance(row.day, date) else date.fromisoformat(str(row.day))
+            key = (day, row._mapping.get("category_id") or NO_CATEGORY)
+            for counter in COUNTERS:
+                if counter in row._fields:
+                    totals[key][counter] += row._mapping[counter] or 0
+
+    def per_day(created_at, category, *aggregates):
+        keys = [_day(created_at).label("day")] + ([category] if category is not None else [])
+        return select(*keys, *aggregates).group_by(*keys)
+
+    add(per_day(User.created_at, None, func.count().label("signups")))
+    add(per_day(RequestPost.created_at, RequestPost.category_id, func.count().label("requests")))
+    add(
+        per_day(Offer.created_at, RequestPost.category_id, func.count().label("offers"))
+        .join(RequestPost, RequestPost.id == Offer.request_id)
+    )
+    add(
+        per_day(Order.created_at, RequestPost.category_id,
+                func.count().label("orders"), func.sum(Order.total_price).label("gmv"))
+        .join(RequestPost, RequestPost.id == Order.request_id)
+    )
+
+    db.execute(delete(DailyStat))
+    rows = [
+        {"day": day, "category_id": category_id, **counters, "gmv": Decimal(str(counters["gmv"]))}
+        for (day, category_id), counters in totals.items()
+    ]
+    if rows:
+        db.execute(insert(DailyStat), rows)
+    return len(rows)
@@ -0,0 +1,131 @@
+import logging
+import multiprocessing
+import os
+import tempfile
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Optional
+
+from blob_store import BlobStore
+
+logger = logging.getLogger(__name__)
+
+IMAGE_WORKERS = int(os.getenv("IMAGE_WORKERS", "2"))
+
+# longest side in pixels for each size a client can ask for with ?size=
+VARIANT_SIZES = {"thumb": 200, "medium": 800, "full": 1600}
+# Pillow format name and MIME type for each encoding we keep
+VARIANT_FORMATS = {"webp": ("WEBP", "image/webp"), "jpeg": ("JPEG", "image/jpeg")}
+
+# marker left next to a blob whose variants could not be built (e.g. it does
+# not decode), so it is not queued again on every ?size= request; delete the
+# marker to retry
+FAILED_MARKER = "variants-failed"
+
+_pool: Optional[ProcessPoolExecutor] = None
+# digests with a job queued or running, so hot images are queued once
+_in_flight: set[str] = set()
+_in_flight_lock = threading.Lock()
+
+
+def variant_name(size: str, fmt: str) -> str:
+    return f"{size}.{fmt}"
+
+
+def _render_variants(source: str, targets: list[tuple[str, int, str]]) -> None:
+    """Runs in a worker process: resize `source` into every missing target."""
+    from PIL import Image, ImageOps
+
+    with Image.open(source) as original:
+        # phone photos are often stored sideways with an EXIF rotation flag
+        image = ImageOps.exif_transpose(original)
+        for path, max_side, pil_format in targets:
+            if os.path.exists(path):
+                continue
+            resized = image.copy()
+            resized.thumbnail((max_side, max_side), Image.LANCZOS)
+            if pil_format == "JPEG" and resized.mode not in ("RGB", "L"):
+                resized = resized.convert("RGB")
+            fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix=".variant-")
+            try:
+                with os.fdopen(fd, "wb") as tmp:
+                    resized.save(tmp, pil_format, quality=80, optimize=True)
+                os.replace(tmp_path, path)
+            except BaseException:
+                os.unlink(tmp_path)
+                raise
+
+
+def _get_pool() -> ProcessPoolExecutor:
+    global _pool
+    if _pool is None:
+        # spawn, not fork: the web worker has threads and open DB connections
+        _pool = ProcessPoolExecutor(
+            max_workers=IMAGE_WORKERS, mp_context=multiprocessing.get_context("spawn")
+        )
+    return _pool
+
+
+def _finished(store: BlobStore, digest: str, future: Future) -> None:
+    with _in_flight_lock:
+        _in_flight.discard(digest)
+    if future.cancelled():
+        return
+    error = future.exception()
+    if error is None:
+        return
+    if isinstance(error, BrokenProcessPool):
+        # the worker died, not necessarily because of this image; retry later
+        logger.warning("thumbnail generation for %s lost with its worker", digest)
+        return
+    logger.warning("thumbnail generation for %s failed, not retrying: %r", digest, error)
+    try:
+        with open(store.variant_path(digest, FAILED_MARKER), "w") as marker:
+            marker.write(f"{error!r}\n")
+    except OSError:
+        logger.warning("could not write the failure marker for %s", digest, exc_info=True)
+
+
+def schedule_variants(store: BlobStore, digest: str) -> None:
+    """
+    Queue resized copies of blob `digest` for every size and format.
+
+    Returns immediately; the work happens in a process pool so neither the
+    event loop nor the request threads pay for decoding and resizing. A blob
+    that already has a job in flight, or whose variants failed before, is
+    not queued again.
+    """
+    global _pool
+    targets = [
+        (store.variant_path(digest, variant_name(size, fmt)), max_side, pil_format)
+        for size, max_side in VARIANT_SIZES.items()
+        for fmt, (pil_format, _) in VARIANT_FORMATS.items()
+    ]
+    if all(os.path.exists(path) for path, _, _ in targets):
+        return
+    if os.path.exists(store.variant_path(digest, FAILED_MARKER)):
+        return
+    with _in_flight_lock:
+        if digest in _in_flight:
+            return
+        _in_flight.add(digest)
+    try:
+        future = _get_pool().submit(_render_variants, store.path(digest), targets)
+    except BrokenProcessPool:
+        # a worker died (e.g. OOM on a huge image); start a fresh pool next time
+        logger.warning("thumbnail pool is broken, restarting it")
+        _pool = None
+        with _in_flight_lock:
+            _in_flight.discard(digest)
+        return
+    future.add_done_callback(lambda done: _finished(store, digest, done))
+
+
+def shutdown_pool() -> None:
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
+    with _in_flight_lock:
+        _in_flight.clear()